@@ -0,0 +1,145 @@
+"""
+Fixtures shared by the benchmarks.
+
+The benchmarks need pytest-benchmark and are skipped without it. Run
+them with `tox -e benchmark`, which saves each run's results and fails
+if any benchmark got notably slower than in the previous saved run.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import time
+from argparse import Namespace
+from unittest import mock
+
+import pytest
+from PIL import Image
+from Xlib import Xatom
+
+from blurwal.__main__ import parse_args
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ['test_*.py']
+
+#: The wallpaper sizes to benchmark frame generation with
+WALLPAPER_SIZES = [(1280, 720), (1920, 1080), (3840, 2160)]
+
+#: The atoms known to the fake EWMH
+ATOMS = {'_NET_CLIENT_LIST': 1, '_NET_CURRENT_DESKTOP': 2,
+         '_NET_WM_DESKTOP': 3}
+
+
+def make_args(**overrides) -> Namespace:
+    """
+    Return the default command line arguments with the given overrides.
+    """
+    args = parse_args(['--backend', 'pillow', '--duration', '0'])
+    vars(args).update(overrides)
+    return args
+
+
+@pytest.fixture
+def make_wallpaper(mocker, tmp_path):
+    """
+    Return a function creating a wallpaper of the given size and making
+    it the original one.
+
+    The wallpaper is noise over gradients, so that it neither compresses
+    nor blurs unrealistically well.
+    """
+    def make(size):
+        path = tmp_path / 'wallpaper-{}x{}.jpg'.format(*size)
+
+        image = Image.merge('RGB', [
+            Image.effect_noise(size, 48),
+            Image.linear_gradient('L').resize(size),
+            Image.radial_gradient('L').resize(size)])
+        image.save(path, quality=90)
+
+        mocker.patch('blurwal.wallpaper.get_original', return_value=str(path))
+        return path
+
+    return make
+
+
+class LatencyEWMH:
+    """
+    An EWMH with the given number of clients spread over 4 workspaces,
+    each round-trip to its fake X server taking the given latency.
+
+    Deferred GetProperty requests are pipelined like by a real server,
+    so a batch of them costs a single round-trip for all its replies.
+    """
+
+    def __init__(self, client_count, latency):
+        self.latency = latency
+        self.round_trips = 0
+        self.clients = {i: (i % 4, f'class{i % 8}')
+                        for i in range(1, client_count + 1)}
+        self.windows = [mock.Mock(id=i) for i in self.clients]
+
+        self.display = mock.Mock()
+        self.display.intern_atom.side_effect = ATOMS.get
+        self.display.get_atom.side_effect = ATOMS.get
+        self.root = mock.Mock()
+        self.in_flight = False
+
+    def round_trip(self):
+        self.round_trips += 1
+        time.sleep(self.latency)
+
+    def getClientList(self):
+        self.round_trip()
+        return self.windows
+
+    def getCurrentDesktop(self):
+        self.round_trip()
+        return 0
+
+    def getWmDesktop(self, win):
+        self.round_trip()
+        return self.clients[win.id][0]
+
+    def get_property(self, **keys):
+        """
+        Fake a deferred GetProperty request on one of the clients.
+        """
+        self.in_flight = True
+        return LatencyPropertyRequest(self, keys['window'], keys['property'])
+
+
+class LatencyPropertyRequest:
+    """
+    A GetProperty request whose reply waits for the pending round-trip.
+    """
+
+    def __init__(self, ewmh, window_id, atom):
+        self.ewmh = ewmh
+        workspace, wm_class = ewmh.clients[window_id]
+
+        self.property_type = 1
+        self.value = (8, f'{wm_class}\0{wm_class}\0'.encode()) \
+            if atom == Xatom.WM_CLASS else (32, [workspace])
+
+    def reply(self):
+        if self.ewmh.in_flight:
+            self.ewmh.in_flight = False
+            self.ewmh.round_trip()
+
+
+@pytest.fixture
+def make_ewmh(mocker):
+    """
+    Return a function creating a LatencyEWMH whose deferred requests
+    are answered by it.
+    """
+    def make(client_count, latency):
+        ewmh = LatencyEWMH(client_count, latency)
+        mocker.patch('Xlib.protocol.request.GetProperty',
+                     side_effect=ewmh.get_property)
+        return ewmh
+
+    return make
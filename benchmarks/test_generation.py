@@ -0,0 +1,77 @@
+"""
+Benchmarks for generating and validating transition frames.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import shutil
+
+import pytest
+from PIL import Image
+from conftest import WALLPAPER_SIZES, make_args
+
+from blurwal import frame
+from blurwal.blur import Blur
+
+#: The (steps, sigma) combinations to generate transitions with
+TRANSITIONS = [(5, 10), (10, 10), (10, 40)]
+
+
+def size_id(size):
+    return '{}x{}'.format(*size)
+
+
+@pytest.mark.skipif(shutil.which('convert') is None,
+                    reason='ImageMagick is not installed')
+@pytest.mark.parametrize('size', WALLPAPER_SIZES, ids=size_id)
+@pytest.mark.parametrize('sigma', [10, 40])
+def test_generate_frame(benchmark, make_wallpaper, tmp_path, size, sigma):
+    make_wallpaper(size)
+    benchmark.pedantic(frame.generate, (tmp_path, 10, 10, sigma),
+                       rounds=3)
+
+
+@pytest.mark.parametrize('size', WALLPAPER_SIZES, ids=size_id)
+@pytest.mark.parametrize('sigma', [10, 40])
+def test_blur_image(benchmark, size, sigma):
+    image = Image.effect_noise(size, 48).convert('RGB')
+    benchmark.pedantic(frame.blur_image, (image, sigma), rounds=3)
+
+
+@pytest.mark.parametrize('size', WALLPAPER_SIZES, ids=size_id)
+@pytest.mark.parametrize('steps, sigma', TRANSITIONS)
+def test_generate_transition_frames(benchmark, mocker, make_wallpaper,
+                                    tmp_path, size, steps, sigma):
+    mocker.patch('blurwal.utils.show_notification')
+    make_wallpaper(size)
+
+    blur = Blur(make_args(steps=steps, blur=sigma, frame_dir=tmp_path))
+    benchmark.pedantic(blur.generate_transition_frames, rounds=3)
+
+
+@pytest.mark.parametrize('size', WALLPAPER_SIZES, ids=size_id)
+def test_frames_are_outdated(benchmark, mocker, make_wallpaper, tmp_path,
+                             size):
+    mocker.patch('blurwal.utils.show_notification')
+    make_wallpaper(size)
+
+    blur = Blur(make_args(frame_dir=tmp_path))
+    blur.generate_transition_frames()
+
+    assert not benchmark(blur.frames_are_outdated)
+
+
+@pytest.mark.parametrize('size', WALLPAPER_SIZES, ids=size_id)
+def test_load_keyframe_transition(benchmark, mocker, make_wallpaper,
+                                  tmp_path, size):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.paths.FRAMES_DIR', tmp_path / 'frames')
+    make_wallpaper(size)
+
+    blur = Blur(make_args(steps=60, keyframes=4, frame_dir=tmp_path))
+    blur.generate_transition_frames()
+    mocker.patch.object(blur.setter, 'load')
+
+    # Includes interpolating and encoding the 57 crossfaded frames
+    benchmark.pedantic(blur.load_frames, rounds=3)
@@ -0,0 +1,98 @@
+"""
+Benchmarks for starting blurwal, checked against fixed time budgets.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from conftest import make_args
+
+from blurwal.blur import Blur
+from blurwal.screen import Output
+
+#: The max. median time in seconds for starting a Python process that
+#: imports each module, which includes the interpreter's own startup.
+#: `blurwal ctl` only needs blurwal.__main__, the daemon blurwal.blur.
+IMPORT_BUDGETS = {'blurwal.__main__': 0.15, 'blurwal.blur': 0.5}
+
+#: The max. median time in seconds from starting the daemon's event
+#: loop until it handles window events
+READY_BUDGET = 0.1
+
+#: The time in seconds that validating the cached frames takes, which
+#: must not delay handling window events
+VALIDATION_TIME = 0.5
+
+
+@pytest.mark.parametrize('module', IMPORT_BUDGETS)
+def test_import_time(benchmark, module):
+    command = [sys.executable, '-c', f'import {module}']
+
+    benchmark.pedantic(subprocess.run, (command,), {'check': True},
+                       rounds=10, warmup_rounds=1)
+    assert benchmark.stats.stats.median < IMPORT_BUDGETS[module]
+
+
+@pytest.fixture
+def fake_display(mocker, make_ewmh, tmp_path):
+    """
+    Fake the X server, its EWMH with 100 clients and the wallpaper.
+    """
+    read_end, write_end = os.pipe()
+
+    display = mocker.patch('Xlib.display.Display').return_value
+    display.fileno.return_value = read_end
+    display.pending_events.return_value = 0
+
+    mocker.patch('ewmh.EWMH', return_value=make_ewmh(100, 0))
+    mocker.patch('blurwal.screen.get_outputs',
+                 return_value=[Output(0, 0, 1920, 1080)])
+    mocker.patch('blurwal.setter.create')
+    mocker.patch('blurwal.wallpaper.State')
+    mocker.patch('blurwal.watch.FileWatcher.is_available', return_value=False)
+    mocker.patch('blurwal.paths.CONTROL_SOCKET', tmp_path / 'control.sock')
+
+    yield display
+
+    os.close(read_end)
+    os.close(write_end)
+
+
+def test_time_to_ready(benchmark, mocker, fake_display):
+    def validate(*_):
+        time.sleep(VALIDATION_TIME)
+        return False
+
+    mocker.patch.object(Blur, 'frames_are_outdated', side_effect=validate)
+    mocker.patch.object(Blur, 'load_frames')
+
+    def start():
+        """
+        Serve until the first window events are handled.
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        blur = Blur(make_args())
+
+        serving = asyncio.ensure_future(blur.serve())
+        mocker.patch.object(blur, 'handle_x_events',
+                            side_effect=lambda _: serving.cancel())
+
+        try:
+            loop.run_until_complete(serving)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            blur.regeneration.cancel()
+            loop.run_until_complete(asyncio.wait([blur.regeneration]))
+            loop.close()
+
+    benchmark.pedantic(start, rounds=5)
+    assert benchmark.stats.stats.median < READY_BUDGET
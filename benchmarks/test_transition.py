@@ -0,0 +1,61 @@
+"""
+Benchmarks for the latency of transitions with a stubbed setter.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import asyncio
+from unittest import mock
+
+import pytest
+
+from blurwal.transition import Timing, Transition
+
+#: The numbers of steps to run transitions over
+STEPS = [10, 50]
+
+
+@pytest.fixture
+def loop():
+    """
+    A fresh event loop to run transitions on.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.mark.parametrize('is_blocking', [False, True],
+                         ids=['non-blocking', 'blocking'])
+@pytest.mark.parametrize('steps', STEPS)
+def test_transition_steps(benchmark, loop, steps, is_blocking):
+    setter = mock.Mock(is_blocking=is_blocking)
+
+    def run_transition():
+        transition = Transition(setter)
+        transition.retarget(steps)
+        loop.run_until_complete(transition.move())
+
+    benchmark(run_transition)
+    benchmark.extra_info['mean_step_latency'] = \
+        benchmark.stats.stats.mean / steps
+
+
+@pytest.mark.parametrize('steps', STEPS)
+def test_scheduled_transition_overhead(benchmark, loop, steps):
+    setter = mock.Mock(is_blocking=False)
+    timing = Timing(level_duration=0.001)
+
+    def run_transition():
+        transition = Transition(setter, timing)
+        transition.retarget(steps)
+        loop.run_until_complete(transition.move())
+        return transition.dropped_frames
+
+    dropped_frames = benchmark.pedantic(run_transition, rounds=5)
+
+    # Time beyond the scheduled duration is overhead of the engine
+    benchmark.extra_info['overhead'] = \
+        benchmark.stats.stats.mean - timing.level_duration * steps
+    benchmark.extra_info['dropped_frames'] = dropped_frames
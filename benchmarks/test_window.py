@@ -0,0 +1,60 @@
+"""
+Benchmarks for counting the windows on the current workspace.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from conftest import ATOMS
+from Xlib import X
+
+from blurwal import window
+
+#: The numbers of client windows to count
+CLIENT_COUNTS = [10, 100, 1000]
+
+#: The X server round-trip latencies in seconds (local, remote)
+LATENCIES = [0, 0.001]
+
+
+@pytest.mark.parametrize('latency', LATENCIES)
+@pytest.mark.parametrize('client_count', CLIENT_COUNTS)
+def test_count_on_current_ws(benchmark, make_ewmh, client_count, latency):
+    ewmh = make_ewmh(client_count, latency)
+
+    count = benchmark(window.count_on_current_ws, ['class0'], ewmh)
+    assert count == client_count // 4 - client_count // 8
+
+    benchmark.extra_info['round_trips'] = \
+        ewmh.round_trips // benchmark.stats.stats.rounds
+
+
+@pytest.mark.parametrize('latency', LATENCIES)
+@pytest.mark.parametrize('client_count', CLIENT_COUNTS)
+def test_window_index_rebuild(benchmark, make_ewmh, client_count, latency):
+    ewmh = make_ewmh(client_count, latency)
+    index = window.WindowIndex(['class0'], ewmh)
+
+    benchmark(index.rebuild)
+    assert index.count_on_current_ws() == \
+        client_count // 4 - client_count // 8
+
+
+@pytest.mark.parametrize('client_count', CLIENT_COUNTS)
+def test_window_index_count_after_event(benchmark, make_ewmh, client_count):
+    ewmh = make_ewmh(client_count, 0.001)
+    index = window.WindowIndex(['class0'], ewmh)
+    index.rebuild()
+
+    event = SimpleNamespace(type=X.PropertyNotify,
+                            atom=ATOMS['_NET_WM_DESKTOP'],
+                            window=ewmh.windows[0])
+
+    def count_after_event():
+        index.handle_event(event)
+        return index.count_on_current_ws()
+
+    benchmark(count_after_event)
@@ -7,13 +7,14 @@ License: MIT
 
 import argparse
 import atexit
+import json
 import logging
 import sys
+from pathlib import Path
 from typing import List
 
-from blurwal import paths, wallpaper
+from blurwal import control, paths, wallpaper
 from blurwal._version import __version__
-from blurwal.blur import Blur
 
 
 def parse_args(arg_list: List) -> argparse.Namespace:
@@ -22,15 +23,18 @@ def parse_args(arg_list: List) -> argparse.Namespace:
 
     :return: A namespace holding the parsed arguments
     """
+    from blurwal import frame
+    from blurwal.transition import EASINGS
+
     parser = argparse.ArgumentParser(
         description='Smoothly blurs the wallpaper when windows are opened.',
-        epilog="The transition's speed is based on the chosen number of "
-               "steps in combination with how quickly feh can update "
-               "the wallpaper on your system. This cannot be changed, as "
-               "feh's speed is the limiting upper factor and introducing "
-               "a delay between frames to slow things down would lead to "
-               "choppy transitions. To vary the transition speed, you "
-               "should thus change the number of steps using '-s'.")
+        epilog="A transition takes the time set with '-d', regardless of "
+               "the number of steps. If the wallpaper cannot be updated "
+               "quickly enough on your system, frames are skipped to keep "
+               "to that time. More steps thus make transitions smoother "
+               "at the cost of longer frame generation. Use '-d 0' to "
+               "show every frame as fast as possible instead. Run "
+               "'blurwal ctl -h' for controlling a running instance.")
 
     parser.add_argument('-v', '--version',
                         action='version', version=f'%(prog)s {__version__}')
@@ -45,17 +49,116 @@ def parse_args(arg_list: List) -> argparse.Namespace:
                         help='the number of steps in a blur transition, '
                              'see below (default: %(default)d, min: 2)')
 
+    parser.add_argument('-d', '--duration',
+                        type=float, metavar='SECONDS', default=0.5,
+                        help='the duration of a full transition, see below '
+                             '(default: %(default)s)')
+
+    parser.add_argument('--fps',
+                        type=float, metavar='N',
+                        help='the max. number of wallpaper updates per '
+                             'second; without a duration, the number of '
+                             'steps shown per second')
+
+    parser.add_argument('--easing',
+                        choices=EASINGS, default='linear',
+                        help='the easing curve of transitions '
+                             '(default: %(default)s)')
+
     parser.add_argument('-b', '--blur',
                         type=int, metavar='N', default=10,
                         help='the blur strength (sigma) to use when '
                              'fully blurred (default: %(default)d)')
 
+    parser.add_argument('--backend',
+                        choices=['auto', *frame.BACKENDS], default='auto',
+                        help='the blur backend for generating transition '
+                             'frames; auto prefers the in-process Pillow '
+                             'backend if installed (default: %(default)s)')
+
+    parser.add_argument('--cascade',
+                        type=int, metavar='N', nargs='?', const=1,
+                        help='derive each blur level from the previous one '
+                             'in N parallel chains instead of blurring all '
+                             'levels from the original; fewer chains mean '
+                             'less total work but less parallelism '
+                             '(default if given: %(const)d)')
+
+    parser.add_argument('--keyframes',
+                        type=int, metavar='N',
+                        help='only blur N evenly spaced keyframes and '
+                             'crossfade between them for all other steps, '
+                             'so that many steps cost little more to '
+                             'generate than N; needs Pillow')
+
+    parser.add_argument('--format',
+                        choices=['jpeg', 'raw'], default='jpeg',
+                        help='how to store transition frames; raw frames '
+                             'are stored uncompressed in the X server\'s '
+                             'pixel layout and load without decoding, but '
+                             'take up several times the space, and need '
+                             'the xroot setter and Pillow backend '
+                             '(default: %(default)s)')
+
+    parser.add_argument('--frame-dir',
+                        type=Path, metavar='DIR',
+                        help='the directory to store transition frames in, '
+                             'e.g. a tmpfs such as /dev/shm/blurwal '
+                             '(default: the cache directory)')
+
+    parser.add_argument('--cache-size',
+                        type=int, metavar='MB', default=512,
+                        help='the max. size of the frames of recently used '
+                             'wallpapers to keep, so that switching back to '
+                             'one needs no regeneration; the least recently '
+                             'used are evicted first (default: %(default)d)')
+
+    parser.add_argument('--pregenerate',
+                        type=Path, metavar='DIR',
+                        help='generate the frames of all wallpapers in this '
+                             'directory (e.g. of a slideshow) ahead of time '
+                             'at the lowest CPU and I/O priority, keeping '
+                             'them cached for when they are set; see '
+                             '--cache-size')
+
+    parser.add_argument('--pregenerate-jobs',
+                        type=int, metavar='N', default=1,
+                        help='the number of wallpapers to pre-generate '
+                             'frames for at once (default: %(default)d)')
+
+    parser.add_argument('--setter',
+                        choices=['auto', 'xroot', 'feh'], default='auto',
+                        help='how to show transition frames; xroot switches '
+                             'the root window between pixmaps uploaded to '
+                             'the X server once, feh runs feh for every '
+                             'frame, auto prefers xroot if Pillow is '
+                             'installed (default: %(default)s)')
+
     parser.add_argument('-i', '--ignore',
                         nargs='*', metavar='class', default=[],
                         help='a space-separated list of window classes '
                              'to exclude when counting the number of '
                              'open windows')
 
+    parser.add_argument('--coalesce',
+                        type=int, metavar='MS', default=0,
+                        help='the time to wait for further window events '
+                             'after one is received, so that a burst of '
+                             'them is evaluated only once; events already '
+                             'received are always coalesced '
+                             '(default: %(default)d)')
+
+    parser.add_argument('--stats',
+                        action='store_true',
+                        help='print latency metrics (event handling, window '
+                             'counting, setter steps, frame generation) on '
+                             'SIGUSR1 and on exit')
+
+    parser.add_argument('--metrics-log',
+                        type=Path, metavar='FILE',
+                        help='append every latency sample to this file as '
+                             'a line of JSON')
+
     parser.add_argument('--verbose',
                         action='store_true',
                         help='print additional information')
@@ -69,6 +172,27 @@ def parse_args(arg_list: List) -> argparse.Namespace:
     if args.steps < 2:
         parser.error('The transition must have at least 2 steps.')
 
+    if args.duration < 0:
+        parser.error('The transition duration cannot be negative.')
+
+    if args.fps is not None and args.fps <= 0:
+        parser.error('The frame rate must be positive.')
+
+    if args.coalesce < 0:
+        parser.error('The coalescing window cannot be negative.')
+
+    if args.cascade is not None and args.cascade < 1:
+        parser.error('The cascade must have at least 1 chain.')
+
+    if args.cache_size < 0:
+        parser.error('The cache size cannot be negative.')
+
+    if args.pregenerate_jobs < 1:
+        parser.error('At least 1 wallpaper must be pre-generated at once.')
+
+    if args.keyframes is not None and args.keyframes < 2:
+        parser.error('There must be at least 2 keyframes.')
+
     if args.verbose:
         logging.getLogger().setLevel(logging.INFO)
 
@@ -78,9 +202,80 @@ def parse_args(arg_list: List) -> argparse.Namespace:
     return args
 
 
+def parse_ctl_args(arg_list: List) -> argparse.Namespace:
+    """
+    Parse and return the arguments of the ctl subcommand.
+
+    :return: A namespace holding the parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='blurwal ctl',
+        description='Controls a running instance of blurwal.')
+
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    commands.add_parser('status',
+                        help='print the current blur level, window count, '
+                             'parameters, cache status and latency metrics')
+    commands.add_parser('blur',
+                        help='blur the wallpaper regardless of the number '
+                             'of windows')
+    commands.add_parser('unblur',
+                        help='unblur the wallpaper regardless of the number '
+                             'of windows')
+    commands.add_parser('auto',
+                        help='blur depending on the number of windows again')
+
+    reload = commands.add_parser(
+        'reload',
+        help='change parameters without restarting, regenerating frames '
+             'only if the number of steps or blur strength changed')
+    reload.add_argument('-s', '--steps', type=int, metavar='N')
+    reload.add_argument('-b', '--blur', type=int, metavar='N')
+    reload.add_argument('-m', '--min', type=int, metavar='N')
+    reload.add_argument('-i', '--ignore', nargs='*', metavar='class')
+
+    args = parser.parse_args(arg_list)
+
+    if args.command == 'reload':
+        if all(getattr(args, name) is None for name in control.RELOADABLE):
+            parser.error('No parameters to reload given.')
+
+        if args.steps is not None and args.steps < 2:
+            parser.error('The transition must have at least 2 steps.')
+
+    return args
+
+
+def ctl(arg_list: List) -> int:
+    """
+    Send a request to the running instance and print its result.
+
+    :return: The exit status
+    """
+    args = parse_ctl_args(arg_list)
+
+    arguments = {}
+    if args.command == 'reload':
+        arguments['parameters'] = {name: getattr(args, name)
+                                   for name in control.RELOADABLE
+                                   if getattr(args, name) is not None}
+
+    try:
+        result = control.request(args.command, paths.CONTROL_SOCKET,
+                                 **arguments)
+    except control.ControlError as error:
+        print(f'blurwal ctl: error: {error}', file=sys.stderr)
+        return 1
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
 def prepare_environment() -> None:
     """
-    Create the required cache/temp directories if not already existing
+    Create the required cache directory if not already existing
     and register an exit handler for restoring the original wallpaper.
 
     :return: None
@@ -88,7 +283,6 @@ def prepare_environment() -> None:
     logging.basicConfig(format='%(levelname)s: %(message)s')
 
     paths.CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    paths.TEMP_DIR.mkdir(exist_ok=True)
 
     atexit.register(wallpaper.restore_original)
 
@@ -97,8 +291,17 @@ def main() -> None:
     """
     Restore the wallpaper if necessary and get ready for blurring!
 
+    Alternatively, control a running instance (see ctl).
+
     :return: None
     """
+    if sys.argv[1:2] == ['ctl']:
+        sys.exit(ctl(sys.argv[2:]))
+
+    # Imported only now, as X11, asyncio and the frame generation are
+    # slow to import and not needed by ctl (see benchmarks/test_startup)
+    from blurwal.blur import Blur
+
     prepare_environment()
 
     if wallpaper.is_transition():
@@ -115,13 +318,11 @@ def main() -> None:
 
     try:
         blur = Blur(args)
-        if blur.frames_are_outdated():
-            blur.generate_transition_frames()
-
         blur.listen_for_events()
     except KeyboardInterrupt:
-        print('\nBye!')
-        sys.exit(0)
+        pass
+
+    print('\nBye!')
 
 
 if __name__ == '__main__':
@@ -4,17 +4,60 @@ License: MIT
 """
 
 import argparse
+import asyncio
 import logging
-import multiprocessing
-import re
-from typing import List, Optional, Tuple
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import ewmh
 import Xlib
+import Xlib.error
 from Xlib import X
 
-from blurwal import frame, paths, utils, wallpaper, window
-from blurwal.transition import Transition
+from blurwal import (cache, control, crossfade, frame, metrics, pack,
+                     paths, screen, setter, slideshow, store, utils,
+                     wallpaper, watch, window)
+from blurwal._version import __version__
+from blurwal.transition import (EASINGS, SETTER_EXECUTOR, Timing,
+                                Transition)
+
+#: The X events that may change the number of windows on a workspace
+WINDOW_EVENTS = (X.MapNotify, X.UnmapNotify)
+
+#: Whether each control command forces blurring, or None to follow the
+#: number of windows again (see Blur.force)
+FORCE_COMMANDS = {'blur': True, 'unblur': False, 'auto': None}
+
+#: The errors raised by X requests once the connection to the X server
+#: was lost or a request failed, after which no events may be received
+X_ERRORS = (Xlib.error.ConnectionClosedError, Xlib.error.XError)
+
+#: The signals stopping the daemon, once it has cleaned up (see Blur.stop)
+EXIT_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+def get_timing(args: argparse.Namespace) -> Timing:
+    """
+    Return the transition timing for the given command line arguments.
+
+    The duration is that of a full transition across all steps, so a
+    reversal mid-transition takes proportionally less time. Without a
+    duration, a given frame rate determines the time per step instead.
+
+    :param args: The parsed command line arguments
+    :return: The transition timing
+    """
+    if args.duration > 0:
+        level_duration = args.duration / args.steps
+    elif args.fps:
+        level_duration = 1 / args.fps
+    else:
+        level_duration = 0
+
+    return Timing(level_duration, EASINGS[args.easing], args.fps)
 
 
 class Blur:
@@ -23,10 +66,50 @@ class Blur:
     """
 
     def __init__(self, args: argparse.Namespace) -> None:
+        self.args: argparse.Namespace = args
         self.window_threshold: int = args.min
         self.transition_steps: int = args.steps
         self.max_sigma: int = args.blur
         self.ignored_classes: List[str] = args.ignore
+        self.backend: frame.Backend = frame.get_backend(args.backend)
+        self.cascade_chains: Optional[int] = args.cascade
+        self.keyframes: Optional[int] = args.keyframes
+        self.outputs: Optional[List[screen.Output]] = None
+        self.frame_format: str = args.format
+        self.set_dir: Optional[Path] = args.frame_dir
+        self.cache_size: int = args.cache_size * 1024 ** 2
+        self.raw_mode: Optional[str] = None
+        self.setter_name: str = args.setter
+        self.setter: setter.Setter = setter.FehSetter()
+        self.timing: Timing = get_timing(args)
+        self.coalesce_window: float = args.coalesce / 1000
+        self.stats: bool = args.stats
+        self.metrics_log: Optional[Path] = args.metrics_log
+        self.slideshow_dir: Optional[Path] = args.pregenerate
+        self.pregenerate_jobs: int = args.pregenerate_jobs
+        self.pregenerator: Optional[slideshow.Pregenerator] = None
+        self.control_server: Optional[asyncio.AbstractServer] = None
+        self.forced_blur: Optional[bool] = None
+        self.display: Optional[Xlib.display.Display] = None
+        self.window_index: Optional[window.WindowIndex] = None
+        self.wallpaper_state: Optional[wallpaper.State] = None
+        self.file_watcher: Optional[watch.FileWatcher] = None
+
+        if self.keyframes is not None and not crossfade.is_available():
+            logging.warning('Crossfading between keyframes needs Pillow, '
+                            'generating all frames instead.')
+            self.keyframes = None
+
+        self.transition: Transition = Transition(self.setter, self.timing)
+        self.frames: Optional[pack.Pack] = None
+        self.frame_steps: Optional[int] = None
+        self.frames_current: bool = False
+        self.pending_evaluation: Optional[asyncio.Handle] = None
+        self.event_received: Optional[float] = None
+        self.generation_lock: Optional[asyncio.Lock] = None
+        self.generation_cancelled: threading.Event = threading.Event()
+        self.regeneration: Optional[asyncio.Future] = None
+        self.stopping: Optional[asyncio.Future] = None
 
     def listen_for_events(self) -> None:
         """
@@ -50,100 +133,906 @@ class Blur:
           - is moved to a different workspace
           - is hidden by switching to a different workspace
 
+        PropertyNotify is sent when a property of the root window or of
+        a client window changes, and keeps the window index up-to-date
+        (see window.WindowIndex)
+
+        As a single workspace switch causes a burst of these events,
+        all of them are coalesced into one evaluation of the windows
+        (see drain_window_events).
+
+        Changes of the wallpaper are watched for in the same loop (see
+        handle_wallpaper_changes).
+
+        All of this is done on a single asyncio event loop multiplexing
+        the X connection, the file watcher, coalescing and transition
+        timers, as well as frame generation running in the background.
+
+        SIGINT and SIGTERM stop listening (see stop), after cancelling
+        any generation and removing the control socket.
+
         :return: None
         """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        for signum in EXIT_SIGNALS:
+            loop.add_signal_handler(signum, self.stop)
+
+        try:
+            loop.run_until_complete(self.serve())
+        finally:
+            for signum in EXIT_SIGNALS:
+                loop.remove_signal_handler(signum)
+            loop.close()
+
+    async def serve(self) -> None:
+        """
+        Connect to the X server, register all event sources with the
+        running event loop and handle their events until stopped (see
+        stop) or cancelled.
+
+        :return: None
+        :raises ConnectionClosedError: If the X connection was lost
+        """
+        loop = asyncio.get_event_loop()
+        self.stopping = loop.create_future()
+
         # Connect to X server
-        display = Xlib.display.Display()
+        display = self.display = Xlib.display.Display()
         ewmh_instance = ewmh.EWMH(display)
 
+        self.outputs = screen.get_outputs(display)
+
         root = display.screen().root
-        root.change_attributes(event_mask=X.SubstructureNotifyMask)
+        root.change_attributes(
+            event_mask=X.SubstructureNotifyMask | X.PropertyChangeMask)
+
+        self.window_index = window.WindowIndex(self.ignored_classes,
+                                               ewmh_instance)
+        self.window_index.rebuild()
+
+        self.setter = setter.create(self.setter_name, display, self.outputs)
+        self.raw_mode = self.get_raw_mode(display)
+
+        self.transition = Transition(self.setter, self.timing,
+                                     on_show=self.schedule_x_events)
+        self.transition.start()
+
+        self.wallpaper_state = wallpaper.State()
+        if watch.FileWatcher.is_available():
+            try:
+                self.file_watcher = watch.FileWatcher()
+                self.watch_wallpaper()
+            except OSError:
+                logging.warning('Cannot watch the wallpaper for changes, '
+                                'checking on window events instead.')
+                if self.file_watcher is not None:
+                    self.file_watcher.close()
+                    self.file_watcher = None
+
+        # The descriptor can't be queried once the connection is lost
+        display_fd = display.fileno()
+        loop.add_reader(display_fd, self.handle_x_events, display)
+        if self.file_watcher is not None:
+            loop.add_reader(self.file_watcher.fileno(),
+                            self.handle_wallpaper_changes)
+
+        if self.stats:
+            loop.add_signal_handler(signal.SIGUSR1, metrics.dump)
+        if self.metrics_log is not None:
+            metrics.open_log(self.metrics_log)
+
+        if self.slideshow_dir is not None:
+            self.pregenerator = slideshow.Pregenerator(
+                self.slideshow_dir, self.pregenerate_jobs,
+                self.get_pack_in_use)
+            self.pregenerator.start(self.get_generation(),
+                                    self.get_packs_dir(), self.cache_size)
+
+        try:
+            self.control_server = await control.start_server(
+                paths.CONTROL_SOCKET, self.handle_request)
+        except (control.ControlError, OSError) as error:
+            logging.warning('Cannot listen for control requests: %s', error)
+
+        # Load any cached frames in the background and only then verify
+        # them, falling back to the unblurred wallpaper meanwhile
+        self.start_regeneration(verify=False)
 
         print(':: Ready and waiting for window events...')
 
-        blur = Transition(0, 0)
-        unblur = Transition(0, 0)
+        # Handle events that were already received during setup
+        self.handle_x_events(display)
+
+        try:
+            await self.stopping
+        finally:
+            self.cancel_generation()
+            self.transition.stop()
+            loop.remove_reader(display_fd)
+            if self.file_watcher is not None:
+                loop.remove_reader(self.file_watcher.fileno())
+                self.file_watcher.close()
+                self.file_watcher = None
+            if self.pregenerator is not None:
+                self.pregenerator.stop()
+            if self.control_server is not None:
+                control.stop_server(self.control_server,
+                                    paths.CONTROL_SOCKET)
+
+            if self.stats:
+                loop.remove_signal_handler(signal.SIGUSR1)
+                metrics.dump()
+            metrics.close_log()
+
+    def stop(self, error: Optional[BaseException] = None) -> None:
+        """
+        Stop serving, cleaning up once set up if still setting up.
+
+        :param error: The error to raise from serve once cleaned up, if
+                      stopping due to one
+        :return: None
+        """
+        if self.stopping is None or self.stopping.done():
+            return
+
+        if error is None:
+            self.stopping.set_result(None)
+        else:
+            self.stopping.set_exception(error)
+
+    def handle_x_error(self, error: Exception) -> None:
+        """
+        Stop serving after the connection to the X server was lost or a
+        request failed, as the daemon would otherwise keep running
+        without receiving any events.
+
+        :param error: The error raised by python-xlib (see X_ERRORS)
+        :return: None
+        """
+        logging.error('Lost the connection to the X server: %s', error)
+        self.stop(error)
+
+    def handle_x_events(self, display) -> None:
+        """
+        Handle all pending X events and, if any of them may change the
+        number of windows on the current workspace, evaluate the window
+        count either immediately or after the coalescing window.
+
+        :param display: The X display to receive events from
+        :return: None
+        """
+        try:
+            coalesced = self.drain_window_events(display)
+        except X_ERRORS as error:
+            self.handle_x_error(error)
+            return
+
+        if not coalesced:
+            return
+
+        # Measure the latency from the first of any coalesced events
+        if self.event_received is None:
+            self.event_received = time.perf_counter()
+
+        if self.coalesce_window <= 0:
+            self.evaluate()
+        elif self.pending_evaluation is None:
+            self.pending_evaluation = asyncio.get_event_loop().call_later(
+                self.coalesce_window, self.evaluate)
+
+    def schedule_x_events(self) -> None:
+        """
+        Handle any X events soon that were received while making X
+        requests outside of handle_x_events, e.g. showing a frame or
+        counting windows.
+
+        python-xlib reads all events that arrived off the connection
+        when flushing it or waiting for a reply, and queues them. The
+        connection then no longer becomes readable for those, so they
+        would only be handled along with the next unrelated event.
+
+        :return: None
+        """
+        if self.display is not None:
+            asyncio.get_event_loop().call_soon(self.handle_x_events,
+                                               self.display)
+
+    def drain_window_events(self, display) -> int:
+        """
+        Drain all pending X events and return the number of those that
+        may change the number of windows on the current workspace (see
+        is_window_event), so that a burst of them is evaluated once.
+
+        :param display: The X display to receive events from
+        :return: The number of window events that were coalesced
+        """
+        coalesced = 0
+
+        while display.pending_events():
+            if self.is_window_event(display.next_event()):
+                coalesced += 1
+
+        if coalesced:
+            logging.debug('Coalesced %s window events.', coalesced)
+
+        return coalesced
+
+    def is_window_event(self, event) -> bool:
+        """
+        Update the window index from the given event and return whether
+        the event may change the number of windows on the workspace.
+
+        :param event: An X event
+        :return: Whether the number of windows may have changed
+        """
+        index_changed = self.window_index is not None \
+            and self.window_index.handle_event(event)
+
+        return index_changed or event.type in WINDOW_EVENTS
+
+    def evaluate(self) -> None:
+        """
+        Count the windows on the current workspace and initiate a blur
+        or unblur transition if necessary.
+
+        While no frames of the current wallpaper are ready, this falls
+        back to instantly unblurring (see fall_back) and is repeated once
+        the new frames have been swapped in.
+
+        :return: None
+        """
+        self.pending_evaluation = None
+
+        if self.file_watcher is None:
+            self.handle_wallpaper_changes()
+
+        try:
+            with metrics.timer('window_count'):
+                window_count = self.window_index.count_on_current_ws()
+        except X_ERRORS as error:
+            self.handle_x_error(error)
+            return
+
+        if self.frames_current:
+            self.init_transition(window_count)
+        else:
+            self.fall_back(window_count)
+
+        self.schedule_x_events()
+
+        if self.event_received is not None:
+            metrics.record('event_to_decision',
+                           time.perf_counter() - self.event_received)
+            self.event_received = None
+
+    def fall_back(self, window_count: int) -> None:
+        """
+        Instantly set the original wallpaper if the given number of
+        windows calls for unblurring, while no frames are ready for a
+        transition. Blurring is postponed until they are.
+
+        :param window_count: The number of open windows
+        :return: None
+        """
+        if self.wants_blur(window_count) \
+                or self.transition.current_level == 0:
+            return
+
+        logging.info('Frames are not ready, unblurring instantly.')
+        self.transition.reset(0)
+        SETTER_EXECUTOR.submit(wallpaper.change_to,
+                               self.wallpaper_state.original)
+
+    def watch_wallpaper(self) -> None:
+        """
+        Watch ~/.fehbg and the original wallpaper for changes.
+
+        :return: None
+        """
+        self.file_watcher.watch([paths.FEHBG_FILE,
+                                 Path(self.wallpaper_state.original)])
+
+    def handle_wallpaper_changes(self) -> None:
+        """
+        Check whether the wallpaper was changed externally or the
+        original wallpaper's file was modified, and if so, revalidate
+        and regenerate the transition frames in the background.
+
+        With a file watcher, this is only called once ~/.fehbg or the
+        original wallpaper changed on disk. Otherwise, it is called on
+        every evaluation of window events.
+
+        :return: None
+        """
+        changed_files = set()
+        if self.file_watcher is not None:
+            changed_files = self.file_watcher.read_changes()
+
+        self.wallpaper_state.refresh()
+        original = Path(self.wallpaper_state.original).absolute()
+
+        if self.wallpaper_state.changed_externally():
+            self.wallpaper_state.set_original(self.wallpaper_state.current)
+            if self.file_watcher is not None:
+                self.watch_wallpaper()
+
+            # The new wallpaper was set unblurred in place of any frame
+            self.transition.reset(0)
+        elif original not in changed_files:
+            return
+
+        # The frames of a wallpaper used before may still be cached, but
+        # need to be loaded in any case
+        self.cancel_generation()
+        self.frames_current = False
+        self.start_regeneration(verify=False)
+
+    def start_regeneration(self, verify: bool = True) -> None:
+        """
+        Regenerate and load the frames in the background (see
+        regenerate), failures being logged once it is done.
+
+        :param verify: Whether to verify cached frames before using them
+        :return: None
+        """
+        self.regeneration = asyncio.ensure_future(
+            self.regenerate(True, verify=verify))
+        self.regeneration.add_done_callback(self.handle_regeneration_done)
+
+    def handle_regeneration_done(self, regeneration: asyncio.Future) -> None:
+        """
+        Log the error a background regeneration failed with, if any, as
+        nothing awaits it. The unblurred wallpaper is kept as a fallback
+        until a later regeneration succeeds.
+
+        :param regeneration: The finished regeneration
+        :return: None
+        """
+        if regeneration.cancelled() or regeneration.exception() is None:
+            return
+
+        logging.error('Could not regenerate the frames.',
+                      exc_info=regeneration.exception())
+        if regeneration is self.regeneration:
+            self.frames_current = False
+
+    async def regenerate(self, reload: bool = False,
+                         verify: bool = True) -> None:
+        """
+        Validate the transition frames and regenerate them if outdated,
+        in the background while events continue to be handled.
+
+        Regenerations are run one after another, each for the wallpaper
+        and parameters current once it starts. The frames in use are
+        only replaced once a new pack is complete (see pack.write).
+        Window events received meanwhile are evaluated again once the
+        new frames are ready. A regeneration that is cancelled (see
+        cancel_generation) leaves the frames to the next one, even if
+        it already generated or loaded them for the previous wallpaper.
+
+        Verifying the checksums of all frames reads every one of them.
+        Without verify, cached frames are used as soon as they are found
+        and only verified afterwards, being regenerated if damaged.
+
+        :param reload: Whether to load the frames even if up-to-date
+        :param verify: Whether to verify cached frames before using them
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+        if self.generation_lock is None:
+            self.generation_lock = asyncio.Lock()
+
+        async with self.generation_lock:
+            cancelled = self.generation_cancelled
+            outdated = await loop.run_in_executor(
+                None, self.frames_are_outdated, verify)
+
+            if outdated:
+                # Fall back to the unblurred wallpaper until regenerated,
+                # as the frames in use may be damaged
+                self.frames_current = False
+                try:
+                    await loop.run_in_executor(
+                        None, self.generate_transition_frames, cancelled)
+                except frame.GenerationCancelled:
+                    logging.info('Frame generation was cancelled.')
+                    return
+
+                reload = True
+
+            if cancelled.is_set():
+                return
+
+            if reload:
+                await loop.run_in_executor(SETTER_EXECUTOR, self.load_frames)
+                self.schedule_x_events()
+                self.report_footprint()
+
+                # Continue from the level of the new frames closest to the
+                # one shown if the number of steps was changed (see reload)
+                if self.frame_steps not in (None, self.transition_steps):
+                    self.transition.reset(round(
+                        self.transition.current_level *
+                        self.transition_steps / self.frame_steps))
+                self.frame_steps = self.transition_steps
+
+            # The wallpaper changed while loading, so the frames shown
+            # must wait for the regeneration queued for the new one
+            if cancelled.is_set():
+                logging.info('Frames are outdated, waiting for new ones.')
+                return
 
-        while True:
-            event = display.next_event()
+            self.frames_current = True
 
-            if event.type in (X.MapNotify, X.UnmapNotify):
-                if wallpaper.changed_externally():
-                    wallpaper.set_original(wallpaper.get_current())
+        # Evaluate once this regeneration is done (see evaluate)
+        loop.call_soon(self.evaluate)
 
-                    if self.frames_are_outdated():
-                        self.generate_transition_frames()
+        if not verify and not outdated:
+            await self.regenerate()
 
-                window_count = window.count_on_current_ws(
-                    self.ignored_classes, ewmh_instance)
-                blur, unblur = self.init_transition(window_count, blur, unblur)
+    def cancel_generation(self) -> None:
+        """
+        Cancel the ongoing generation of frames, if any, as they would
+        be outdated once finished. Running convert processes or blurs
+        are stopped and the frames finished so far kept for resuming.
+
+        Regenerations waiting for their turn are not affected, as they
+        generate frames for the wallpaper current once they start.
+
+        :return: None
+        """
+        self.generation_cancelled.set()
+        self.generation_cancelled = threading.Event()
+
+    def load_frames(self) -> None:
+        """
+        Open the frame pack, extract the image frames that feh is given
+        into the frames directory (see Setter.get_file_levels) and load
+        all frames into the setter.
+
+        If only keyframes were generated, the frames of all other levels
+        are interpolated from them meanwhile (see crossfade).
+
+        The previously loaded pack is closed once replaced and the new
+        one marked as the most recently used in the cache.
+
+        :return: None
+        """
+        frames = pack.Pack(self.get_pack_path())
+        cache.touch(frames.path)
+
+        if self.keyframes is not None:
+            frames = crossfade.Interpolation(
+                frames, self.get_frame_entries(interpolated=True))
+
+        file_levels = set(self.setter.get_file_levels(self.transition_steps))
+
+        try:
+            store.extract(frames, [name for name, entry
+                                   in frames.entries.items()
+                                   if entry['encoding'] == 'jpeg'
+                                   and entry['level'] in file_levels],
+                          self.set_dir)
+            self.setter.load(frames, paths.FRAMES_DIR, self.transition_steps)
+        except BaseException:
+            frames.close()
+            raise
+
+        previous, self.frames = self.frames, frames
+        if previous is not None:
+            previous.close()
+
+    def report_footprint(self) -> None:
+        """
+        Print how much space the frames in use take up on disk (or in
+        RAM if stored on a tmpfs) and in the X server's memory.
 
-    def init_transition(self, window_count: int,
-                        blur: Optional[Transition],
-                        unblur: Optional[Transition]) -> Tuple:
+        :return: None
         """
-        Initiate a blur or unblur transition depending on the given
-        number of windows on the current workspace, and only if the
-        previously started transition was in the opposite direction.
+        footprint = self.frames.path.stat().st_size + store.get_footprint()
+        packs_dir = self.get_packs_dir()
+        cached = cache.get_packs(packs_dir)
+
+        print(f':: Frames take up {utils.format_size(footprint)} '
+              f'in {packs_dir.parent}')
+        print(f':: Cached frames of {len(cached)} wallpaper(s) take up '
+              f'{utils.format_size(cache.get_footprint(packs_dir))}')
 
-        Transitions can only be started alternately, so an unblur
-        one may only occur after a blur transition and vice versa,
-        regardless of whether the previous transition is finished.
+        if isinstance(self.setter, setter.RootPixmapSetter):
+            pixmap_size = utils.format_size(self.setter.get_footprint())
+            print(f':: Uploaded frames take up {pixmap_size} in the X server')
+
+    def init_transition(self, window_count: int) -> None:
+        """
+        Retarget the transition to the fully blurred or the unblurred
+        level depending on the given number of windows on the current
+        workspace.
+
+        A running transition in the opposite direction is reversed from
+        its current blur level, while repeated events in the direction
+        it is already heading are ignored.
 
         :param window_count: The number of open windows
-        :param blur: The previous blur transition or None
-        :param unblur: The previous unblur transition or None
-        :return: The current transition threads
+        :return: None
         """
-        # Blur
-        if window_count >= self.window_threshold and unblur is not None:
-            unblur.stop()
-            blur = Transition(unblur.current_level, self.transition_steps)
-            blur.start()
-            unblur = None
+        blur = self.wants_blur(window_count)
+        self.transition.retarget(self.transition_steps if blur else 0)
 
-        # Unblur
-        if window_count < self.window_threshold and blur is not None:
-            blur.stop()
-            unblur = Transition(blur.current_level, 0)
-            unblur.start()
-            blur = None
+    def wants_blur(self, window_count: int) -> bool:
+        """
+        Return whether the wallpaper should be blurred with the given
+        number of windows on the current workspace, unless forced either
+        way (see force).
 
-        return blur, unblur
+        :param window_count: The number of open windows
+        :return: Whether to blur the wallpaper
+        """
+        if self.forced_blur is not None:
+            return self.forced_blur
+
+        return window_count >= self.window_threshold
+
+    def handle_request(self, request: Dict) -> Dict:
+        """
+        Carry out a request received on the control socket (see control).
 
-    def frames_are_outdated(self) -> bool:
+        Commands:
+          status: Return the current state (see get_status)
+          blur, unblur: Blur or unblur regardless of the windows
+          auto: Follow the number of windows again
+          reload: Change parameters given as 'parameters' (see reload)
+
+        :param request: The request with its command and arguments
+        :return: The command's result
+        :raises ControlError: If the request is invalid
+        """
+        command = request['command']
+
+        # Counting windows or rebuilding the window index may receive
+        # X events meanwhile (see schedule_x_events)
+        try:
+            if command == 'status':
+                return self.get_status()
+
+            if command in FORCE_COMMANDS:
+                self.force(FORCE_COMMANDS[command])
+                return self.get_status()
+
+            if command == 'reload':
+                parameters = request.get('parameters')
+                if not isinstance(parameters, dict):
+                    raise control.ControlError(
+                        'No parameters to reload given.')
+                return self.reload(parameters)
+
+            raise control.ControlError(f'Unknown command: {command}')
+        finally:
+            self.schedule_x_events()
+
+    def get_status(self) -> Dict:
+        """
+        Return the current state of the daemon.
+
+        :return: The blur levels, parameters, window count, frame and
+                 cache status and latency metrics
+        """
+        packs_dir = self.get_packs_dir()
+        window_count = self.window_index.count_on_current_ws() \
+            if self.window_index is not None else None
+        original = self.wallpaper_state.original \
+            if self.wallpaper_state is not None else None
+
+        return {'version': __version__,
+                'level': self.transition.current_level,
+                'target_level': self.transition.target_level,
+                'forced': self.forced_blur,
+                'window_count': window_count,
+                'parameters': {name: getattr(self.args, name)
+                               for name in control.RELOADABLE},
+                'wallpaper': original,
+                'frames_current': self.frames_current,
+                'cache': {'wallpapers': len(cache.get_packs(packs_dir)),
+                          'size': cache.get_footprint(packs_dir),
+                          'max_size': self.cache_size},
+                'metrics': metrics.get_summary()}
+
+    def force(self, blur: Optional[bool]) -> None:
+        """
+        Blur or unblur the wallpaper regardless of the number of windows
+        from now on, or follow it again.
+
+        :param blur: Whether to blur, or None to follow the windows
+        :return: None
+        """
+        self.forced_blur = blur
+        self.evaluate()
+
+    def reload(self, parameters: Dict) -> Dict:
+        """
+        Change the given parameters while running, redoing only what
+        their new values invalidate:
+          - min: The window count is evaluated again.
+          - ignore: The window index is rebuilt.
+          - steps, blur: The frames are validated and regenerated in the
+            background, unless cached with these parameters already.
+
+        :param parameters: The parameters to change by name (see
+                           control.RELOADABLE)
+        :return: The names of the changed parameters and whether the
+                 frames are being regenerated
+        :raises ControlError: If any parameter cannot be reloaded
+        """
+        control.validate_parameters(parameters)
+        changes = {name: value for name, value in parameters.items()
+                   if getattr(self.args, name) != value}
+        vars(self.args).update(changes)
+
+        self.window_threshold = self.args.min
+        self.ignored_classes = self.args.ignore
+        if 'ignore' in changes and self.window_index is not None:
+            self.window_index.set_ignored_classes(self.ignored_classes)
+
+        regenerate = 'steps' in changes or 'blur' in changes
+        if regenerate:
+            self.transition_steps = self.args.steps
+            self.max_sigma = self.args.blur
+            self.timing = get_timing(self.args)
+            self.transition.set_timing(self.timing)
+
+            # Stop at the level shown, as the levels of a running
+            # transition may not exist in the new frames; it continues
+            # from the matching level once they are loaded (see regenerate)
+            self.transition.reset(self.transition.current_level)
+
+            # Frames cached with these parameters still need loading
+            self.cancel_generation()
+            self.frames_current = False
+            self.start_regeneration()
+
+            if self.pregenerator is not None:
+                self.pregenerator.stop()
+                self.pregenerator.start(self.get_generation(),
+                                        self.get_packs_dir(), self.cache_size)
+        elif changes:
+            self.evaluate()
+
+        logging.info('Reloaded parameters: %s', changes)
+        return {'changed': sorted(changes), 'regenerating': regenerate}
+
+    def frames_are_outdated(self, verify: bool = True) -> bool:
         """
         Check whether the transition frames need to be regenerated.
 
         This is the case if
-          a) any transition step doesn't have a corresponding frame.
-          b) the existing frame of some blur level differs from the
-             expected one, the reference being generated on-the-fly
-             from the current wallpaper.
+          a) there is no valid frame pack.
+          b) the frames were generated with different parameters.
+          c) the wallpaper's content differs from the one the frames
+             were generated from.
+          d) any frame doesn't match its checksum (if verified).
 
+        :param verify: Whether to verify every frame's checksum
         :return: Whether the transition frames need to be regenerated
         """
-        print(':: Validating transition frames... ', end='', flush=True)
-
-        found_frames = [f for f in paths.CACHE_DIR.iterdir()
-                        if f.is_file() and re.match(r'frame-\d+\.\w+', f.name)]
-        found_levels = [int(re.search(r'\d+', file.name).group(0))
-                        for file in found_frames]
-
-        if not set(range(self.transition_steps + 1)).issubset(found_levels):
-            print('\033[31mOutdated\033[0m')
-            logging.info('One or more frames are missing.')
-            return True
+        if verify:
+            print(':: Validating transition frames... ', end='', flush=True)
+        else:
+            print(':: Looking up cached frames... ', end='', flush=True)
 
-        if frame.is_outdated(1, self.transition_steps, self.max_sigma):
+        reason = self.get_outdated_reason(verify)
+        if reason:
             print('\033[31mOutdated\033[0m')
-            logging.info('Wallpaper appears to have changed.')
+            logging.info(reason)
             return True
 
         print('\033[32mUp-to-date\033[0m')
         return False
 
-    def generate_transition_frames(self) -> None:
+    def get_outdated_reason(self, verify: bool = True) -> Optional[str]:
+        """
+        Return why the transition frames are outdated, if they are.
+
+        :param verify: Whether to verify every frame's checksum
+        :return: A description of the reason or None if up-to-date
+        """
+        try:
+            source_checksum = pack.get_checksum(Path(wallpaper.get_original()))
+        except FileNotFoundError:
+            return 'Original wallpaper could not be read.'
+
+        parameters = self.get_generation_parameters()
+        found = pack.load(cache.get_pack_path(self.get_packs_dir(),
+                                              source_checksum, parameters))
+        if found is None:
+            return 'No frames of this wallpaper are cached.'
+
+        with found:
+            if found.parameters != parameters:
+                return 'Generation parameters have changed.'
+
+            if found.source != source_checksum:
+                return 'Wallpaper appears to have changed.'
+
+            if set(found.entries) != set(self.get_frame_names()) or \
+                    verify and not found.verify():
+                return 'One or more frames are missing or damaged.'
+
+        return None
+
+    def get_pack_path(self) -> Path:
+        """
+        Return the path of the frame pack for the original wallpaper's
+        current content and the generation parameters (see cache).
+
+        :return: The frame pack's path, which may not exist
+        """
+        return cache.get_pack_path(
+            self.get_packs_dir(),
+            pack.get_checksum(Path(wallpaper.get_original())),
+            self.get_generation_parameters())
+
+    def get_pack_in_use(self) -> Optional[Path]:
+        """
+        Return the path of the frame pack loaded into the setter, which
+        must not be evicted from the cache.
+
+        :return: The frame pack's path or None if none is loaded
+        """
+        return self.frames.path if self.frames is not None else None
+
+    def get_packs_dir(self) -> Path:
+        """
+        Return the directory of cached frame packs within the frame set
+        directory, if one is set, or the cache.
+
+        :return: The frame packs' directory
+        """
+        if self.set_dir is None:
+            return paths.PACKS_DIR
+
+        return self.set_dir / paths.PACKS_DIR.name
+
+    def get_generation_parameters(self) -> Dict:
+        """
+        Return all parameters affecting the generated frames' content.
+
+        :return: The generation parameters
+        """
+        sizes = [list(size) for size in self.get_frame_sizes() if size]
+
+        return {'steps': self.transition_steps,
+                'sigma': self.max_sigma,
+                'backend': self.backend.name,
+                'cascade': self.cascade_chains,
+                'keyframes': self.keyframes,
+                'sizes': sizes,
+                'format': self.raw_mode or 'jpeg',
+                'version': __version__}
+
+    def get_generation(self) -> frame.Generation:
+        """
+        Return the frames to generate for a wallpaper, which are the same
+        for any wallpaper with the current outputs and parameters.
+
+        :return: The frames to generate
+        """
+        return frame.Generation(
+            self.backend, self.get_keyframe_levels(),
+            self.get_image_levels(), self.transition_steps,
+            self.max_sigma, self.cascade_chains, self.get_frame_sizes(),
+            self.raw_mode, self.get_generation_parameters(),
+            self.get_frame_entries())
+
+    def get_frame_sizes(self) -> List[Optional[Tuple[int, int]]]:
+        """
+        Return the distinct output sizes to generate frames for, or None
+        for unscaled frames if the outputs are unknown.
+
+        :return: The sizes to generate frames for
+        """
+        return screen.get_sizes(self.outputs) if self.outputs else [None]
+
+    def get_frame_names(self) -> List[str]:
+        """
+        Return the file names of all frames to generate.
+
+        :return: The frame names
+        """
+        return [entry['name'] for entry in self.get_frame_entries()]
+
+    def get_frame_entries(self, interpolated: bool = False) -> List[Dict]:
+        """
+        Return the pack index entries of all frames to generate, or of
+        all frames to show including those interpolated from keyframes.
+
+        :param interpolated: Whether to include interpolated frames
+        :return: Each frame's name, blur level, size, sigma and encoding
+        """
+        levels = range(self.transition_steps + 1) if interpolated \
+            else self.get_keyframe_levels()
+        image_levels = [0, self.transition_steps] \
+            if self.raw_mode is not None else levels
+
+        entries = []
+
+        for size in self.get_frame_sizes():
+            if self.raw_mode is not None:
+                entries += [self.get_frame_entry(level, size, self.raw_mode)
+                            for level in levels]
+
+            entries += [self.get_frame_entry(level, size)
+                        for level in image_levels]
+
+        return entries
+
+    def get_frame_entry(self, level: int, size: Optional[Tuple[int, int]],
+                        raw_mode: Optional[str] = None) -> Dict:
+        """
+        Return the pack index entry of the given frame.
+
+        :param level: The frame's blur level
+        :param size: The output size it is scaled to or None if unscaled
+        :param raw_mode: Pillow's raw mode it is stored in or None if JPEG
+        :return: The frame's name, blur level, size, sigma and encoding
+        """
+        encoding = raw_mode.lower() if raw_mode is not None else 'jpeg'
+        extension = 'jpg' if encoding == 'jpeg' else encoding
+
+        return {'name': frame.get_frame_name(level, size, extension),
+                'level': level,
+                'size': list(size) if size else None,
+                'sigma': frame.get_sigma(level, self.transition_steps,
+                                         self.max_sigma),
+                'encoding': encoding}
+
+    def get_keyframe_levels(self) -> Sequence[int]:
+        """
+        Return the blur levels to generate frames for, which are all
+        levels unless only keyframes are generated (see crossfade).
+
+        :return: The blur levels
+        """
+        if self.keyframes is None:
+            return range(self.transition_steps + 1)
+
+        return crossfade.get_keyframe_levels(self.transition_steps,
+                                             self.keyframes)
+
+    def get_image_levels(self) -> Sequence[int]:
+        """
+        Return the blur levels to generate image frames for, which are
+        all (key)frame levels, or only those persisted by feh if raw
+        frames are generated as well.
+
+        :return: The blur levels
+        """
+        if self.raw_mode is not None:
+            return [0, self.transition_steps]
+
+        return self.get_keyframe_levels()
+
+    def get_raw_mode(self, display) -> Optional[str]:
+        """
+        Return the pixel layout to store raw frames in if raw frames are
+        requested and can be used, otherwise None for JPEG frames only.
+
+        :param display: The X display frames are shown on
+        :return: Pillow's raw mode for storing frames or None
+        """
+        if self.frame_format != 'raw':
+            return None
+
+        if not isinstance(self.setter, setter.RootPixmapSetter) or \
+                not self.backend.supports_raw:
+            logging.warning('Raw frames need the xroot setter and Pillow '
+                            'backend, storing JPEG frames instead.')
+            return None
+
+        return setter.RootPixmapSetter.get_raw_mode(display)
+
+    def generate_transition_frames(
+            self, cancelled: Optional[threading.Event] = None) -> None:
         """
         Generate frames for the transition from the original wallpaper.
 
@@ -152,20 +1041,43 @@ class Blur:
         in a smooth-ish transition. The last frame will be blurred with
         the specified maximum blur sigma.
 
+        A set of frames is generated for each distinct size of the
+        outputs, scaled and cropped to it, so that showing them
+        involves no scaling regardless of the number of outputs.
+
+        Raw frames are generated in addition to JPEG frames of the
+        first and last level, which feh persists as the wallpaper.
+
+        With keyframes, only the frames of those levels are generated
+        (see get_keyframe_levels).
+
+        The frames are generated into a partial frame set and packed
+        into a single file (see frame.generate_pack), which is then
+        atomically added to the cache, evicting the least recently used
+        packs if it grew too large. If cancelled or interrupted, the
+        generation is resumed from the frames finished so far.
+
+        :param cancelled: An event set to cancel the generation, if any
         :return: None
+        :raises GenerationCancelled: If the generation was cancelled
         """
-        logging.info('Cache path for frames: %s', paths.CACHE_DIR)
+        pack_path = self.get_pack_path()
+        pack_path.parent.mkdir(parents=True, exist_ok=True)
 
         print(':: Generating transition frames... ', end='', flush=True)
         utils.show_notification('Generating transition frames',
                                 'This may take a few seconds.')
 
-        jobs = [(paths.CACHE_DIR, level, self.transition_steps, self.max_sigma)
-                for level in range(self.transition_steps + 1)]
+        try:
+            with metrics.timer('generation'):
+                frame.generate_pack(self.get_generation(),
+                                    wallpaper.get_original(), pack_path,
+                                    self.set_dir, cancelled=cancelled)
+        except frame.GenerationCancelled:
+            print('\033[33mCancelled\033[0m')
+            raise
 
-        cpu_count = multiprocessing.cpu_count()
-        pool = multiprocessing.Pool(processes=cpu_count)
-        pool.starmap(frame.generate, jobs)
+        cache.evict(pack_path.parent, self.cache_size, keep=pack_path)
 
         print('\033[32mDone\033[0m')
         utils.show_notification('Transition frames generated',
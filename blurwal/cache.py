@@ -0,0 +1,182 @@
+"""
+A cache of frame packs for several wallpapers, kept side by side.
+
+Each pack is named after a key derived from the content hash of the
+wallpaper it was generated from and the generation parameters, so that
+switching back to a wallpaper (e.g. in a rotation) finds its frames
+without regenerating them. The least recently used packs are evicted
+once the cache exceeds a size limit. A pack's modification time serves
+as its last use, so no separate index can get out of sync with it.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+#: The file extension of cached frame packs
+PACK_SUFFIX = '.pack'
+
+
+def get_key(source_checksum: str, parameters: Dict) -> str:
+    """
+    Return the cache key of the frames of a wallpaper with the given
+    content hash generated with the given parameters.
+
+    :param source_checksum: The wallpaper's content hash
+    :param parameters: The generation parameters
+    :return: The cache key
+    """
+    key = json.dumps([source_checksum, parameters], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def get_pack_path(packs_dir: Path, source_checksum: str,
+                  parameters: Dict) -> Path:
+    """
+    Return the path of the pack holding the frames of a wallpaper with
+    the given content hash generated with the given parameters.
+
+    :param packs_dir: The directory of the cache
+    :param source_checksum: The wallpaper's content hash
+    :param parameters: The generation parameters
+    :return: The pack's path, which may not exist
+    """
+    return packs_dir / (get_key(source_checksum, parameters) + PACK_SUFFIX)
+
+
+def get_packs(packs_dir: Path) -> List[Path]:
+    """
+    Return all cached packs, the least recently used first.
+
+    :param packs_dir: The directory of the cache
+    :return: The packs' paths
+    """
+    if not packs_dir.is_dir():
+        return []
+
+    last_used: Dict[Path, float] = {}
+    for path in packs_dir.glob('*' + PACK_SUFFIX):
+        try:
+            last_used[path] = path.stat().st_mtime
+        except FileNotFoundError:
+            continue  # Evicted concurrently
+
+    return sorted(last_used, key=last_used.get)
+
+
+def get_size(path: Path) -> int:
+    """
+    Return the size of the given pack, or 0 if it was deleted already
+    (e.g. evicted concurrently).
+
+    :param path: The pack's path
+    :return: The pack's size in bytes
+    """
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def get_footprint(packs_dir: Path) -> int:
+    """
+    Return the number of bytes taken up by all cached packs.
+
+    :param packs_dir: The directory of the cache
+    :return: The cache's size in bytes
+    """
+    return sum(map(get_size, get_packs(packs_dir)))
+
+
+def touch(path: Path) -> None:
+    """
+    Mark the given pack as used just now.
+
+    :param path: The pack's path
+    :return: None
+    """
+    os.utime(str(path))
+
+
+def evict(packs_dir: Path, max_bytes: int, keep: Optional[Path]) -> None:
+    """
+    Delete the least recently used packs until the cache takes up at
+    most the given number of bytes. The given pack is never deleted,
+    even if it exceeds the limit on its own.
+
+    Only the daemon evicts packs, as it knows which one is in use.
+
+    :param packs_dir: The directory of the cache
+    :param max_bytes: The max. size of the cache in bytes
+    :param keep: The pack to keep, e.g. the one in use, if any
+    :return: None
+    """
+    packs = get_packs(packs_dir)
+    sizes = {path: get_size(path) for path in packs}
+    footprint = sum(sizes.values())
+
+    for path in packs:
+        if footprint <= max_bytes:
+            break
+
+        if path == keep:
+            continue
+
+        footprint -= sizes[path]
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue
+
+        logging.info('Evicted frame pack from the cache: %s', path)
+
+
+def is_running(pid: int) -> bool:
+    """
+    Return whether a process with the given ID is running.
+
+    :param pid: The process ID
+    :return: Whether the process is running
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def discard_temp_packs(packs_dir: Path) -> None:
+    """
+    Delete the temporary files of packs whose writing process is gone,
+    e.g. a worker terminated while writing one (see pack.write).
+
+    :param packs_dir: The directory of the cache
+    :return: None
+    """
+    if not packs_dir.is_dir():
+        return
+
+    for path in packs_dir.glob(f'*{PACK_SUFFIX}.*.tmp'):
+        try:
+            pid = int(path.suffixes[-2][1:])
+        except ValueError:
+            continue
+
+        if pid == os.getpid() or is_running(pid):
+            continue
+
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            continue
+
+        logging.info('Deleted incomplete frame pack: %s', path)
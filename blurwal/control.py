@@ -0,0 +1,215 @@
+"""
+A control interface of the running daemon on a Unix socket.
+
+Each connection sends requests as lines of JSON, for example:
+  {"command": "reload", "parameters": {"steps": 20}}
+
+and receives a line of JSON in response to each, holding either the
+command's result or why it failed:
+  {"ok": true, "result": {...}}
+  {"ok": false, "error": "..."}
+
+Requests are handled on the daemon's event loop (see
+Blur.handle_request), so they never race with window events.
+`blurwal ctl` is the client (see request), which needs none of the
+daemon's modules and imports asyncio only for type checking.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import functools
+import json
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict
+
+if TYPE_CHECKING:
+    import asyncio
+
+#: The max. time in seconds for the client to wait for a response
+TIMEOUT = 10
+
+#: Returns the result of a request or raises ControlError
+Handler = Callable[[Dict], Dict]
+
+#: The parameters that can be changed while running (see Blur.reload)
+#: by their smallest valid value, or None for a list of window classes
+RELOADABLE = {'steps': 2, 'blur': 0, 'min': 0, 'ignore': None}
+
+
+class ControlError(Exception):
+    """
+    A request that is invalid or could not be carried out.
+    """
+
+
+def validate_parameters(parameters: Dict) -> None:
+    """
+    Check that the given parameters can be reloaded with their values.
+
+    :param parameters: The parameters to reload by name
+    :return: None
+    :raises ControlError: If any of them cannot be reloaded
+    """
+    for name, value in parameters.items():
+        if name not in RELOADABLE:
+            raise ControlError(f'Cannot reload parameter: {name}')
+
+        minimum = RELOADABLE[name]
+        if minimum is None:
+            valid = isinstance(value, list) and \
+                all(isinstance(item, str) for item in value)
+        else:
+            valid = isinstance(value, int) and \
+                not isinstance(value, bool) and value >= minimum
+
+        if not valid:
+            raise ControlError(f'Invalid value for {name}: {value!r}')
+
+
+async def start_server(path: Path,
+                       handler: Handler) -> 'asyncio.AbstractServer':
+    """
+    Listen for requests on a Unix socket at the given path, handing each
+    to the given handler. Only the current user may connect.
+
+    A socket left behind by a daemon that didn't exit cleanly is
+    replaced, while one that is still in use is not.
+
+    :param path: The socket's path
+    :param handler: The handler of requests
+    :return: The server, which is serving already
+    """
+    if path.is_socket():
+        if is_listening(path):
+            raise ControlError(f'Another daemon is listening on {path}.')
+        path.unlink()
+
+    import asyncio
+
+    server = await asyncio.start_unix_server(
+        functools.partial(_handle_connection, handler), str(path))
+    os.chmod(str(path), 0o600)
+
+    return server
+
+
+def stop_server(server: 'asyncio.AbstractServer', path: Path) -> None:
+    """
+    Stop listening for requests and remove the socket.
+
+    :param server: The server returned by start_server
+    :param path: The socket's path
+    :return: None
+    """
+    server.close()
+
+    if path.is_socket():
+        path.unlink()
+
+
+def is_listening(path: Path) -> bool:
+    """
+    Return whether a daemon accepts connections on the given socket.
+
+    :param path: The socket's path
+    :return: Whether the socket is in use
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+
+    return True
+
+
+async def _handle_connection(handler: Handler,
+                             reader: 'asyncio.StreamReader',
+                             writer: 'asyncio.StreamWriter') -> None:
+    """
+    Respond to each request received on a connection until it is closed.
+
+    :param handler: The handler of requests
+    :param reader: The connection's reading end
+    :param writer: The connection's writing end
+    :return: None
+    """
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            writer.write(respond(handler, line))
+            await writer.drain()
+    except (ConnectionError, ValueError):
+        # A client went away or sent a line exceeding the buffer limit
+        pass
+    finally:
+        writer.close()
+
+
+def respond(handler: Handler, line: bytes) -> bytes:
+    """
+    Return the response to the given request.
+
+    :param handler: The handler of requests
+    :param line: A request encoded as a line of JSON
+    :return: The response encoded as a line of JSON
+    """
+    try:
+        try:
+            message = json.loads(line.decode())
+        except ValueError:
+            raise ControlError('The request is not valid JSON.')
+
+        if not isinstance(message, dict) or \
+                not isinstance(message.get('command'), str):
+            raise ControlError('The request has no command.')
+
+        response = {'ok': True, 'result': handler(message)}
+    except ControlError as error:
+        response = {'ok': False, 'error': str(error)}
+    except Exception as error:
+        logging.exception('Could not handle control request')
+        response = {'ok': False, 'error': f'Internal error: {error}'}
+
+    return (json.dumps(response) + '\n').encode()
+
+
+def request(command: str, path: Path, **arguments) -> Dict:
+    """
+    Send a request to the daemon listening on the given socket and
+    return its result.
+
+    :param command: The command to run
+    :param path: The daemon's socket
+    :param arguments: Any further arguments of the command
+    :return: The command's result
+    """
+    message = json.dumps({'command': command, **arguments}) + '\n'
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(TIMEOUT)
+            sock.connect(str(path))
+            sock.sendall(message.encode())
+
+            with sock.makefile('rb') as file:
+                line = file.readline()
+    except OSError as error:
+        raise ControlError(f'Cannot reach the daemon at {path}: {error}')
+
+    try:
+        response = json.loads(line.decode())
+    except ValueError:
+        raise ControlError('The daemon sent an invalid response.')
+
+    if not response.get('ok'):
+        raise ControlError(response.get('error', 'Unknown error.'))
+
+    return response['result']
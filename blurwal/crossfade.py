@@ -0,0 +1,236 @@
+"""
+Crossfading between blurred keyframes in place of generating every
+blur level of a transition.
+
+Only a few keyframes are blurred (see get_keyframe_levels) and packed.
+The frames of all other levels are interpolated when the frames are
+loaded, by alpha-blending the decoded buffers of the two keyframes
+around each level. The blend is a single pass over both buffers, so it
+costs a fraction of blurring the level, and smooth transitions with
+many steps take about as long to generate as the keyframes alone.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import bisect
+import io
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+from blurwal import frame
+from blurwal.pack import Pack
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+#: The Pillow mode to blend raw frames in, which preserves their bytes
+#: regardless of the channel order (e.g. BGRX or XRGB)
+RAW_BLEND_MODE = 'RGBX'
+
+#: The number of most recently blended frames to keep, so that a frame
+#: requested again shortly after is not blended again
+BLEND_CACHE_SIZE = 8
+
+
+def is_available() -> bool:
+    """
+    Return whether frames can be interpolated, which requires Pillow.
+
+    :return: Whether crossfading is available
+    """
+    return Image is not None
+
+
+def get_keyframe_levels(max_blur_level: int, keyframes: int) -> List[int]:
+    """
+    Return the given number of blur levels evenly spread over a
+    transition, always including the first and last level.
+
+    Examples:
+      >>> get_keyframe_levels(60, 4)
+      [0, 20, 40, 60]
+      >>> get_keyframe_levels(10, 4)
+      [0, 3, 7, 10]
+
+    :param max_blur_level: The max. blur level (total no. of steps)
+    :param keyframes: The number of keyframes (at least 2)
+    :return: The keyframes' blur levels in ascending order
+    """
+    keyframes = min(max(keyframes, 2), max_blur_level + 1)
+    return sorted({round(index * max_blur_level / (keyframes - 1))
+                   for index in range(keyframes)})
+
+
+def get_neighbors(level: int,
+                  keyframe_levels: Sequence[int]) -> Tuple[int, int, float]:
+    """
+    Return the keyframes around the given blur level and the weight of
+    the upper one in a blend of both.
+
+    Examples:
+      >>> get_neighbors(5, [0, 20, 40])
+      (0, 20, 0.25)
+
+    :param level: A blur level between the first and last keyframe
+    :param keyframe_levels: The keyframes' blur levels in ascending order
+    :return: The lower and upper keyframe level and the upper's weight
+    """
+    index = bisect.bisect_right(keyframe_levels, level)
+    index = min(max(index, 1), len(keyframe_levels) - 1)
+
+    lower, upper = keyframe_levels[index - 1], keyframe_levels[index]
+    return lower, upper, (level - lower) / (upper - lower)
+
+
+class Interpolation:
+    """
+    The frames of all blur levels, taken from a pack of keyframes where
+    present and otherwise interpolated on demand.
+
+    This can be used in place of the pack it wraps (see pack.Pack), so
+    that extracting frames for feh and loading them into a setter works
+    the same with or without keyframes. The frames it provides are given
+    by their index entries. Setters that need pixels rather than encoded
+    frames can skip encoding them (see get_image).
+    """
+
+    def __init__(self, frames: Pack, entries: List[Dict]) -> None:
+        self._frames = frames
+        self.path = frames.path
+        self._decoded: Dict[str, object] = {}
+        self._blended: 'OrderedDict[str, object]' = OrderedDict()
+
+        #: The keyframes' blur levels by frame size and encoding
+        self._keyframe_levels: Dict[Tuple, List[int]] = {}
+        for entry in frames.entries.values():
+            self._keyframe_levels.setdefault(self._get_group(entry), []) \
+                .append(entry['level'])
+
+        for levels in self._keyframe_levels.values():
+            levels.sort()
+
+        self.entries: Dict[str, Dict] = {entry['name']: entry
+                                         for entry in entries}
+
+    def __enter__(self) -> 'Interpolation':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    @staticmethod
+    def _get_group(entry: Dict) -> Tuple:
+        """
+        Return the key of frames that can be blended with the given one.
+
+        :param entry: A frame's index entry
+        :return: The frame's size and encoding
+        """
+        size = tuple(entry['size']) if entry['size'] else None
+        return size, entry['encoding']
+
+    def get(self, name: str) -> memoryview:
+        """
+        Return the data of the frame with the given name, blending it
+        from its neighboring keyframes if it isn't one.
+
+        :param name: The frame's name
+        :return: A view of the frame's data
+        """
+        if name in self._frames:
+            return self._frames.get(name)
+
+        entry = self.entries[name]
+        return memoryview(self._encode(self.get_image(name),
+                                       entry['encoding']))
+
+    def get_image(self, name: str):
+        """
+        Return the frame with the given name as a Pillow image, blending
+        it from its neighboring keyframes if it isn't one.
+
+        Unlike get, this doesn't encode blended frames. The image is in
+        RAW_BLEND_MODE for raw frames and in RGB for JPEG frames, and
+        must not be modified, as it may be returned again.
+
+        :param name: The frame's name
+        :return: The frame as a Pillow image
+        """
+        entry = self.entries[name]
+        if name in self._frames:
+            return self._decode(entry, entry['level'])
+
+        if name in self._blended:
+            self._blended.move_to_end(name)
+            return self._blended[name]
+
+        group = self._get_group(entry)
+        lower, upper, alpha = get_neighbors(entry['level'],
+                                            self._keyframe_levels[group])
+
+        image = Image.blend(self._decode(entry, lower),
+                            self._decode(entry, upper), alpha)
+
+        self._blended[name] = image
+        if len(self._blended) > BLEND_CACHE_SIZE:
+            self._blended.popitem(last=False)
+
+        return image
+
+    def close(self) -> None:
+        """
+        Discard the decoded keyframes and blends and close the pack.
+
+        :return: None
+        """
+        self._decoded.clear()
+        self._blended.clear()
+        self._frames.close()
+
+    def _decode(self, entry: Dict, level: int):
+        """
+        Return the decoded keyframe of the given level in the group of
+        the given entry, decoding it only once.
+
+        :param entry: The index entry of a frame in the keyframe's group
+        :param level: The keyframe's blur level
+        :return: The keyframe as a Pillow image
+        """
+        size, encoding = self._get_group(entry)
+        extension = 'jpg' if encoding == 'jpeg' else encoding
+        name = frame.get_frame_name(level, size, extension)
+
+        if name not in self._decoded:
+            with self._frames.get(name) as data:
+                if encoding == 'jpeg':
+                    with Image.open(io.BytesIO(data)) as image:
+                        decoded = image.convert('RGB')
+                else:
+                    decoded = Image.frombytes(RAW_BLEND_MODE, size,
+                                              bytes(data))
+
+            self._decoded[name] = decoded
+
+        return self._decoded[name]
+
+    @staticmethod
+    def _encode(image, encoding: str) -> bytes:
+        """
+        Encode the given blended frame like the keyframes.
+
+        :param image: The blended frame
+        :param encoding: The keyframes' encoding
+        :return: The encoded frame
+        """
+        if encoding != 'jpeg':
+            return image.tobytes('raw', RAW_BLEND_MODE)
+
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=frame.JPEG_QUALITY)
+        return buffer.getvalue()
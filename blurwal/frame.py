@@ -1,19 +1,357 @@
 """
-Transition frame generation via ImageMagick's convert utility.
+Transition frame generation using interchangeable blur backends.
+
+Every frame is written to a temporary file and renamed into place once
+complete, so a frame with its final name is never torn, even if the
+generation was cancelled or the process killed meanwhile. Frames that
+are already finished are skipped, so an unfinished generation can be
+resumed (see generate_pack).
 
 Author: Benedikt Vollmerhaus
 License: MIT
 """
 
-import filecmp
+import functools
+import logging
+import math
+import os
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import (Dict, Iterable, List, NamedTuple, Optional, Sequence,
+                    Tuple, Type)
+
+from blurwal import metrics, pack, store, utils, wallpaper
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:
+    Image = ImageFilter = ImageOps = None
+
+#: The quality to encode JPEG frames with (ImageMagick's default)
+JPEG_QUALITY = 92
+
+#: The smallest sigma to blur with on a reduced pyramid level
+PYRAMID_MIN_SIGMA = 4
+
+#: The largest factor to reduce an image by before blurring it
+PYRAMID_MAX_FACTOR = 8
+
+#: The interval in seconds to check whether a generation was cancelled
+#: at while waiting for a convert process
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class GenerationCancelled(Exception):
+    """
+    The generation of frames was cancelled before it was complete.
+    """
+
+
+def check_cancelled(cancelled: Optional[threading.Event]) -> None:
+    """
+    Stop generating frames if the given event is set.
+
+    :param cancelled: An event set to cancel the generation, if any
+    :return: None
+    :raises GenerationCancelled: If the generation was cancelled
+    """
+    if cancelled is not None and cancelled.is_set():
+        raise GenerationCancelled()
+
+
+def get_sigma(blur_level: int, max_blur_level: int, max_sigma: float) -> float:
+    """
+    Convert the given blur level to its corresponding blur sigma.
+
+    :param blur_level: A blur level to convert
+    :param max_blur_level: The max. blur level (total no. of steps)
+    :param max_sigma: The sigma to use at the maximum blur level
+
+    :return: The sigma for the given blur level
+    """
+    return utils.map_range(blur_level, (0, max_blur_level), (0, max_sigma))
+
+
+def get_cascade_sigmas(levels: List[int], max_blur_level: int,
+                       max_sigma: float) -> List[float]:
+    """
+    Return the sigmas to blur with for deriving each of the given blur
+    levels from the previous one, the first being blurred from the
+    original wallpaper.
+
+    Gaussian blurs compose, i.e. blurring with sigma a and then with
+    sigma b equals a single blur with sigma sqrt(a² + b²). So instead
+    of blurring the original with an ever-growing sigma, each level
+    only needs a small additional blur of the previous one.
+
+    Examples:
+      >>> get_cascade_sigmas([0, 1, 2], 2, 4)
+      [0.0, 2.0, 3.4641016151377544]
+
+    :param levels: Consecutive blur levels in ascending order
+    :param max_blur_level: The max. blur level (total no. of steps)
+    :param max_sigma: The sigma to use at the maximum blur level
+
+    :return: The sigma to additionally blur each level with
+    """
+    sigmas = [get_sigma(level, max_blur_level, max_sigma) for level in levels]
+    deltas = [math.sqrt(max(current ** 2 - previous ** 2, 0))
+              for previous, current in zip(sigmas, sigmas[1:])]
+
+    return sigmas[:1] + deltas
+
+
+def get_frame_name(blur_level: int, size: Optional[Tuple[int, int]] = None,
+                   extension: str = 'jpg') -> str:
+    """
+    Return the file name of the given blur level's frame, which is
+    scaled to the given output size if any.
+
+    Raw frames are named after their pixel layout (see save_frame).
+
+    Examples:
+      >>> get_frame_name(3)
+      'frame-3.jpg'
+      >>> get_frame_name(3, (1920, 1080))
+      'frame-3-1920x1080.jpg'
+      >>> get_frame_name(3, (1920, 1080), 'bgrx')
+      'frame-3-1920x1080.bgrx'
+
+    :param blur_level: A blur level
+    :param size: The output's width and height or None if unscaled
+    :param extension: The frame's file extension
+    :return: The frame's file name
+    """
+    if size is None:
+        return f'frame-{blur_level}.{extension}'
+
+    return f'frame-{blur_level}-{size[0]}x{size[1]}.{extension}'
+
+
+def get_temp_path(path: Path) -> Path:
+    """
+    Return the path to write the given frame to before renaming it into
+    place, which keeps its extension for determining the format.
+
+    Examples:
+      >>> get_temp_path(Path('frame-3-1920x1080.jpg')).name
+      'frame-3-1920x1080.tmp.jpg'
+
+    :param path: The frame's path
+    :return: The frame's temporary path
+    """
+    return path.with_name(f'{path.stem}.tmp{path.suffix}')
+
+
+def get_unfinished_levels(output_dir: Path, levels: Iterable[int],
+                          size: Optional[Tuple[int, int]] = None,
+                          extension: str = 'jpg') -> List[int]:
+    """
+    Return those of the given blur levels whose frames are not in the
+    given directory yet, e.g. from a cancelled generation.
+
+    :param output_dir: Where the frames are saved
+    :param levels: The blur levels to generate frames for
+    :param size: The output's width and height or None if unscaled
+    :param extension: The frames' file extension
+    :return: The blur levels whose frames are still missing
+    """
+    return [level for level in levels
+            if not (output_dir /
+                    get_frame_name(level, size, extension)).exists()]
+
+
+def run_convert(command: List[str],
+                cancelled: Optional[threading.Event] = None) -> int:
+    """
+    Run the given convert command, terminating it if the generation is
+    cancelled meanwhile.
+
+    :param command: The command to run
+    :param cancelled: An event set to cancel the generation, if any
+    :return: The command's exit status
+    :raises GenerationCancelled: If the generation was cancelled
+    """
+    check_cancelled(cancelled)
+    timeout = None if cancelled is None else CANCEL_POLL_INTERVAL
+
+    with subprocess.Popen(command) as process:
+        while True:
+            try:
+                return process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                if cancelled.is_set():
+                    process.terminate()
+                    raise GenerationCancelled()
+
+
+def save_frame(image, output_dir: Path, blur_level: int,
+               size: Optional[Tuple[int, int]] = None,
+               raw_mode: Optional[str] = None) -> None:
+    """
+    Save the given Pillow image as the frame of the given blur level.
+
+    Frames are encoded as JPEG, unless a raw mode is given, in which
+    case the pixels are written uncompressed in that layout (e.g. the
+    X server's BGRX), so that they can be memory-mapped and uploaded
+    without any decoding.
+
+    :param image: The image to save
+    :param output_dir: Where to save the frame
+    :param blur_level: The blur level of the frame
+    :param size: The output's width and height or None if unscaled
+    :param raw_mode: Pillow's raw mode to save pixels in or None for JPEG
+    :return: None
+    """
+    extension = 'jpg' if raw_mode is None else raw_mode.lower()
+    path = output_dir / get_frame_name(blur_level, size, extension)
+    temp_path = get_temp_path(path)
+
+    if raw_mode is None:
+        image.save(temp_path, quality=JPEG_QUALITY)
+    else:
+        temp_path.write_bytes(image.tobytes('raw', raw_mode))
+
+    os.replace(str(temp_path), str(path))
+
+
+def get_pyramid_factor(sigma: float) -> int:
+    """
+    Return the factor to reduce an image by before blurring it with the
+    given sigma and scaling it back up.
+
+    Blurring at a reduced size takes a fraction of the time, as both the
+    number of pixels and the sigma shrink, while the lost detail would
+    have been blurred away anyway. The image is only reduced as long as
+    the reduced sigma stays large enough to hide the upscaling.
+
+    Examples:
+      >>> get_pyramid_factor(3)
+      1
+      >>> get_pyramid_factor(10)
+      2
+      >>> get_pyramid_factor(40)
+      8
+
+    :param sigma: The sigma to blur with
+    :return: The power of two to reduce the image by (1 for none)
+    """
+    factor = 1
+    while factor < PYRAMID_MAX_FACTOR \
+            and sigma / (factor * 2) >= PYRAMID_MIN_SIGMA:
+        factor *= 2
+
+    return factor
+
+
+def get_fill_args(size: Optional[Tuple[int, int]]) -> List[str]:
+    """
+    Return convert's arguments for scaling and cropping an image to the
+    given output size, like feh's --bg-fill.
+
+    :param size: The output's width and height or None to keep the size
+    :return: The arguments for convert
+    """
+    if size is None:
+        return []
+
+    geometry = f'{size[0]}x{size[1]}'
+    return ['-resize', f'{geometry}^', '-gravity', 'center',
+            '-extent', geometry]
+
+
+def get_blur_args(sigma: float,
+                  size: Optional[Tuple[int, int]]) -> List[str]:
+    """
+    Return convert's arguments for blurring an image of the given size
+    with the given sigma, on a reduced pyramid level if worthwhile (see
+    get_pyramid_factor).
+
+    :param sigma: The sigma to blur with
+    :param size: The image's width and height or None if unknown, in
+                 which case it is blurred at full size
+    :return: The arguments for convert
+    """
+    if sigma <= 0:
+        return []
+
+    factor = get_pyramid_factor(sigma) if size else 1
+    if factor == 1:
+        return ['-blur', f'0x{sigma}']
+
+    width, height = size
+    return ['-scale', f'{max(width // factor, 1)}x{max(height // factor, 1)}!',
+            '-blur', f'0x{sigma / factor}',
+            '-resize', f'{width}x{height}!']
+
+
+def blur_image(image, sigma: float):
+    """
+    Blur the given Pillow image with the given sigma, on a reduced
+    pyramid level if worthwhile (see get_pyramid_factor).
+
+    :param image: The image to blur
+    :param sigma: The sigma to blur with
+    :return: The blurred image of the same size
+    """
+    if sigma <= 0:
+        return image
+
+    factor = get_pyramid_factor(sigma)
+    if factor == 1:
+        return image.filter(ImageFilter.GaussianBlur(sigma))
+
+    width, height = image.size
+    reduced = image.resize((max(width // factor, 1),
+                            max(height // factor, 1)), Image.BOX)
+    reduced = reduced.filter(ImageFilter.GaussianBlur(sigma / factor))
+    return reduced.resize(image.size, Image.BILINEAR)
 
-from blurwal import paths, utils, wallpaper
 
+def split_chains(levels: Iterable[int],
+                 chains: Optional[int] = None) -> List[List[int]]:
+    """
+    Split the given blur levels into the given number of cascades of
+    consecutive levels, each of which is generated in order, but can
+    be generated in parallel to the others.
+
+    A single chain has the least total work but is fully serial, while
+    one chain per level (the default) blurs each level independently
+    from the original. Any number in between trades one for the other.
+
+    Examples:
+      >>> split_chains(range(5), 2)
+      [[0, 1, 2], [3, 4]]
+      >>> split_chains(range(3))
+      [[0], [1], [2]]
 
-def generate(output_dir: Path, blur_level: int,
-             max_blur_level: int, max_sigma: int) -> None:
+    :param levels: The blur levels to split
+    :param chains: The number of chains or None for one per level
+
+    :return: The blur levels of each chain in ascending order
+    """
+    levels = sorted(levels)
+    if not levels:
+        return []
+
+    chains = min(chains or len(levels), len(levels))
+    size, remainder = divmod(len(levels), chains)
+
+    result, start = [], 0
+    for index in range(chains):
+        end = start + size + (1 if index < remainder else 0)
+        result.append(levels[start:end])
+        start = end
+
+    return result
+
+
+def generate(output_dir: Path, blur_level: int, max_blur_level: int,
+             max_sigma: int, size: Optional[Tuple[int, int]] = None,
+             source: Optional[str] = None,
+             cancelled: Optional[threading.Event] = None) -> None:
     """
     Generate a transition frame by applying a blur to the wallpaper.
 
@@ -40,35 +378,368 @@ def generate(output_dir: Path, blur_level: int,
 
     See also: https://www.imagemagick.org/Usage/blur/#blur_args
 
+    If an output size is given, the wallpaper is first scaled to it, so
+    that blurring costs depend on the output's resolution rather than
+    that of the wallpaper.
+
     :param output_dir: Where to save the resulting frame
     :param blur_level: A blur level to blur the wallpaper with
     :param max_blur_level: The max. blur level (total no. of steps)
     :param max_sigma: The sigma to use at the maximum blur level
+    :param size: The output's width and height or None for the
+                 wallpaper's own size
+    :param source: The image to blur or None for the original wallpaper
+    :param cancelled: An event set to cancel the generation, if any
 
     :return: None
     """
-    output_file = output_dir / f'frame-{blur_level}.jpg'
-    sigma = utils.map_range(blur_level, (0, max_blur_level), (0, max_sigma))
+    output_file = output_dir / get_frame_name(blur_level, size)
+    temp_file = get_temp_path(output_file)
+    sigma = get_sigma(blur_level, max_blur_level, max_sigma)
+
+    with metrics.timer('generation_level', level=blur_level):
+        status = run_convert(['convert', source or wallpaper.get_original(),
+                              *get_fill_args(size),
+                              *get_blur_args(sigma, size), str(temp_file)],
+                             cancelled)
 
-    subprocess.run(['convert', wallpaper.get_original(),
-                    '-blur', f'0x{sigma}', str(output_file)])
+    if status == 0:
+        os.replace(str(temp_file), str(output_file))
 
 
-def is_outdated(blur_level: int, max_blur_level: int, max_sigma: int) -> bool:
+def generate_cascade(output_dir: Path, blur_levels: List[int],
+                     max_blur_level: int, max_sigma: int,
+                     size: Optional[Tuple[int, int]] = None,
+                     source: Optional[str] = None,
+                     cancelled: Optional[threading.Event] = None) -> None:
     """
-    Blur the wallpaper with a given blur level and compare the result
-    to the already existing frame of that level. If the images differ,
-    then the wallpaper changed and the frames need to be regenerated.
+    Generate the transition frames of the given consecutive blur levels
+    using a single convert process, blurring each level incrementally
+    from the previous one (see get_cascade_sigmas).
 
-    :param blur_level: A blur level whose existing frame to validate
+    The image stays in memory between levels, so the frames written to
+    disk are only encoded once and no JPEG artifacts are accumulated.
+    They are only renamed into place once all of them are written.
+
+    :param output_dir: Where to save the resulting frames
+    :param blur_levels: Consecutive blur levels in ascending order
     :param max_blur_level: The max. blur level (total no. of steps)
     :param max_sigma: The sigma to use at the maximum blur level
+    :param size: The output's width and height or None for the
+                 wallpaper's own size
+    :param source: The image to blur or None for the original wallpaper
+    :param cancelled: An event set to cancel the generation, if any
+
+    :return: None
+    """
+    command = ['convert', source or wallpaper.get_original(),
+               *get_fill_args(size)]
+    sigmas = get_cascade_sigmas(blur_levels, max_blur_level, max_sigma)
+    output_files = [output_dir / get_frame_name(level, size)
+                    for level in blur_levels]
+
+    for output_file, sigma in zip(output_files, sigmas):
+        command += get_blur_args(sigma, size)
+        command += ['-write', str(get_temp_path(output_file))]
+
+    with metrics.timer('generation_chain', levels=len(blur_levels)):
+        status = run_convert(command + ['null:'], cancelled)
+
+    if status == 0:
+        for output_file in output_files:
+            os.replace(str(get_temp_path(output_file)), str(output_file))
+
+
+class Backend:
+    """
+    A blur engine producing the transition frames of a wallpaper.
+    """
+
+    #: The name used for selecting this backend on the command line
+    name = ''
+
+    #: Whether this backend can save uncompressed frames (see save_frame)
+    supports_raw = False
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+        Return whether this backend can be used on the current system.
+
+        :return: Whether this backend can be used
+        """
+        return True
+
+    def generate(self, output_dir: Path, levels: Iterable[int],
+                 max_blur_level: int, max_sigma: float,
+                 chains: Optional[int] = None,
+                 size: Optional[Tuple[int, int]] = None,
+                 raw_mode: Optional[str] = None,
+                 image_levels: Optional[Iterable[int]] = None,
+                 source: Optional[str] = None,
+                 cancelled: Optional[threading.Event] = None,
+                 workers: Optional[int] = None) -> None:
+        """
+        Generate the frames of the given blur levels from the original
+        wallpaper (or another image) and save them in output_dir (see
+        get_frame_name), skipping those that are already finished.
+
+        :param output_dir: Where to save the resulting frames
+        :param levels: The blur levels to generate frames for
+        :param max_blur_level: The max. blur level (total no. of steps)
+        :param max_sigma: The sigma to use at the maximum blur level
+        :param chains: The number of cascades to generate the levels in
+                       (see split_chains), or None to blur every level
+                       independently from the original
+        :param size: The output's width and height to scale the frames
+                     to, or None to keep the wallpaper's size
+        :param raw_mode: Pillow's raw mode to save uncompressed frames in
+                         (see save_frame) or None for JPEG; only if
+                         supports_raw is set
+        :param image_levels: Those of the levels to also save as JPEG
+                             from the same blurred images, if a raw
+                             mode is given
+        :param source: The image to blur or None for the original
+                       wallpaper
+        :param cancelled: An event set to cancel the generation, if any
+        :param workers: The max. number of levels or chains to generate
+                        at once, or None for one per CPU core
+
+        :return: None
+        :raises GenerationCancelled: If the generation was cancelled
+        """
+        raise NotImplementedError
+
+
+class ConvertBackend(Backend):
+    """
+    Blurs by spawning one ImageMagick convert process per blur level.
+
+    Each process decodes the original wallpaper on its own, so this is
+    considerably slower than the in-process backend, but it works with
+    nothing except ImageMagick installed.
+    """
+
+    name = 'convert'
+
+    def generate(self, output_dir: Path, levels: Iterable[int],
+                 max_blur_level: int, max_sigma: float,
+                 chains: Optional[int] = None,
+                 size: Optional[Tuple[int, int]] = None,
+                 raw_mode: Optional[str] = None,
+                 image_levels: Optional[Iterable[int]] = None,
+                 source: Optional[str] = None,
+                 cancelled: Optional[threading.Event] = None,
+                 workers: Optional[int] = None) -> None:
+        if raw_mode is not None:
+            raise ValueError('The convert backend cannot save raw frames.')
+
+        levels = get_unfinished_levels(output_dir, levels, size)
+        if not levels:
+            return
+
+        if chains is None:
+            function = generate
+            jobs = [(output_dir, level, max_blur_level, max_sigma)
+                    for level in levels]
+        else:
+            function = generate_cascade
+            jobs = [(output_dir, chain, max_blur_level, max_sigma)
+                    for chain in split_chains(levels, chains)]
+
+        if size is not None:
+            jobs = [job + (size,) for job in jobs]
 
-    :return: Whether the frame of the given blur level is outdated
+        if source is not None:
+            function = functools.partial(function, source=source)
+        if cancelled is not None:
+            function = functools.partial(function, cancelled=cancelled)
+
+        # Importing multiprocessing is slow, so it is deferred until
+        # frames actually need to be generated
+        from multiprocessing.pool import ThreadPool
+
+        # The actual work happens in the convert processes, so threads
+        # suffice for keeping one of them running per CPU core. Once
+        # cancelled, each job stops its process or doesn't start one.
+        with ThreadPool(processes=workers or os.cpu_count() or 1) as pool:
+            pool.starmap(function, jobs)
+
+
+class PillowBackend(Backend):
+    """
+    Blurs in-process using Pillow, decoding the wallpaper only once.
+
+    All blur levels are derived from the same decoded buffer, scaled to
+    the output if its size is given. Pillow releases the GIL while
+    filtering and encoding, so the levels are processed by a thread
+    pool without copying the buffer to workers.
+    """
+
+    name = 'pillow'
+    supports_raw = True
+
+    @staticmethod
+    def is_available() -> bool:
+        return Image is not None
+
+    def generate(self, output_dir: Path, levels: Iterable[int],
+                 max_blur_level: int, max_sigma: float,
+                 chains: Optional[int] = None,
+                 size: Optional[Tuple[int, int]] = None,
+                 raw_mode: Optional[str] = None,
+                 image_levels: Optional[Iterable[int]] = None,
+                 source: Optional[str] = None,
+                 cancelled: Optional[threading.Event] = None,
+                 workers: Optional[int] = None) -> None:
+        extension = 'jpg' if raw_mode is None else raw_mode.lower()
+        jpeg_levels = set(image_levels or []) if raw_mode is not None \
+            else set()
+
+        levels = sorted(
+            set(get_unfinished_levels(output_dir, levels, size, extension)) |
+            set(get_unfinished_levels(output_dir, jpeg_levels, size)))
+        if not levels:
+            return
+
+        check_cancelled(cancelled)
+        with Image.open(source or wallpaper.get_original()) as image:
+            if size is not None:
+                # Let the decoder skip detail the output can't show
+                image.draft('RGB', size)
+                original = ImageOps.fit(image.convert('RGB'), size,
+                                        Image.LANCZOS)
+            else:
+                original = image.convert('RGB')
+
+        def blur_chain(chain: List[int]) -> None:
+            image = original
+            sigmas = get_cascade_sigmas(chain, max_blur_level, max_sigma)
+
+            for level, sigma in zip(chain, sigmas):
+                check_cancelled(cancelled)
+                with metrics.timer('generation_level', level=level):
+                    image = blur_image(image, sigma)
+                    save_frame(image, output_dir, level, size, raw_mode)
+                    if level in jpeg_levels:
+                        save_frame(image, output_dir, level, size)
+
+        workers = workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(blur_chain, split_chains(levels, chains)))
+
+
+#: All blur backends by name, in order of preference
+BACKENDS: Dict[str, Type[Backend]] = {
+    PillowBackend.name: PillowBackend,
+    ConvertBackend.name: ConvertBackend,
+}
+
+
+def get_backend(name: Optional[str] = None) -> Backend:
+    """
+    Return an instance of the blur backend with the given name, or of
+    the most preferable available one if no (or 'auto') name is given.
+
+    :param name: The name of a backend, 'auto' or None
+    :return: An instance of the requested blur backend
+    """
+    if name and name != 'auto':
+        return BACKENDS[name]()
+
+    for backend in BACKENDS.values():
+        if backend.is_available():
+            logging.info("Using blur backend '%s'.", backend.name)
+            return backend()
+
+    return ConvertBackend()
+
+
+class Generation(NamedTuple):
     """
-    generate(paths.TEMP_DIR, blur_level, max_blur_level, max_sigma)
+    The frames to generate for a wallpaper, as configured, which can be
+    handed to another process (see slideshow).
+    """
+
+    #: The blur backend to generate frames with
+    backend: Backend
+
+    #: The blur levels to generate frames for
+    levels: Sequence[int]
+
+    #: The blur levels to generate JPEG frames for in addition to raw
+    #: frames (a subset of levels), or the same levels if only JPEG
+    #: frames are generated
+    image_levels: Sequence[int]
+
+    #: The max. blur level (total no. of steps)
+    max_blur_level: int
+
+    #: The sigma to use at the maximum blur level
+    max_sigma: float
+
+    #: The number of cascades to generate the levels in (see split_chains)
+    chains: Optional[int]
+
+    #: The output sizes to scale frames to, or None for unscaled frames
+    sizes: List[Optional[Tuple[int, int]]]
+
+    #: Pillow's raw mode to store frames in or None for JPEG only
+    raw_mode: Optional[str]
+
+    #: All parameters affecting the frames' content
+    parameters: Dict
+
+    #: The pack index entries of all frames
+    entries: List[Dict]
+
+    #: The max. number of levels or chains to generate at once, or None
+    #: for one per CPU core (see Backend.generate)
+    workers: Optional[int] = None
+
+
+def generate_pack(generation: Generation, source: str, pack_path: Path,
+                  set_dir: Optional[Path] = None,
+                  prefix: str = store.PARTIAL_PREFIX,
+                  cancelled: Optional[threading.Event] = None) -> None:
+    """
+    Generate the frames of the given image into a partial frame set and
+    pack them into a single file (see pack.write).
+
+    The partial set is named after the pack, so if the generation is
+    cancelled or interrupted, the frames finished so far are reused by
+    the next generation of the same pack, i.e. from the same image with
+    the same parameters (see store.create_partial). It is discarded
+    once the pack is written.
+
+    :param generation: The frames to generate
+    :param source: The image to generate frames from
+    :param pack_path: The pack file to write
+    :param set_dir: The directory to keep the partial set in or None
+                    for the cache directory
+    :param prefix: The partial set's name prefix (see store)
+    :param cancelled: An event set to cancel the generation, if any
+    :return: None
+    :raises GenerationCancelled: If the generation was cancelled
+    """
+    store.discard_stale(set_dir, prefix)
+    staging_dir = store.create_partial(pack_path.stem, set_dir, prefix)
+
+    if any(staging_dir.iterdir()):
+        logging.info('Resuming generation of frames in: %s', staging_dir)
+    else:
+        logging.info('Generating frames in: %s', staging_dir)
 
-    reference_frame = paths.TEMP_DIR / f'frame-{blur_level}.jpg'
-    actual_frame = paths.CACHE_DIR / f'frame-{blur_level}.jpg'
+    for size in generation.sizes:
+        # Frames to be set by feh are always needed as images, which are
+        # saved along with the raw frames of the same blurred images
+        generation.backend.generate(
+            staging_dir, generation.levels, generation.max_blur_level,
+            generation.max_sigma, generation.chains, size,
+            generation.raw_mode, generation.image_levels, source=source,
+            cancelled=cancelled, workers=generation.workers)
 
-    return not filecmp.cmp(reference_frame, actual_frame)
+    pack.write(pack_path, source, generation.parameters,
+               [(staging_dir / entry['name'], entry)
+                for entry in generation.entries])
+    store.discard(staging_dir)
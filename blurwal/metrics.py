@@ -0,0 +1,218 @@
+"""
+Runtime latency metrics, kept as rolling histograms of recent samples.
+
+Durations are recorded from the event loop as well as from generation
+and setter threads. A summary of them can be printed at any time (see
+dump), e.g. on SIGUSR1, and each sample can additionally be appended
+to a JSON-lines log (see open_log) for analysis elsewhere.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import json
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, Optional, TextIO
+
+#: The number of most recent samples each histogram keeps
+SAMPLES = 1000
+
+#: The percentiles to summarize histograms by
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram:
+    """
+    The distribution of the most recent samples of a duration.
+    """
+
+    def __init__(self, size: int = SAMPLES) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.count: int = 0
+
+    def add(self, value: float) -> None:
+        """
+        Add a sample, dropping the oldest one if the histogram is full.
+
+        :param value: The sample to add
+        :return: None
+        """
+        self._samples.append(value)
+        self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        """
+        Return the given percentile of the kept samples (nearest rank).
+
+        Examples:
+          >>> histogram = Histogram()
+          >>> histogram.add(0.1); histogram.add(0.3); histogram.add(0.2)
+          >>> histogram.percentile(50)
+          0.2
+
+        :param percent: The percentile in [0, 100]
+        :return: The sample at the percentile or 0 without any samples
+        """
+        if not self._samples:
+            return 0
+
+        ordered = sorted(self._samples)
+        rank = max(1, -(-len(ordered) * percent // 100))
+        return ordered[int(rank) - 1]
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Return the total count and statistics of the kept samples.
+
+        :return: The count, mean, percentiles and maximum
+        """
+        samples = list(self._samples)
+        summary = {'count': self.count,
+                   'mean': sum(samples) / len(samples) if samples else 0}
+
+        for percent in PERCENTILES:
+            summary[f'p{percent}'] = self.percentile(percent)
+
+        summary['max'] = max(samples, default=0)
+        return summary
+
+
+_lock = threading.Lock()
+_histograms: Dict[str, Histogram] = {}
+_counters: Counter = Counter()
+_log: Optional[TextIO] = None
+
+
+def record(name: str, seconds: float, **fields) -> None:
+    """
+    Record a sample of the named duration.
+
+    :param name: The name of the duration
+    :param seconds: The sample in seconds
+    :param fields: Additional fields for the log entry, e.g. a level
+    :return: None
+    """
+    with _lock:
+        _histograms.setdefault(name, Histogram()).add(seconds)
+        _write(name, seconds, fields)
+
+
+def count(name: str, amount: int = 1) -> None:
+    """
+    Increase the named counter.
+
+    :param name: The name of the counter
+    :param amount: The amount to increase it by
+    :return: None
+    """
+    if not amount:
+        return
+
+    with _lock:
+        _counters[name] += amount
+        _write(name, amount, {})
+
+
+@contextmanager
+def timer(name: str, **fields) -> Iterator[None]:
+    """
+    Record the duration of the enclosed block, unless it raises.
+
+    :param name: The name of the duration
+    :param fields: Additional fields for the log entry
+    :return: A context manager timing its block
+    """
+    start = time.perf_counter()
+    yield
+    record(name, time.perf_counter() - start, **fields)
+
+
+def get_summary() -> Dict[str, Dict]:
+    """
+    Return the summaries of all histograms and the counters' values.
+
+    :return: The histogram summaries and counters by name
+    """
+    with _lock:
+        return {'histograms': {name: histogram.summary() for name, histogram
+                               in sorted(_histograms.items())},
+                'counters': dict(sorted(_counters.items()))}
+
+
+def dump() -> None:
+    """
+    Print a summary of all metrics, with durations in milliseconds.
+
+    :return: None
+    """
+    summary = get_summary()
+    print(':: Latency metrics (ms)')
+
+    for name, stats in summary['histograms'].items():
+        values = ' '.join(f'{key}={value * 1000:.2f}'
+                          for key, value in stats.items() if key != 'count')
+        print(f'   {name}: n={stats["count"]} {values}')
+
+    for name, value in summary['counters'].items():
+        print(f'   {name}: {value}')
+
+
+def open_log(path: Path) -> None:
+    """
+    Append each sample recorded from now on to the given JSON-lines log.
+
+    :param path: The log file
+    :return: None
+    """
+    global _log
+
+    with _lock:
+        if _log is not None:
+            _log.close()
+        _log = open(path, 'a')
+
+
+def close_log() -> None:
+    """
+    Stop logging samples.
+
+    :return: None
+    """
+    global _log
+
+    with _lock:
+        if _log is not None:
+            _log.close()
+            _log = None
+
+
+def reset() -> None:
+    """
+    Discard all samples and counters.
+
+    :return: None
+    """
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _write(name: str, value: float, fields: Dict) -> None:
+    """
+    Append a sample to the log if one is open. Must hold _lock.
+
+    :param name: The name of the metric
+    :param value: The sample
+    :param fields: Additional fields for the entry
+    :return: None
+    """
+    if _log is None:
+        return
+
+    entry = {'time': time.time(), 'metric': name, 'value': value, **fields}
+    _log.write(json.dumps(entry) + '\n')
+    _log.flush()
@@ -0,0 +1,224 @@
+"""
+Single-file frame packs holding all frames of a wallpaper.
+
+A pack starts with a fixed header locating its index, followed by the
+frames' data, each entry aligned to a page, and the index itself. The
+index is JSON recording a content hash of the wallpaper the frames
+were generated from, the parameters they were generated with and each
+frame's name, blur level, output size, sigma, encoding, offset, length
+and checksum. Frames are up-to-date as long as all of these match.
+
+Packs are written to a temporary file and atomically renamed into
+place, so readers only ever see a complete pack. Reading one takes a
+single open and mmap, after which frames are sliced out of the map.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+#: The magic bytes identifying a frame pack
+MAGIC = b'BLURPACK'
+
+#: The version of the pack format
+VERSION = 1
+
+#: The pack header (magic, version, index offset, index length)
+HEADER = struct.Struct('<8sIQQ')
+
+#: The alignment of each frame's data within the pack
+ALIGNMENT = mmap.PAGESIZE
+
+#: The number of bytes to read at once when hashing files
+CHUNK_SIZE = 1 << 20
+
+
+class PackError(ValueError):
+    """
+    Raised if a file is not a valid frame pack.
+    """
+
+
+def get_checksum(path: Path) -> str:
+    """
+    Return the SHA-256 hex digest of the given file's contents.
+
+    :param path: The file to hash
+    :return: The file's content hash
+    """
+    checksum = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+def write(path: Path, source: str, parameters: Dict,
+          frames: Iterable[Tuple[Path, Dict]]) -> None:
+    """
+    Atomically write a pack of the given frames that were generated
+    from the given source with the given parameters.
+
+    :param path: The pack file to write
+    :param source: The wallpaper the frames were generated from
+    :param parameters: The parameters the frames were generated with
+    :param frames: Each frame's file and its index entry (name, level,
+                   size, sigma and encoding)
+    :return: None
+    """
+    # Other processes may write the same pack meanwhile (see slideshow)
+    temp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    entries: List[Dict] = []
+
+    with open(temp_path, 'wb') as file:
+        file.write(b'\0' * HEADER.size)
+
+        for frame_path, entry in frames:
+            offset = _align(file)
+            data = frame_path.read_bytes()
+            file.write(data)
+
+            entries.append(dict(entry, offset=offset, length=len(data),
+                                checksum=hashlib.sha256(data).hexdigest()))
+
+        index = json.dumps({'source': get_checksum(Path(source)),
+                            'parameters': parameters,
+                            'frames': entries}).encode()
+        index_offset = file.tell()
+        file.write(index)
+
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, index_offset, len(index)))
+
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(str(temp_path), str(path))
+
+
+def _align(file) -> int:
+    """
+    Pad the given file to the next multiple of ALIGNMENT.
+
+    :param file: The file being written
+    :return: The aligned offset
+    """
+    offset = file.tell()
+    padding = -offset % ALIGNMENT
+    file.write(b'\0' * padding)
+
+    return offset + padding
+
+
+class Pack:
+    """
+    A memory-mapped frame pack whose frames are read without copying.
+    """
+
+    def __init__(self, path: Path) -> None:
+        with open(path, 'rb') as file:
+            try:
+                self._data = mmap.mmap(file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                raise PackError(f'Not a frame pack: {path}')
+
+        try:
+            self._index = self._read_index()
+        except PackError:
+            self._data.close()
+            raise
+
+        self.path: Path = path
+        self.source: str = self._index['source']
+        self.parameters: Dict = self._index['parameters']
+        self.entries: Dict[str, Dict] = {entry['name']: entry
+                                         for entry in self._index['frames']}
+
+    def _read_index(self) -> Dict:
+        """
+        Read and validate the pack's header and index.
+
+        :return: The index
+        """
+        if len(self._data) < HEADER.size:
+            raise PackError('Frame pack is truncated.')
+
+        magic, version, offset, length = HEADER.unpack_from(self._data)
+        if magic != MAGIC or version != VERSION:
+            raise PackError('Not a frame pack of a supported version.')
+
+        if offset + length > len(self._data):
+            raise PackError('Frame pack is truncated.')
+
+        try:
+            return json.loads(self._data[offset:offset + length].decode())
+        except ValueError:
+            raise PackError('Frame pack index is malformed.')
+
+    def __enter__(self) -> 'Pack':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def get(self, name: str) -> memoryview:
+        """
+        Return the data of the frame with the given name.
+
+        :param name: The frame's name
+        :return: A view of the frame's data within the map
+        """
+        entry = self.entries[name]
+        return memoryview(self._data)[entry['offset']:
+                                      entry['offset'] + entry['length']]
+
+    def verify(self) -> bool:
+        """
+        Check whether all frames still have their recorded checksums.
+
+        :return: Whether all frames are intact
+        """
+        for name, entry in self.entries.items():
+            with self.get(name) as data:
+                if hashlib.sha256(data).hexdigest() != entry['checksum']:
+                    return False
+
+        return True
+
+    def close(self) -> None:
+        """
+        Unmap the pack.
+
+        :return: None
+        """
+        self._data.close()
+
+
+def load(path: Path) -> Optional[Pack]:
+    """
+    Open the given pack file.
+
+    :param path: The pack file
+    :return: The pack or None if it is missing or invalid
+    """
+    try:
+        return Pack(path)
+    except FileNotFoundError:
+        return None
+    except PackError as error:
+        logging.warning('Ignoring invalid frame pack %s: %s', path, error)
+        return None
@@ -5,17 +5,22 @@ Author: Benedikt Vollmerhaus
 License: MIT
 """
 
-import tempfile
 from pathlib import Path
 
 #: The cache directory to save transition frames in
 CACHE_DIR = Path.home() / '.cache/blurwal'
 
-#: The temporary directory to save comparison frames in
-TEMP_DIR = Path(tempfile.gettempdir()) / 'blurwal'
-
 #: The flat file for storing the original wallpaper's path
 ORIGINAL_PATH = CACHE_DIR / 'original-path'
 
+#: The directory of the frame packs of recently used wallpapers
+PACKS_DIR = CACHE_DIR / 'packs'
+
+#: The link to the directory of the frames extracted for feh
+FRAMES_DIR = CACHE_DIR / 'frames'
+
+#: The Unix socket the running daemon accepts control requests on
+CONTROL_SOCKET = CACHE_DIR / 'control.sock'
+
 #: feh's background setter script with the current wallpaper
 FEHBG_FILE = Path.home() / '.fehbg'
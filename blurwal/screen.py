@@ -0,0 +1,93 @@
+"""
+Functions for querying the geometry of the outputs (monitors) that
+the X screen spans.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import logging
+from typing import List, NamedTuple, Tuple
+
+
+class Output(NamedTuple):
+    """
+    The area of the X screen shown on one output.
+    """
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """
+        Return the output's width and height.
+
+        :return: The output's size
+        """
+        return self.width, self.height
+
+
+def get_outputs(display) -> List[Output]:
+    """
+    Return the outputs of the given display's screen in Xinerama order,
+    which is the order feh assigns wallpapers to them in.
+
+    The geometry is taken from Xinerama if active, otherwise from the
+    enabled RandR CRTCs. Without either, the whole screen is treated as
+    a single output.
+
+    :param display: The X display to query
+    :return: The outputs of the screen
+    """
+    if display.has_extension('XINERAMA') and display.xinerama_is_active():
+        outputs = [Output(s.x, s.y, s.width, s.height)
+                   for s in display.xinerama_query_screens().screens]
+    elif display.has_extension('RANDR'):
+        outputs = _get_crtc_outputs(display)
+    else:
+        outputs = []
+
+    if not outputs:
+        screen = display.screen()
+        outputs = [Output(0, 0, screen.width_in_pixels,
+                          screen.height_in_pixels)]
+
+    logging.info('Found outputs: %s', ', '.join(
+        f'{o.width}x{o.height}+{o.x}+{o.y}' for o in outputs))
+    return outputs
+
+
+def get_sizes(outputs: List[Output]) -> List[Tuple[int, int]]:
+    """
+    Return the distinct sizes of the given outputs, so that outputs of
+    the same size can share their frames.
+
+    Examples:
+      >>> get_sizes([Output(0, 0, 800, 600), Output(800, 0, 800, 600)])
+      [(800, 600)]
+
+    :param outputs: The outputs
+    :return: The distinct sizes in ascending order
+    """
+    return sorted({output.size for output in outputs})
+
+
+def _get_crtc_outputs(display) -> List[Output]:
+    """
+    Return the geometry of all enabled RandR CRTCs.
+
+    :param display: The X display to query
+    :return: The outputs of the screen
+    """
+    resources = display.screen().root.xrandr_get_screen_resources()
+    outputs = []
+
+    for crtc in resources.crtcs:
+        info = display.xrandr_get_crtc_info(crtc, resources.config_timestamp)
+        if info.mode and info.width and info.height:
+            outputs.append(Output(info.x, info.y, info.width, info.height))
+
+    return outputs
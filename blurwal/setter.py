@@ -0,0 +1,397 @@
+"""
+Wallpaper setters for showing transition frames.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import io
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import Xlib.display
+from Xlib import X, Xatom
+
+from blurwal import frame, paths, wallpaper
+from blurwal.crossfade import Interpolation
+from blurwal.pack import Pack
+from blurwal.screen import Output
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+
+class Setter:
+    """
+    Shows the frames of a transition as the wallpaper.
+    """
+
+    #: The name used for selecting this setter on the command line
+    name = ''
+
+    #: Whether showing a frame takes long enough to block an event loop
+    is_blocking = True
+
+    #: The outputs to show frames on, or None for unscaled frames
+    outputs: Optional[List[Output]] = None
+
+    def load(self, frames: Pack, frame_dir: Path,
+             max_blur_level: int) -> None:
+        """
+        Prepare the frames of all blur levels for display.
+
+        This is called once after the frames have been (re)generated,
+        off the event loop, so it may take a while.
+
+        :param frames: The pack containing the frames
+        :param frame_dir: The directory the frames were extracted to
+        :param max_blur_level: The max. blur level (total no. of steps)
+        :return: None
+        """
+        self.frame_dir = frame_dir
+
+    def show(self, level: int) -> None:
+        """
+        Show the frame of the given blur level as the wallpaper.
+
+        :param level: The blur level to show
+        :return: None
+        """
+        raise NotImplementedError
+
+    def get_file_levels(self, max_blur_level: int) -> Sequence[int]:
+        """
+        Return the blur levels whose frames are read from frame_dir, so
+        that only those need to be extracted from the pack.
+
+        :param max_blur_level: The max. blur level (total no. of steps)
+        :return: The blur levels needed as files
+        """
+        return range(max_blur_level + 1)
+
+    def persist(self, level: int) -> None:
+        """
+        Make the frame of the given blur level the persistent wallpaper
+        once a transition has finished on it.
+
+        :param level: The blur level to persist
+        :return: None
+        """
+
+    def get_frame_names(self, level: int) -> List[str]:
+        """
+        Return the names of the given blur level's frame for each output.
+
+        :param level: A blur level
+        :return: The frames' names in the order of the outputs
+        """
+        if not self.outputs:
+            return [frame.get_frame_name(level)]
+
+        return [frame.get_frame_name(level, output.size)
+                for output in self.outputs]
+
+    def get_frames(self, level: int) -> List[Path]:
+        """
+        Return the paths of the given blur level's frame for each output.
+
+        :param level: A blur level
+        :return: The frames' paths in the order of the outputs
+        """
+        return [self.frame_dir / name for name in self.get_frame_names(level)]
+
+
+class FehSetter(Setter):
+    """
+    Sets each frame by running feh, which persists it in ~/.fehbg.
+
+    With multiple outputs, feh is given the frame scaled to each of them,
+    so that it doesn't need to rescale a single frame for every output.
+    """
+
+    name = 'feh'
+
+    def __init__(self, frame_dir: Optional[Path] = None,
+                 outputs: Optional[List[Output]] = None) -> None:
+        self.frame_dir = frame_dir or paths.FRAMES_DIR
+        self.outputs = outputs
+
+    def show(self, level: int) -> None:
+        wallpaper.change_to(*map(str, self.get_frames(level)))
+
+
+class RootPixmapSetter(Setter):
+    """
+    Sets frames by switching the X root window's background between
+    pixmaps, each frame being uploaded to the X server only once.
+
+    Showing a frame merely updates the _XROOTPMAP_ID property read by
+    compositors and pseudo-transparent programs and clears the root
+    window, so it takes about a millisecond instead of a process launch,
+    regardless of the number of outputs.
+
+    ESETROOT_PMAP_ID is left to feh: setters kill the client owning the
+    pixmap it names once both properties match, which would be blurwal's
+    own connection, and feh's retained pixmap would never be freed.
+
+    On loading, the frames of each output are composed into a single
+    pixmap spanning the screen. Frames generated for an output's size
+    are used as-is, any others are scaled and cropped like feh's
+    --bg-fill. Raw frames in the server's pixel layout are memory-mapped
+    and sent straight from the pack without decoding.
+
+    Frames are uploaded on a separate connection if given, as loading
+    runs on the setter's thread while the event loop keeps using the
+    display, and python-xlib connections must not be shared by threads.
+
+    The pixmaps are freed along with the connection, so the final frame
+    of a transition is persisted by feh (see persist).
+    """
+
+    name = 'xroot'
+    is_blocking = False
+
+    def __init__(self, display, outputs: Optional[List[Output]] = None,
+                 upload_display=None) -> None:
+        self.frame_dir = None
+        self.outputs = outputs
+
+        self._display = display
+        self._screen = display.screen()
+        self._root = self._screen.root
+        self._upload_display = upload_display or display
+        self._pixmaps: Dict[int, object] = {}
+
+        self._root_pmap_atom = display.intern_atom('_XROOTPMAP_ID')
+
+    @staticmethod
+    def get_raw_mode(display) -> Optional[str]:
+        """
+        Return Pillow's raw mode matching the root window's pixel layout
+        or None if the layout is not supported (i.e. not 24-bit color
+        stored in 32 bits per pixel).
+
+        :param display: The X display to check
+        :return: Pillow's raw mode for encoding frames or None
+        """
+        screen = display.screen()
+
+        formats = [f for f in display.info.pixmap_formats
+                   if f.depth == screen.root_depth]
+        if screen.root_depth not in (24, 32) or \
+                not formats or formats[0].bits_per_pixel != 32:
+            return None
+
+        visuals = [v for d in screen.allowed_depths for v in d.visuals
+                   if v.visual_id == screen.root_visual]
+        if not visuals or (visuals[0].red_mask, visuals[0].green_mask,
+                           visuals[0].blue_mask) != (0xff0000, 0xff00, 0xff):
+            return None
+
+        return 'BGRX' if display.info.image_byte_order == X.LSBFirst \
+            else 'XRGB'
+
+    @classmethod
+    def is_supported(cls, display) -> bool:
+        """
+        Return whether frames can be set on the given display's root.
+
+        :param display: The X display to check
+        :return: Whether this setter can be used
+        """
+        return Image is not None and cls.get_raw_mode(display) is not None
+
+    def load(self, frames: Pack, frame_dir: Path,
+             max_blur_level: int) -> None:
+        # Upload the new frames before freeing the previous ones, so
+        # that those remain usable until the new ones are ready
+        pixmaps = {level: self._upload(frames, level)
+                   for level in range(max_blur_level + 1)}
+
+        self.free()
+        self._pixmaps = pixmaps
+        self.frame_dir = frame_dir
+
+        # Wait for the pixmaps to exist before the display refers to them
+        self._upload_display.sync()
+        logging.info('Uploaded %s frames to the X server.', len(self._pixmaps))
+
+    def show(self, level: int) -> None:
+        # Levels beyond those loaded, e.g. of frames with more steps,
+        # are clamped to the most blurred frame
+        pixmap = self._pixmaps.get(min(level, max(self._pixmaps, default=0)))
+        if pixmap is None:
+            logging.warning('No frame is loaded to show blur level %s.',
+                            level)
+            return
+
+        self._root.change_property(self._root_pmap_atom, Xatom.PIXMAP, 32,
+                                   [pixmap.id])
+
+        self._root.change_attributes(background_pixmap=pixmap)
+        self._root.clear_area()
+        self._display.flush()
+
+    def persist(self, level: int) -> None:
+        wallpaper.change_to(*map(str, self.get_frames(level)))
+
+    def get_file_levels(self, max_blur_level: int) -> Sequence[int]:
+        # Transitions only ever end on either level (see persist)
+        return [0, max_blur_level]
+
+    def get_footprint(self) -> int:
+        """
+        Return the number of bytes the uploaded frames take up in the
+        X server's memory.
+
+        :return: The size of all pixmaps in bytes
+        """
+        screen_bytes = self._screen.width_in_pixels * \
+            self._screen.height_in_pixels * 4
+        return len(self._pixmaps) * screen_bytes
+
+    def free(self) -> None:
+        """
+        Free all previously uploaded frames on the X server.
+
+        :return: None
+        """
+        for pixmap in self._pixmaps.values():
+            pixmap.free()
+
+        self._pixmaps.clear()
+
+    def get_outputs(self) -> List[Output]:
+        """
+        Return the outputs to compose frames for, or the whole screen as
+        a single output if none are known.
+
+        :return: The outputs
+        """
+        return self.outputs or [Output(0, 0, self._screen.width_in_pixels,
+                                       self._screen.height_in_pixels)]
+
+    def _upload(self, frames: Pack, level: int):
+        """
+        Upload the given blur level's frames to a new pixmap, composing
+        them at the position of their output.
+
+        :param frames: The pack containing the frames
+        :param level: The blur level to upload
+        :return: The pixmap holding the frames
+        """
+        screen = self._upload_display.screen()
+        width = screen.width_in_pixels
+        height = screen.height_in_pixels
+        depth = screen.root_depth
+
+        pixmap = screen.root.create_pixmap(width, height, depth)
+        gc = pixmap.create_gc(foreground=screen.black_pixel)
+
+        outputs = self.get_outputs()
+        if len(outputs) > 1:
+            # Clear any areas of the screen not covered by an output
+            pixmap.fill_rectangle(gc, 0, 0, width, height)
+
+        for output, name in zip(outputs, self.get_frame_names(level)):
+            self._put_frame(pixmap, gc, output, frames, name)
+
+        gc.free()
+        return pixmap
+
+    def _put_frame(self, pixmap, gc, output: Output, frames: Pack,
+                   name: str) -> None:
+        """
+        Put the given frame onto the pixmap at the output's position,
+        preferring its raw version if one was generated.
+
+        :param pixmap: The pixmap to draw on
+        :param gc: The graphics context to draw with
+        :param output: The output to show the frame on
+        :param frames: The pack containing the frame
+        :param name: The name of the frame to draw
+        :return: None
+        """
+        raw_mode = self.get_raw_mode(self._upload_display)
+        raw_name = str(Path(name).with_suffix('.' + raw_mode.lower()))
+
+        if raw_name in frames:
+            with frames.get(raw_name) as data:
+                if len(data) != output.width * output.height * 4:
+                    raise ValueError(f'Raw frame does not match the size '
+                                     f'of its output: {raw_name}')
+
+                self._put_data(pixmap, gc, output, data)
+            return
+
+        if isinstance(frames, Interpolation):
+            # Blended frames are used without encoding them as JPEG
+            image = frames.get_image(name)
+        else:
+            with frames.get(name) as data, \
+                    Image.open(io.BytesIO(data)) as image:
+                image = image.convert('RGB')
+
+        if image.size != output.size:
+            image = ImageOps.fit(image, output.size, Image.LANCZOS)
+
+        self._put_data(pixmap, gc, output, image.tobytes('raw', raw_mode))
+
+    def _put_data(self, pixmap, gc, output: Output, data) -> None:
+        """
+        Put the given pixel data onto the pixmap at the output's position.
+
+        :param pixmap: The pixmap to draw on
+        :param gc: The graphics context to draw with
+        :param output: The output the data is sized for
+        :param data: The pixels in the server's layout (bytes or a view)
+        :return: None
+        """
+        depth = self._upload_display.screen().root_depth
+
+        # Split the image into requests below the server's size limit
+        # (given in units of 4 bytes, minus the PutImage header)
+        stride = output.width * 4
+        max_bytes = self._upload_display.info.max_request_length * 4 - 28
+        rows = max(1, max_bytes // stride)
+
+        for y in range(0, output.height, rows):
+            chunk_height = min(rows, output.height - y)
+            chunk = data[y * stride:(y + chunk_height) * stride]
+            pixmap.put_image(gc, output.x, output.y + y, output.width,
+                             chunk_height, X.ZPixmap, depth, 0, bytes(chunk))
+
+
+def create(name: str, display,
+           outputs: Optional[List[Output]] = None) -> Setter:
+    """
+    Return the setter with the given name for the given display, or
+    the root pixmap setter if supported and 'auto' is given. feh is
+    used instead of an unsupported root pixmap setter.
+
+    :param name: The name of a setter or 'auto'
+    :param display: The X display to set frames on
+    :param outputs: The outputs to show frames on, or None for
+                    unscaled frames
+    :return: The setter
+    """
+    if name == 'auto':
+        name = RootPixmapSetter.name \
+            if RootPixmapSetter.is_supported(display) else FehSetter.name
+    elif name == RootPixmapSetter.name and \
+            not RootPixmapSetter.is_supported(display):
+        logging.warning('The xroot setter needs Pillow and a 24-bit '
+                        'TrueColor display, using feh instead.')
+        name = FehSetter.name
+
+    logging.info("Using wallpaper setter '%s'.", name)
+
+    if name == RootPixmapSetter.name:
+        return RootPixmapSetter(
+            display, outputs,
+            Xlib.display.Display(display.get_display_name()))
+
+    return FehSetter(outputs=outputs)
@@ -0,0 +1,267 @@
+"""
+Pre-generation of the frames of all wallpapers in a slideshow directory.
+
+When wallpapers are rotated from a directory, the frames of each new
+wallpaper would otherwise only be generated once it is set, using all
+cores right when the user is working. Instead, the directory is watched
+and frames are generated ahead of time for any image whose frames are
+not cached yet (see cache), so that a rotation only needs to load them.
+
+This happens in a small pool of worker processes at the lowest CPU and
+I/O priority, so that pre-generation only uses otherwise idle resources
+and never holds up the event loop.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import subprocess
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set
+
+from blurwal import cache, frame, pack, watch
+
+#: The file extensions of images to pre-generate frames for
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+
+#: The niceness of worker processes (the lowest CPU priority)
+NICENESS = 19
+
+#: The name prefix of the partial frame sets of worker processes, which
+#: keeps them apart from the main process's (see store.create_partial)
+STAGING_PREFIX = 'pregen-'
+
+
+def is_image(path: Path) -> bool:
+    """
+    Return whether the given file is an image, judging by its extension.
+
+    :param path: A file's path
+    :return: Whether the file is an image
+    """
+    return path.suffix.lower() in IMAGE_SUFFIXES
+
+
+def get_images(directory: Path) -> List[Path]:
+    """
+    Return the images in the given directory, sorted by name.
+
+    :param directory: A wallpaper directory
+    :return: The images' paths
+    """
+    if not directory.is_dir():
+        return []
+
+    return sorted(path for path in directory.iterdir()
+                  if is_image(path) and path.is_file())
+
+
+def lower_priority() -> None:
+    """
+    Lower the CPU and I/O priority of the current process to the lowest
+    (idle) level, which also applies to any processes it spawns.
+
+    :return: None
+    """
+    os.setpriority(os.PRIO_PROCESS, 0, NICENESS)
+
+    try:
+        subprocess.run(['ionice', '-c', '3', '-p', str(os.getpid())],
+                       check=True)
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        logging.info('ionice not available, pre-generating frames at the '
+                     'default I/O priority.')
+
+
+def pregenerate(generation: frame.Generation, source: str,
+                packs_dir: Path) -> bool:
+    """
+    Generate the frames of the given image into the cache unless they
+    are cached already. Run in a worker process.
+
+    The cache is not evicted here, but by the daemon once the frames are
+    added (see Pregenerator), as only it knows which pack is in use.
+    Levels are generated one at a time, so that the number of worker
+    processes limits how many cores are used.
+
+    :param generation: The frames to generate
+    :param source: The image to generate frames from
+    :param packs_dir: The directory of the cache
+    :return: Whether frames were generated
+    """
+    pack_path = cache.get_pack_path(packs_dir,
+                                    pack.get_checksum(Path(source)),
+                                    generation.parameters)
+    if pack_path.exists():
+        return False
+
+    packs_dir.mkdir(parents=True, exist_ok=True)
+    frame.generate_pack(generation._replace(workers=1), source, pack_path,
+                        packs_dir.parent, STAGING_PREFIX)
+    return True
+
+
+class Pregenerator:
+    """
+    Watches a wallpaper directory and pre-generates the frames of its
+    images in a pool of low-priority worker processes.
+
+    All images are checked once started, and afterwards only those
+    added or modified. Each image is only queued once at a time, and
+    read when its turn comes, so it is generated from its latest content.
+
+    The cache is evicted after each added pack, keeping the pack in use
+    by the daemon as returned by get_pack_in_use.
+    """
+
+    def __init__(self, directory: Path, jobs: int = 1,
+                 get_pack_in_use: Optional[Callable[[], Optional[Path]]]
+                 = None) -> None:
+        self.directory: Path = directory.absolute()
+        self.jobs: int = jobs
+        self.get_pack_in_use: Callable[[], Optional[Path]] = \
+            get_pack_in_use or (lambda: None)
+        self.pool = None
+        self.file_watcher: Optional[watch.FileWatcher] = None
+        self.pending: Set[Path] = set()
+
+        self.generation: Optional[frame.Generation] = None
+        self.packs_dir: Optional[Path] = None
+        self.max_bytes: int = 0
+
+    def start(self, generation: frame.Generation, packs_dir: Path,
+              max_bytes: int) -> None:
+        """
+        Start the worker processes and queue all images not cached yet,
+        watching the directory for further ones if possible.
+
+        Must be called from the running event loop.
+
+        :param generation: The frames to generate for each image
+        :param packs_dir: The directory of the cache
+        :param max_bytes: The max. size of the cache in bytes
+        :return: None
+        """
+        self.generation = generation
+        self.packs_dir = packs_dir
+        self.max_bytes = max_bytes
+        cache.discard_temp_packs(packs_dir)
+
+        # Only imported when pre-generating, as it is slow to import
+        import multiprocessing
+
+        # Forking a process with running threads may copy locks held by
+        # them, so workers are started afresh instead
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(self.jobs, initializer=lower_priority)
+
+        if watch.FileWatcher.is_available():
+            try:
+                self.file_watcher = watch.FileWatcher()
+                self.file_watcher.watch([], [self.directory])
+                asyncio.get_event_loop().add_reader(
+                    self.file_watcher.fileno(), self.handle_changes)
+            except OSError:
+                self.file_watcher = None
+
+        if self.file_watcher is None:
+            logging.warning('Cannot watch %s for new wallpapers, only '
+                            'pre-generating frames for existing ones.',
+                            self.directory)
+
+        print(f':: Pre-generating frames for wallpapers in {self.directory}')
+        self.schedule(get_images(self.directory))
+
+    def stop(self) -> None:
+        """
+        Stop watching the directory and terminate the worker processes.
+        The frames they finished are reused once their images are queued
+        again (see frame.generate_pack), while packs they were writing
+        are deleted.
+
+        :return: None
+        """
+        if self.file_watcher is not None:
+            asyncio.get_event_loop().remove_reader(self.file_watcher.fileno())
+            self.file_watcher.close()
+            self.file_watcher = None
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+        if self.packs_dir is not None:
+            cache.discard_temp_packs(self.packs_dir)
+
+        self.pending.clear()
+
+    def handle_changes(self) -> None:
+        """
+        Queue the images in the directory that were added or modified.
+
+        :return: None
+        """
+        self.schedule(path for path in self.file_watcher.read_changes()
+                      if is_image(path) and path.is_file())
+
+    def schedule(self, images: Iterable[Path]) -> None:
+        """
+        Queue the given images for pre-generation, unless already queued.
+
+        :param images: The images to generate frames for
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+
+        for image in images:
+            if image in self.pending:
+                continue
+
+            self.pending.add(image)
+            self.pool.apply_async(
+                pregenerate,
+                (self.generation, str(image), self.packs_dir),
+                callback=functools.partial(self._report, loop, image),
+                error_callback=functools.partial(self._report, loop, image,
+                                                 None))
+
+    def _report(self, loop: asyncio.AbstractEventLoop, image: Path,
+                generated: Optional[bool],
+                error: Optional[BaseException] = None) -> None:
+        """
+        Hand the result of pre-generating the frames of an image over to
+        the event loop. Called from the pool's result handler thread.
+
+        :param loop: The event loop to handle the result on
+        :param image: The image
+        :param generated: Whether frames were generated or None on error
+        :param error: The error the generation failed with, if it did
+        :return: None
+        """
+        loop.call_soon_threadsafe(self.finish, image, generated, error)
+
+    def finish(self, image: Path, generated: Optional[bool],
+               error: Optional[BaseException] = None) -> None:
+        """
+        Handle the result of pre-generating the frames of an image and
+        evict the cache if they were added to it.
+
+        :param image: The image
+        :param generated: Whether frames were generated or None on error
+        :param error: The error the generation failed with, if it did
+        :return: None
+        """
+        self.pending.discard(image)
+
+        if error is not None:
+            logging.warning('Could not pre-generate frames for %s: %s',
+                            image, error)
+        elif generated:
+            logging.info('Pre-generated frames for: %s', image)
+            cache.evict(self.packs_dir, self.max_bytes,
+                        keep=self.get_pack_in_use())
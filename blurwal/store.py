@@ -0,0 +1,208 @@
+"""
+Storage of frame sets as loose files, swapping in new ones atomically.
+
+Frames are generated into a fresh staging directory within the cache
+(or another directory, e.g. on a tmpfs) before being packed (see pack),
+and those that feh needs as files are extracted from the pack into one
+as well. Once complete, the symbolic link paths.FRAMES_DIR is atomically
+replaced to point to the extracted set, so feh is never given frames
+that are half-written or mixed from two different sets.
+
+Generations that were cancelled or interrupted leave their finished
+frames in a partial set named after the pack being generated, so that
+the next generation of the same pack can resume (see create_partial).
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from blurwal import paths
+
+#: The name prefix of frame set directories in the cache
+SET_PREFIX = 'frames-'
+
+#: The name prefix of partial frame sets of unfinished generations
+PARTIAL_PREFIX = 'partial-'
+
+#: The time in seconds after which an untouched partial set is discarded
+PARTIAL_MAX_AGE = 24 * 60 * 60
+
+
+def create_staging(set_dir: Optional[Path] = None,
+                   prefix: str = SET_PREFIX) -> Path:
+    """
+    Create a new, empty directory to generate a frame set in.
+
+    Only directories with the default prefix are discarded once another
+    frame set is activated (see activate), so frames generated by other
+    processes meanwhile need a different one.
+
+    :param set_dir: The directory to keep frame sets in or None for the
+                    cache directory
+    :param prefix: The directory's name prefix
+    :return: The staging directory
+    """
+    set_dir = set_dir or paths.CACHE_DIR
+    set_dir.mkdir(parents=True, exist_ok=True)
+
+    return Path(tempfile.mkdtemp(prefix=prefix, dir=str(set_dir)))
+
+
+def create_partial(key: str, set_dir: Optional[Path] = None,
+                   prefix: str = PARTIAL_PREFIX) -> Path:
+    """
+    Return the directory to generate the frame set with the given key
+    in, keeping any frames a previous generation of it left behind.
+
+    Unlike staging directories, these are named after their content,
+    so a generation that was cancelled or interrupted can be resumed.
+    Partial sets not touched for PARTIAL_MAX_AGE are discarded (see
+    discard_stale).
+
+    :param key: The frame set's key, e.g. its pack's (see cache.get_key)
+    :param set_dir: The directory to keep frame sets in or None for the
+                    cache directory
+    :param prefix: The directory's name prefix
+    :return: The partial set's directory
+    """
+    set_dir = set_dir or paths.CACHE_DIR
+    partial_dir = set_dir / (prefix + key)
+    partial_dir.mkdir(parents=True, exist_ok=True)
+
+    # Mark it as in use again, so that it isn't discarded as stale
+    os.utime(str(partial_dir))
+    return partial_dir
+
+
+def discard_stale(set_dir: Optional[Path] = None,
+                  prefix: str = PARTIAL_PREFIX,
+                  max_age: float = PARTIAL_MAX_AGE) -> None:
+    """
+    Discard the partial sets that were not touched for the given time,
+    e.g. those of wallpapers that are no longer used.
+
+    :param set_dir: The directory to keep frame sets in or None for the
+                    cache directory
+    :param prefix: The partial sets' name prefix
+    :param max_age: The time in seconds to keep untouched partial sets
+    :return: None
+    """
+    set_dir = set_dir or paths.CACHE_DIR
+    oldest = time.time() - max_age
+
+    for partial_dir in set_dir.glob(prefix + '*'):
+        try:
+            if partial_dir.stat().st_mtime < oldest:
+                discard(partial_dir)
+        except FileNotFoundError:
+            # Discarded by another process meanwhile
+            pass
+
+
+def get_active(frames_dir: Optional[Path] = None) -> Optional[Path]:
+    """
+    Return the directory of the frame set currently in use.
+
+    :param frames_dir: The frame set link or None for the default
+    :return: The active frame set's directory or None if there is none
+    """
+    frames_dir = frames_dir or paths.FRAMES_DIR
+
+    if not frames_dir.is_symlink():
+        return None
+
+    # Relative for sets in the cache, absolute for those elsewhere
+    return frames_dir.parent / os.readlink(str(frames_dir))
+
+
+def activate(staging_dir: Path, frames_dir: Optional[Path] = None) -> None:
+    """
+    Atomically make the given staging directory the active frame set
+    and discard all other frame sets, including the previous one.
+
+    :param staging_dir: The directory of the completed frame set
+    :param frames_dir: The frame set link or None for the default
+    :return: None
+    """
+    frames_dir = frames_dir or paths.FRAMES_DIR
+    previous = get_active(frames_dir)
+
+    if frames_dir.is_dir() and not frames_dir.is_symlink():
+        # A plain directory cannot be replaced by a link atomically
+        shutil.rmtree(str(frames_dir))
+
+    link = frames_dir.with_name(frames_dir.name + '.tmp')
+    if os.path.lexists(str(link)):
+        link.unlink()
+
+    target = staging_dir.name if staging_dir.parent == frames_dir.parent \
+        else str(staging_dir.absolute())
+
+    os.symlink(target, str(link))
+    os.replace(str(link), str(frames_dir))
+    logging.info('Activated frame set: %s', staging_dir)
+
+    abandoned = set(frames_dir.parent.glob(SET_PREFIX + '*')) | \
+        set(staging_dir.parent.glob(SET_PREFIX + '*'))
+    if previous is not None:
+        abandoned.add(previous)
+
+    for directory in abandoned:
+        if directory.exists() and \
+                not os.path.samefile(str(directory), str(staging_dir)):
+            discard(directory)
+
+
+def extract(frames, names: Iterable[str],
+            set_dir: Optional[Path] = None) -> None:
+    """
+    Extract the given frames from a pack (e.g. those that feh needs as
+    files) into a new frame set and atomically activate it.
+
+    :param frames: The frame pack to extract from
+    :param names: The names of the frames to extract
+    :param set_dir: The directory to keep frame sets in or None for the
+                    cache directory
+    :return: None
+    """
+    staging_dir = create_staging(set_dir)
+
+    try:
+        for name in names:
+            with frames.get(name) as data:
+                (staging_dir / name).write_bytes(data)
+    except BaseException:
+        discard(staging_dir)
+        raise
+
+    activate(staging_dir)
+
+
+def get_footprint(set_dir: Optional[Path] = None) -> int:
+    """
+    Return the number of bytes taken up by the files of a frame set.
+
+    :param set_dir: The frame set's directory or None for the active one
+    :return: The frame set's size in bytes
+    """
+    set_dir = set_dir or paths.FRAMES_DIR
+    return sum(path.stat().st_size for path in set_dir.iterdir()
+               if path.is_file())
+
+
+def discard(staging_dir: Path) -> None:
+    """
+    Delete the given frame set, e.g. after its generation failed.
+
+    :param staging_dir: The directory of the frame set
+    :return: None
+    """
+    shutil.rmtree(str(staging_dir), ignore_errors=True)
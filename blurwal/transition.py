@@ -3,73 +3,346 @@ Author: Benedikt Vollmerhaus
 License: MIT
 """
 
+import asyncio
 import logging
-import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, NamedTuple, Optional
 
-from blurwal import paths, wallpaper
+from blurwal import metrics
+from blurwal.setter import FehSetter, Setter
 
+#: The single thread running blocking setter calls in order
+SETTER_EXECUTOR = ThreadPoolExecutor(max_workers=1)
 
-class Transition(threading.Thread):
+#: Easing curves mapping linear progress in [0, 1] to eased progress
+EASINGS: Dict[str, Callable[[float], float]] = {
+    'linear': lambda t: t,
+    'ease-in': lambda t: t * t,
+    'ease-out': lambda t: 1 - (1 - t) ** 2,
+    'ease-in-out': lambda t: t * t * (3 - 2 * t),
+}
+
+
+class Timing(NamedTuple):
+    """
+    How quickly a transition moves between blur levels.
+
+    A level duration of 0 shows every frame as fast as possible.
     """
-    A thread for asynchronously transitioning between two blur levels.
 
-    It supports being stopped to enable reversing a running transition.
-    The current blur level is saved on each frame, so that a subsequent
-    thread may begin reversing the previous transition from there, even
-    if that transition was interrupted.
+    #: The time in seconds to spend per blur level of a transition
+    level_duration: float = 0
+
+    #: The easing curve to apply to a transition's progress
+    easing: Callable[[float], float] = EASINGS['linear']
+
+    #: The max. number of times per second to update the wallpaper
+    fps: Optional[float] = None
+
+
+class Schedule:
+    """
+    Maps the time elapsed since the start of a transition to the blur
+    level to show at that time, so that the transition always takes
+    the same time regardless of how fast frames can be shown.
     """
 
-    def __init__(self, from_blur_level: int, to_blur_level: int):
-        super().__init__()
-        self._stop_event = threading.Event()
+    def __init__(self, from_blur_level: int, to_blur_level: int,
+                 timing: Timing) -> None:
+        self._from_blur_level = from_blur_level
+        self._to_blur_level = to_blur_level
+        self._easing = timing.easing
+
+        span = abs(to_blur_level - from_blur_level)
+        self.duration: float = timing.level_duration * span
+
+        # Tick twice per level by default, so that steep parts of the
+        # easing curve don't skip levels unless the setter lags behind
+        self.interval: float = 1 / timing.fps if timing.fps \
+            else self.duration / max(2 * span, 1)
+
+    def level_at(self, elapsed: float) -> int:
+        """
+        Return the blur level to show after the given elapsed time.
+
+        :param elapsed: The time in seconds since the transition began
+        :return: The blur level to show
+        """
+        if elapsed >= self.duration:
+            return self._to_blur_level
+
+        progress = self._easing(max(elapsed, 0) / self.duration)
+        distance = self._to_blur_level - self._from_blur_level
+        return self._from_blur_level + round(distance * progress)
+
+    def next_tick(self, elapsed: float) -> float:
+        """
+        Return the time of the next tick after the given elapsed time.
 
-        self._from_blur_level: int = from_blur_level
-        self._to_blur_level: int = to_blur_level
+        :param elapsed: The time in seconds since the transition began
+        :return: The time of the next tick since the transition began
+        """
+        return (int(elapsed / self.interval) + 1) * self.interval
+
+
+class Transition:
+    """
+    A single long-lived task moving the wallpaper's blur level toward a
+    target level on the running event loop.
+
+    Events merely change the target level (see retarget). The running
+    transition follows it from whatever level it is currently showing,
+    so reversing mid-transition never restarts it or spawns another
+    task, and there is only ever one frame being shown at a time.
 
-        self.current_level: int = from_blur_level
+    Setter calls that block (such as running feh) are made on a single
+    worker thread, so that they are carried out in the order they were
+    made, even across restarts of the daemon's event loop.
+    """
+
+    def __init__(self, setter: Optional[Setter] = None,
+                 timing: Optional[Timing] = None, level: int = 0,
+                 on_show: Optional[Callable[[], None]] = None) -> None:
+        self._setter: Setter = setter or FehSetter()
+        self._on_show: Optional[Callable[[], None]] = on_show
+        self._timing: Timing = timing or Timing()
+        self._task: Optional[asyncio.Future] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopped: bool = False
+        self._interrupted: bool = False
+        self._retargeted_at: Optional[float] = None
+
+        self.current_level: int = level
+        self.target_level: int = level
+        self.dropped_frames: int = 0
+
+    def start(self) -> None:
+        """
+        Start following the target level as a task on the current event
+        loop.
+
+        :return: None
+        """
+        self._task = asyncio.ensure_future(self.run())
 
     def stop(self) -> None:
         """
-        Stop the currently running blur transition.
+        Stop the transition for good, e.g. when the daemon exits.
 
         :return: None
         """
-        self._stop_event.set()
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
 
     def is_stopped(self) -> bool:
         """
-        Return whether the blur transition has been stopped.
+        Return whether the transition has been stopped.
 
-        :return: Whether the blur transition has been stopped
+        :return: Whether the transition has been stopped
         """
-        return self._stop_event.is_set()
+        return self._stopped
 
-    def run(self) -> None:
+    def retarget(self, level: int) -> None:
         """
-        Begin transitioning from the initial to the target blur level
-        by changing the wallpaper to each intermediate frame in quick
-        succession (actual speed is dependent on feh's performance).
+        Set the blur level to transition to, reversing the direction of
+        a running transition if necessary.
 
+        :param level: The blur level to transition to
         :return: None
         """
-        if self._from_blur_level > self._to_blur_level:
-            logging.info('Unblurring from blur level %s to %s.',
-                         self._from_blur_level, self._to_blur_level)
+        if level == self.target_level:
+            return
+
+        self.target_level = level
+        if self._retargeted_at is None:
+            self._retargeted_at = time.perf_counter()
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def set_timing(self, timing: Timing) -> None:
+        """
+        Change how quickly the transition moves, from the next move on.
+
+        :param timing: The new timing
+        :return: None
+        """
+        self._timing = timing
+
+    def reset(self, level: int) -> None:
+        """
+        Make the given blur level the current and target one without
+        showing it, e.g. once the wallpaper was replaced otherwise.
+
+        A running transition is interrupted and nothing is persisted.
+
+        :param level: The blur level that is now shown
+        :return: None
+        """
+        self.current_level = self.target_level = level
+        self._interrupted = True
+        self._retargeted_at = None
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        """
+        Wait for the target level to change and move toward it, until
+        the transition is stopped.
 
-            blur_levels = reversed(range(self._to_blur_level,
-                                         self._from_blur_level))
+        :return: None
+        """
+        wakeup = self._get_wakeup()
+
+        while not self.is_stopped():
+            await wakeup.wait()
+            wakeup.clear()
+            await self.move()
+
+    async def move(self) -> None:
+        """
+        Transition from the current to the target blur level by changing
+        the wallpaper to each intermediate frame in quick succession,
+        following any changes of the target level on the way.
+
+        If a level duration is set, the level to show is picked from the
+        time elapsed on each tick and levels are skipped if the setter
+        falls behind. Otherwise, every frame is shown and the speed is
+        dependent on the setter's performance.
+
+        Once the target level is reached, its frame is persisted as the
+        wallpaper.
+
+        :return: None
+        """
+        wakeup = self._get_wakeup()
+        moved = False
+
+        while not self.is_stopped() \
+                and self.current_level != self.target_level:
+            wakeup.clear()
+            moved = True
+            self._interrupted = False
+
+            if self.current_level > self.target_level:
+                logging.info('Unblurring from blur level %s to %s.',
+                             self.current_level, self.target_level)
+            else:
+                logging.info('Blurring from blur level %s to %s.',
+                             self.current_level, self.target_level)
+
+            if self._timing.level_duration > 0:
+                await self._run_scheduled(self.target_level)
+            else:
+                await self._run_unthrottled()
+
+        if moved and not self.is_stopped() and not self._interrupted:
+            await asyncio.get_event_loop().run_in_executor(
+                SETTER_EXECUTOR, self._setter.persist, self.current_level)
+
+    def _get_wakeup(self) -> asyncio.Event:
+        """
+        Return the event set on changes of the target level, creating it
+        on the running event loop if necessary.
+
+        :return: The wakeup event
+        """
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        return self._wakeup
+
+    async def _show(self, level: int) -> None:
+        """
+        Show the frame of the given blur level, off the event loop if
+        the setter blocks, and call on_show afterwards, if given.
+
+        The time taken is recorded per step, as well as the time since
+        the transition was retargeted for the first frame shown after.
+
+        :param level: The blur level to show
+        :return: None
+        """
+        self.current_level = level
+        start = time.perf_counter()
+
+        if self._setter.is_blocking:
+            await asyncio.get_event_loop().run_in_executor(
+                SETTER_EXECUTOR, self._setter.show, level)
         else:
-            logging.info('Blurring from blur level %s to %s.',
-                         self._from_blur_level, self._to_blur_level)
+            self._setter.show(level)
+
+        end = time.perf_counter()
+        metrics.record('setter_step', end - start, level=level)
+
+        if self._on_show is not None:
+            self._on_show()
+
+        if self._retargeted_at is not None:
+            metrics.record('decision_to_first_frame',
+                           end - self._retargeted_at)
+            self._retargeted_at = None
 
-            blur_levels = range(self._from_blur_level + 1,
-                                self._to_blur_level + 1)
+        if not self._setter.is_blocking:
+            await asyncio.sleep(0)  # Let other events be handled
 
-        for level in blur_levels:
-            if self.is_stopped():
+    async def _run_unthrottled(self) -> None:
+        """
+        Show every frame on the way to the target level, one step at a
+        time, so that a changed target is followed from the next step.
+
+        :return: None
+        """
+        while not self.is_stopped() and not self._interrupted \
+                and self.current_level != self.target_level:
+            step = 1 if self.target_level > self.current_level else -1
+            await self._show(self.current_level + step)
+
+    async def _run_scheduled(self, to_blur_level: int) -> None:
+        """
+        Show the frame due at each tick of a schedule from the current
+        to the given level, until it is reached or the target changes.
+
+        :param to_blur_level: The blur level to transition to
+        :return: None
+        """
+        loop = asyncio.get_event_loop()
+        schedule = Schedule(self.current_level, to_blur_level, self._timing)
+        start = loop.time()
+        dropped_frames = 0
+
+        while not self.is_stopped() and not self._interrupted \
+                and self.target_level == to_blur_level:
+            elapsed = loop.time() - start
+            level = schedule.level_at(elapsed)
+
+            if level != self.current_level:
+                dropped_frames += abs(level - self.current_level) - 1
+                await self._show(level)
+
+            if level == to_blur_level:
                 break
 
-            self.current_level = level
+            elapsed = loop.time() - start
+            await self._wait(schedule.next_tick(elapsed) - elapsed)
 
-            blur_frame = paths.CACHE_DIR / f'frame-{level}.jpg'
-            wallpaper.change_to(str(blur_frame))
+        if dropped_frames:
+            self.dropped_frames += dropped_frames
+            metrics.count('dropped_frames', dropped_frames)
+            logging.debug('Dropped %s frames to keep up with the schedule.',
+                          dropped_frames)
+
+    async def _wait(self, timeout: float) -> None:
+        """
+        Wait for the given time or until the target level changes.
+
+        :param timeout: The max. time in seconds to wait
+        :return: None
+        """
+        try:
+            await asyncio.wait_for(self._get_wakeup().wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
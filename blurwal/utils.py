@@ -33,6 +33,29 @@ def map_range(value: float, from_range: Tuple[int, int],
     return (value - a_1) * (b_2 - b_1) / (a_2 - a_1) + b_1
 
 
+def format_size(num_bytes: int) -> str:
+    """
+    Format the given number of bytes for humans, in binary units.
+
+    Examples:
+      >>> format_size(512)
+      '512 B'
+      >>> format_size(3 * 1024 ** 2)
+      '3.0 MiB'
+
+    :param num_bytes: The number of bytes
+    :return: The formatted size
+    """
+    if num_bytes < 1024:
+        return f'{num_bytes} B'
+
+    size = float(num_bytes)
+    for unit in ('KiB', 'MiB', 'GiB'):
+        size /= 1024
+        if size < 1024 or unit == 'GiB':
+            return f'{size:.1f} {unit}'
+
+
 def show_notification(title: str, content: str) -> None:
     """
     Show a desktop notification with the given title and content.
@@ -6,23 +6,30 @@ License: MIT
 """
 
 import logging
+import os
 import re
 import subprocess
 import sys
 from pathlib import Path
+from typing import Optional, Tuple
 
 from blurwal import paths
 
 
-def change_to(path: str) -> None:
+def change_to(path: str, *output_paths: str) -> None:
     """
     Set the given image as the wallpaper using feh.
 
+    If further images are given, feh shows each image on one output in
+    Xinerama order (the first being shown on the first output).
+
     :param path: The image to set as the wallpaper
+    :param output_paths: The images to show on any further outputs
     :return: None
     """
-    logging.debug('Setting wallpaper to: %s', path)
-    subprocess.run(['feh', '--bg-fill', path])
+    logging.debug('Setting wallpaper to: %s',
+                  ', '.join((path,) + output_paths))
+    subprocess.run(['feh', '--bg-fill', path, *output_paths])
 
 
 def changed_externally() -> bool:
@@ -34,15 +41,23 @@ def changed_externally() -> bool:
     return not is_transition() and get_current() != get_original()
 
 
-def is_transition() -> bool:
+def is_transition(path: Optional[str] = None,
+                  cache_dir: Optional[Path] = None) -> bool:
     """
-    Check whether the current wallpaper is a transition frame.
+    Check whether the current (or given) wallpaper is a transition frame.
 
-    :return: Whether the current wallpaper is a transition frame
+    :param path: A wallpaper path or None for the current wallpaper
+    :param cache_dir: The resolved cache directory or None to resolve it
+    :return: Whether the wallpaper is a transition frame
     """
-    current_wallpaper = Path(get_current())
-
-    if current_wallpaper.parent.resolve() != paths.CACHE_DIR.resolve():
+    current_wallpaper = Path(path or get_current())
+    cache_dir = cache_dir or paths.CACHE_DIR.resolve()
+
+    # Frames are set through the link to the frame set in use, which
+    # may be located within the cache or elsewhere (see store)
+    frame_dir = current_wallpaper.parent.resolve()
+    if current_wallpaper.parent != paths.FRAMES_DIR and \
+            frame_dir != cache_dir and cache_dir not in frame_dir.parents:
         return False
 
     return re.match(r'frame-\d+', current_wallpaper.name) is not None
@@ -101,3 +116,66 @@ def restore_original() -> None:
         logging.error('Could not restore original wallpaper, '
                       'please set it manually.')
         sys.exit(1)
+
+
+class State:
+    """
+    The current and original wallpaper kept in memory, so that checking
+    for external wallpaper changes requires no reading of files.
+
+    Only blurwal writes the original wallpaper's path, so it is read
+    from disk once. ~/.fehbg is only re-read once it actually changed
+    on disk, as told by its modification time, size and inode.
+    """
+
+    def __init__(self) -> None:
+        self._cache_dir: Path = paths.CACHE_DIR.resolve()
+        self._fehbg_stamp: Optional[Tuple[int, int, int]] = None
+
+        self.current: str = ''
+        self.original: str = get_original()
+        self.is_transition: bool = False
+
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Re-read the current wallpaper if ~/.fehbg changed since the last
+        time it was read.
+
+        :return: Whether the current wallpaper was re-read
+        """
+        try:
+            stat = os.stat(str(paths.FEHBG_FILE))
+            stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            stamp = None
+
+        if stamp is not None and stamp == self._fehbg_stamp:
+            return False
+
+        self._fehbg_stamp = stamp
+        self.current = get_current()
+
+        # Frame paths only change along with ~/.fehbg, so the resolved
+        # check is done once per change instead of on every query
+        self.is_transition = is_transition(self.current, self._cache_dir)
+        return True
+
+    def changed_externally(self) -> bool:
+        """
+        Check whether the wallpaper has been changed externally.
+
+        :return: Whether the wallpaper has been changed externally
+        """
+        return not self.is_transition and self.current != self.original
+
+    def set_original(self, path: str) -> None:
+        """
+        Save the given original wallpaper's path in memory and on disk.
+
+        :param path: The path to save
+        :return: None
+        """
+        self.original = path
+        set_original(path)
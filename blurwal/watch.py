@@ -0,0 +1,180 @@
+"""
+File change notifications via Linux' inotify, using ctypes.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+#: A file was written and closed
+IN_CLOSE_WRITE = 0x00000008
+#: A file was moved out of the directory
+IN_MOVED_FROM = 0x00000040
+#: A file was moved into the directory
+IN_MOVED_TO = 0x00000080
+#: A file was created in the directory
+IN_CREATE = 0x00000100
+#: A file was deleted from the directory
+IN_DELETE = 0x00000200
+#: Events were dropped due to a full event queue
+IN_Q_OVERFLOW = 0x00004000
+
+#: The events indicating that a file in a watched directory changed
+CHANGE_EVENTS = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                 IN_CREATE | IN_DELETE)
+
+#: The header of an inotify event (wd, mask, cookie, name length)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    """
+    Return the C library if it provides inotify, otherwise None.
+
+    :return: The C library or None
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return None
+
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+
+_LIBC = _load_libc()
+
+
+class FileWatcher:
+    """
+    Watches a set of files for changes, exposing a file descriptor that
+    becomes readable when any of them changed, for use with select.
+
+    Files are watched through their parent directories, so that they
+    are also followed when replaced by renaming or recreated.
+    """
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+        Return whether inotify is available on the current system.
+
+        :return: Whether file watching is available
+        """
+        return _LIBC is not None
+
+    def __init__(self) -> None:
+        self._fd: int = _LIBC.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        #: The watched directory of each watch descriptor
+        self._directories: Dict[int, Path] = {}
+        #: The watched file names within each watched directory
+        self._names: Dict[Path, Set[str]] = {}
+        #: The directories of which all files are watched
+        self._whole: Set[Path] = set()
+
+    def fileno(self) -> int:
+        """
+        Return the file descriptor to wait for changes on.
+
+        :return: The inotify file descriptor
+        """
+        return self._fd
+
+    def watch(self, files: Iterable[Path],
+              directories: Iterable[Path] = ()) -> None:
+        """
+        Watch exactly the given files and all files within the given
+        directories, replacing any previous ones.
+
+        :param files: The files to watch
+        :param directories: The directories of which to watch all files
+        :return: None
+        """
+        names: Dict[Path, Set[str]] = {}
+        for file in files:
+            file = Path(file).absolute()
+            names.setdefault(file.parent, set()).add(file.name)
+
+        whole = {Path(directory).absolute() for directory in directories}
+        for directory in whole:
+            names.setdefault(directory, set())
+
+        for wd, directory in list(self._directories.items()):
+            if directory not in names:
+                _LIBC.inotify_rm_watch(self._fd, wd)
+                del self._directories[wd]
+
+        for directory in names:
+            if directory in self._directories.values():
+                continue
+
+            wd = _LIBC.inotify_add_watch(self._fd, os.fsencode(directory),
+                                         CHANGE_EVENTS)
+            if wd < 0:
+                logging.warning('Cannot watch %s for changes: %s', directory,
+                                os.strerror(ctypes.get_errno()))
+                continue
+
+            self._directories[wd] = directory
+
+        self._names = names
+        self._whole = whole
+
+    def read_changes(self) -> Set[Path]:
+        """
+        Return the watched files that changed since the last call,
+        without blocking if there are none.
+
+        :return: The changed files
+        """
+        changed: Set[Path] = set()
+
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return changed
+                raise
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost, so assume everything changed
+                    changed.update(d / n for d, names in self._names.items()
+                                   for n in names)
+                    changed.update(f for d in self._whole if d.is_dir()
+                                   for f in d.iterdir())
+                    continue
+
+                directory = self._directories.get(wd)
+                if directory is not None and (
+                        directory in self._whole or
+                        name in self._names.get(directory, ())):
+                    changed.add(directory / name)
+
+    def close(self) -> None:
+        """
+        Stop watching all files and close the file descriptor.
+
+        :return: None
+        """
+        os.close(self._fd)
+        self._directories.clear()
+        self._names.clear()
+        self._whole.clear()
@@ -6,10 +6,32 @@ License: MIT
 """
 
 import logging
-from typing import List
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
 
 import Xlib
 from ewmh import EWMH
+from Xlib import X, Xatom
+from Xlib.protocol import request
+
+
+class WindowInfo(NamedTuple):
+    """
+    The properties of a window relevant to counting it.
+    """
+
+    #: The window's workspace number or -1 if missing or invalid
+    workspace: int
+
+    #: The window's (instance, class) or None if missing or invalid
+    wm_class: Optional[Tuple[str, str]]
+
+    #: Whether the window still existed when queried
+    valid: bool = True
+
+
+#: The max. length of WM_CLASS to request in units of 4 bytes
+WM_CLASS_LENGTH = 256
 
 
 def count_on_current_ws(ignored_classes: List[str], ewmh: EWMH) -> int:
@@ -25,19 +47,14 @@ def count_on_current_ws(ignored_classes: List[str], ewmh: EWMH) -> int:
     """
     window_count = 0
 
+    current_workspace = ewmh.getCurrentDesktop()
     all_windows = ewmh.getClientList()
-    windows_on_ws = [w for w in all_windows
-                     if get_workspace(w, ewmh) == ewmh.getCurrentDesktop()]
 
-    for window in windows_on_ws:
-        try:
-            window_class = window.get_wm_class()
-        except Xlib.error.BadWindow:
-            logging.info('Ignoring bad window (id: %s)', window.id)
+    for info in query_windows(all_windows, ewmh):
+        if not info.valid or info.workspace != current_workspace:
             continue
 
-        if window_class is not None and window_class[1] in ignored_classes:
-            logging.info("Ignoring window with class '%s'.", window_class[1])
+        if is_ignored(info, ignored_classes):
             continue
 
         window_count += 1
@@ -45,6 +62,116 @@ def count_on_current_ws(ignored_classes: List[str], ewmh: EWMH) -> int:
     return window_count
 
 
+def is_ignored(info: WindowInfo, ignored_classes: List[str]) -> bool:
+    """
+    Return whether the window with the given properties has a class
+    in the given ignore list.
+
+    :param info: The window's properties
+    :param ignored_classes: A list of window classes to ignore
+    :return: Whether the window is ignored
+    """
+    if info.wm_class is not None and info.wm_class[1] in ignored_classes:
+        logging.info("Ignoring window with class '%s'.", info.wm_class[1])
+        return True
+
+    return False
+
+
+def query_windows(windows: List, ewmh: EWMH) -> List[WindowInfo]:
+    """
+    Query the workspace and class of all given windows at once.
+
+    Instead of waiting for the reply to each request before sending the
+    next one, the requests for all windows are sent in one go and their
+    replies collected afterwards, so the time taken is about a single
+    round-trip regardless of the number of windows.
+
+    Windows that were destroyed in the meantime are marked as invalid.
+
+    :param windows: The windows to query
+    :param ewmh: An instance of EWMH for workspace retrieval
+    :return: The properties of each window in the given order
+    """
+    desktop_atom = ewmh.display.get_atom('_NET_WM_DESKTOP')
+
+    pending = [(window,
+                _request_property(window, desktop_atom,
+                                  X.AnyPropertyType, 1),
+                _request_property(window, Xatom.WM_CLASS,
+                                  Xatom.STRING, WM_CLASS_LENGTH))
+               for window in windows]
+
+    result = []
+    for window, desktop_request, class_request in pending:
+        try:
+            desktop = _get_reply_value(desktop_request)
+            wm_class = _get_reply_value(class_request)
+        except Xlib.error.BadWindow:
+            logging.info('Bad window (id: %s)', window.id)
+            result.append(WindowInfo(-1, None, valid=False))
+            continue
+
+        if desktop:
+            workspace = desktop[0]
+        else:
+            logging.warning('Window (id: %s) has no workspace number.',
+                            window.id)
+            workspace = -1
+
+        result.append(WindowInfo(workspace, _parse_wm_class(wm_class)))
+
+    return result
+
+
+def _request_property(window, atom: int, property_type: int, length: int):
+    """
+    Send a request for a window property without waiting for its reply.
+
+    :param window: The window to get the property of
+    :param atom: The property's atom
+    :param property_type: The property's expected type
+    :param length: The max. length to get in units of 4 bytes
+    :return: The pending request
+    """
+    return request.GetProperty(display=window.display, defer=True,
+                               delete=False, window=window.id,
+                               property=atom, type=property_type,
+                               long_offset=0, long_length=length)
+
+
+def _get_reply_value(pending_request):
+    """
+    Wait for the reply to the given property request.
+
+    :param pending_request: A request sent by _request_property
+    :return: The property's value or None if it is missing
+    """
+    pending_request.reply()
+
+    if not pending_request.property_type:
+        return None
+
+    return pending_request.value[1]
+
+
+def _parse_wm_class(value) -> Optional[Tuple[str, str]]:
+    """
+    Parse a raw WM_CLASS value into (instance, class) like python-xlib.
+
+    :param value: The raw property value or None
+    :return: The window's (instance, class) or None
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, bytes):
+        value = value.decode('ISO-8859-1')
+
+    parts = value.split('\0')
+    return (parts[0], parts[1]) if len(parts) >= 2 else None
+
+
 def get_workspace(window, ewmh: EWMH) -> int:
     """
     Return the given window's workspace number or -1 if the window
@@ -62,3 +189,155 @@ def get_workspace(window, ewmh: EWMH) -> int:
         logging.warning('Window (id: %s) has no workspace number.', window.id)
 
     return -1
+
+
+class WindowIndex:
+    """
+    An index of all client windows and their workspaces, built once and
+    then kept up-to-date from PropertyNotify events, so that counting
+    the windows on the current workspace requires no X requests.
+
+    The index follows changes of these properties:
+
+    _NET_CLIENT_LIST on the root window, when windows are opened or
+      closed (only the added windows are queried)
+
+    _NET_CURRENT_DESKTOP on the root window, when switching workspaces
+
+    _NET_WM_DESKTOP on a client window, when it is moved to a different
+      workspace
+    """
+
+    def __init__(self, ignored_classes: List[str], ewmh: EWMH) -> None:
+        self._ignored_classes = ignored_classes
+        self._ewmh = ewmh
+
+        display = ewmh.display
+        self._client_list_atom = display.intern_atom('_NET_CLIENT_LIST')
+        self._current_desktop_atom = display.intern_atom(
+            '_NET_CURRENT_DESKTOP')
+        self._wm_desktop_atom = display.intern_atom('_NET_WM_DESKTOP')
+
+        #: The workspace of each indexed window by window id
+        self._workspaces: Dict[int, int] = {}
+        #: The ids of indexed windows that are counted (not ignored)
+        self._counted: Set[int] = set()
+        #: The number of counted windows on each workspace
+        self._counts: Counter = Counter()
+
+        self.current_workspace: int = -1
+
+    def rebuild(self) -> None:
+        """
+        Build the index from scratch and start following the changes of
+        client windows. Following those of the root window requires its
+        PropertyChangeMask to be selected by the caller.
+
+        :return: None
+        """
+        self._workspaces.clear()
+        self._counted.clear()
+        self._counts.clear()
+
+        self.current_workspace = self._ewmh.getCurrentDesktop()
+        self._update_client_list()
+
+    def count_on_current_ws(self) -> int:
+        """
+        Return the number of open windows on the current workspace.
+
+        :return: The number of open windows on the workspace
+        """
+        return self._counts[self.current_workspace]
+
+    def set_ignored_classes(self, ignored_classes: List[str]) -> None:
+        """
+        Change the window classes to exclude from counting and rebuild
+        the index, as the classes of indexed windows are not kept.
+
+        :param ignored_classes: A list of window classes to ignore
+        :return: None
+        """
+        self._ignored_classes = ignored_classes
+        self.rebuild()
+
+    def handle_event(self, event) -> bool:
+        """
+        Update the index from the given event if it is relevant to it.
+
+        :param event: An X event
+        :return: Whether the window count may have changed
+        """
+        if event.type != X.PropertyNotify:
+            return False
+
+        if event.atom == self._client_list_atom:
+            self._update_client_list()
+        elif event.atom == self._current_desktop_atom:
+            self.current_workspace = self._ewmh.getCurrentDesktop()
+        elif event.atom == self._wm_desktop_atom:
+            if event.window.id not in self._workspaces:
+                return False
+            self._set_workspace(event.window.id,
+                                get_workspace(event.window, self._ewmh))
+        else:
+            return False
+
+        return True
+
+    def _update_client_list(self) -> None:
+        """
+        Add newly listed windows to and remove closed ones from the index.
+
+        :return: None
+        """
+        clients = {w.id: w for w in self._ewmh.getClientList()}
+
+        for window_id in set(self._workspaces) - set(clients):
+            self._set_workspace(window_id, None)
+            self._counted.discard(window_id)
+
+        added = [clients[i] for i in set(clients) - set(self._workspaces)]
+        self._add(added)
+
+    def _add(self, windows: List) -> None:
+        """
+        Add the given windows to the index and follow their property
+        changes, querying all of them at once (see query_windows).
+
+        :param windows: The windows to add
+        :return: None
+        """
+        for window in windows:
+            window.change_attributes(event_mask=X.PropertyChangeMask,
+                                     onerror=Xlib.error.CatchError())
+
+        for window, info in zip(windows, query_windows(windows, self._ewmh)):
+            if not info.valid:
+                continue
+
+            if not is_ignored(info, self._ignored_classes):
+                self._counted.add(window.id)
+
+            self._set_workspace(window.id, info.workspace)
+
+    def _set_workspace(self, window_id: int,
+                       workspace: Optional[int]) -> None:
+        """
+        Move the given window to a workspace in the index, updating the
+        window counts, or remove it from the index if None is given.
+
+        :param window_id: The id of an indexed window
+        :param workspace: The window's new workspace or None
+        :return: None
+        """
+        counted = window_id in self._counted
+        previous = self._workspaces.pop(window_id, None)
+
+        if counted and previous is not None:
+            self._counts[previous] -= 1
+
+        if workspace is not None:
+            self._workspaces[window_id] = workspace
+            if counted:
+                self._counts[workspace] += 1
@@ -50,8 +50,9 @@ setup(
 
     python_requires='>=3.6',
     install_requires=['python-xlib', 'ewmh'],
+    extras_require={'pillow': ['Pillow']},
     setup_requires=['pytest-runner'],
-    tests_require=['pytest', 'pytest-mock', 'pytest-datadir'],
+    tests_require=['pytest', 'pytest-mock', 'pytest-datadir', 'Pillow'],
 
     classifiers=[
         'Development Status :: 5 - Production/Stable',
@@ -5,104 +5,906 @@ Author: Benedikt Vollmerhaus
 License: MIT
 """
 
+import asyncio
+import json
+import os
+import signal
 from argparse import Namespace
 from multiprocessing.pool import Pool
+from pathlib import Path
 
-from blurwal import frame, paths
-from blurwal.blur import Blur
-from blurwal.transition import Transition
+import pytest
+import Xlib.display
+import Xlib.error
+from Xlib import X
 
+from blurwal import control, frame, metrics, pack, setter, wallpaper
+from blurwal.__main__ import parse_args
+from blurwal.blur import Blur, get_timing
+from blurwal.screen import Output
+from blurwal.transition import SETTER_EXECUTOR
 
-def test_init_transition_blurs_when_over_threshold(mocker):
-    args = Namespace(min=2, steps=10, blur=0, ignore=[])
-    blur = Blur(args)
 
-    blur_thread = Transition(0, 0)
-    unblur_thread = Transition(0, 0)
+def make_args(**overrides) -> Namespace:
+    """
+    Return the default command line arguments with the given overrides.
+    """
+    args = parse_args(['--backend', 'convert', '--duration', '0'])
+    vars(args).update(overrides)
+    return args
 
-    mock_transition = mocker.patch('blurwal.blur.Transition')
-    blur.init_transition(2, blur_thread, unblur_thread)
-    mock_transition.assert_called_once_with(0, 10)
 
+def run(coroutine):
+    """
+    Run the given coroutine to completion on a new event loop.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
 
-def test_init_transition_unblurs_when_under_threshold(mocker):
-    args = Namespace(min=2, steps=10, blur=0, ignore=[])
-    blur = Blur(args)
 
-    blur_thread = Transition(0, 0)
-    blur_thread.current_level = 10  # Blur thread has completed
-    unblur_thread = Transition(0, 0)
+def test_init_transition_blurs_when_over_threshold():
+    blur = Blur(make_args(min=2, steps=10))
+    blur.init_transition(2)
+    assert blur.transition.target_level == 10
 
-    mock_transition = mocker.patch('blurwal.blur.Transition')
-    blur.init_transition(0, blur_thread, unblur_thread)
-    mock_transition.assert_called_once_with(10, 0)
 
+def test_init_transition_unblurs_when_under_threshold():
+    blur = Blur(make_args(min=2, steps=10))
+    blur.init_transition(3)
+    blur.init_transition(1)
+    assert blur.transition.target_level == 0
 
-def test_init_transition_does_not_blur_consecutively(mocker):
-    mocker.patch('blurwal.wallpaper.change_to')
-    args = Namespace(min=2, steps=10, blur=0, ignore=[])
-    blur = Blur(args)
 
-    # Blur as previous transition
-    blur_thread, unblur_thread = blur.init_transition(
-        2, Transition(0, 0), Transition(0, 0))
+def test_init_transition_retargets_without_new_transition(mocker):
+    blur = Blur(make_args(min=2, steps=10))
+    transition = blur.transition
+    mock_retarget = mocker.spy(transition, 'retarget')
 
-    mock_transition = mocker.patch('blurwal.blur.Transition')
+    for window_count in (2, 0, 3, 0):
+        blur.init_transition(window_count)
 
-    # Should not blur again consecutively
-    blur.init_transition(2, blur_thread, unblur_thread)
-    mock_transition.assert_not_called()
+    assert blur.transition is transition
+    assert mock_retarget.call_count == 4
+    assert transition.target_level == 0
 
 
-def test_init_transition_does_not_unblur_consecutively(mocker):
-    mocker.patch('blurwal.wallpaper.change_to')
-    args = Namespace(min=2, steps=10, blur=0, ignore=[])
-    blur = Blur(args)
+def write_pack(blur, entries):
+    """
+    Pack the test frames with the given entries as generated by blur
+    into the cache, from the original wallpaper.
+    """
+    path = blur.get_pack_path()
+    path.parent.mkdir(exist_ok=True)
 
-    # Unblur as previous transition
-    blur_thread, unblur_thread = blur.init_transition(
-        0, Transition(0, 0), Transition(0, 0))
+    frame_dir = Path(wallpaper.get_original()).parent
+    pack.write(path, wallpaper.get_original(),
+               blur.get_generation_parameters(),
+               [(frame_dir / entry['name'], entry) for entry in entries])
+    return path
 
-    mock_transition = mocker.patch('blurwal.blur.Transition')
 
-    # Should not unblur again consecutively
-    blur.init_transition(0, blur_thread, unblur_thread)
-    mock_transition.assert_not_called()
+@pytest.fixture
+def cached_frames(mocker, shared_datadir):
+    """
+    Use a pack of the test frames as the cache, with the first frame as
+    the original wallpaper.
+    """
+    original = shared_datadir / 'cache_dir/frame-0.jpg'
 
+    mocker.patch('blurwal.paths.PACKS_DIR', shared_datadir / 'packs')
+    mocker.patch('blurwal.paths.FRAMES_DIR', shared_datadir / 'frames')
+    mocker.patch('blurwal.wallpaper.get_original', return_value=str(original))
 
-def test_frames_are_outdated(mocker, shared_datadir):
-    mocker.patch('blurwal.paths.CACHE_DIR', shared_datadir / 'cache_dir')
-    mocker.patch('blurwal.frame.is_outdated', return_value=False)
+    blur = Blur(make_args(steps=10, blur=0))
+    return write_pack(blur, blur.get_frame_entries())
 
-    args = Namespace(steps=10, blur=0, min=0, ignore=[])
-    blur = Blur(args)
+
+def test_frames_are_outdated(cached_frames):
+    blur = Blur(make_args(steps=10, blur=0))
     assert not blur.frames_are_outdated()
 
 
-def test_frames_are_outdated_when_frame_missing(mocker, shared_datadir):
-    mocker.patch('blurwal.paths.CACHE_DIR', shared_datadir / 'cache_dir')
-    args = Namespace(steps=11, blur=0, min=0, ignore=[])
-    blur = Blur(args)
+def test_frames_are_outdated_when_pack_missing(cached_frames):
+    cached_frames.unlink()
+    blur = Blur(make_args(steps=10, blur=0))
     assert blur.frames_are_outdated()
 
 
-def test_frames_are_outdated_when_frame_outdated(mocker, shared_datadir):
-    mocker.patch('blurwal.paths.CACHE_DIR', shared_datadir / 'cache_dir')
-    mocker.patch('blurwal.frame.is_outdated', return_value=True)
+def test_frames_are_outdated_when_pack_invalid(cached_frames):
+    cached_frames.write_bytes(b'garbage')
+    blur = Blur(make_args(steps=10, blur=0))
+    assert blur.frames_are_outdated()
 
-    args = Namespace(steps=10, blur=0, min=0, ignore=[])
-    blur = Blur(args)
+
+def test_frames_are_outdated_when_parameters_changed(cached_frames):
+    blur = Blur(make_args(steps=10, blur=5))
+    assert blur.frames_are_outdated()
+
+
+def test_frames_are_outdated_when_wallpaper_changed(mocker, shared_datadir,
+                                                    cached_frames):
+    mocker.patch('blurwal.wallpaper.get_original',
+                 return_value=str(shared_datadir / 'cache_dir/frame-1.jpg'))
+    blur = Blur(make_args(steps=10, blur=0))
+    assert blur.frames_are_outdated()
+
+
+def test_frames_are_not_outdated_when_switching_back(mocker, shared_datadir,
+                                                     cached_frames):
+    mocker.patch('blurwal.wallpaper.get_original',
+                 return_value=str(shared_datadir / 'cache_dir/frame-1.jpg'))
+    blur = Blur(make_args(steps=10, blur=0))
+    write_pack(blur, blur.get_frame_entries())
+
+    mocker.patch('blurwal.wallpaper.get_original',
+                 return_value=str(shared_datadir / 'cache_dir/frame-0.jpg'))
+    assert not blur.frames_are_outdated()
+    assert len(list(cached_frames.parent.iterdir())) == 2
+
+
+def test_frames_are_outdated_when_frame_missing(cached_frames):
+    blur = Blur(make_args(steps=10, blur=0))
+    write_pack(blur, blur.get_frame_entries()[:-1])
+    assert blur.frames_are_outdated()
+
+
+def test_frames_are_outdated_when_frame_damaged(cached_frames):
+    with pack.Pack(cached_frames) as frames:
+        offset = frames.entries['frame-4.jpg']['offset']
+
+    with open(cached_frames, 'r+b') as file:
+        file.seek(offset + 100)
+        file.write(b'garbage')
+
+    blur = Blur(make_args(steps=10, blur=0))
     assert blur.frames_are_outdated()
+    assert not blur.frames_are_outdated(verify=False)
+
+
+def test_load_frames_extracts_images(mocker, shared_datadir, cached_frames):
+    blur = Blur(make_args(steps=10, blur=0))
+    mocker.patch.object(blur.setter, 'load')
+
+    blur.load_frames()
+
+    frames_dir = shared_datadir / 'frames'
+    assert len(list(frames_dir.glob('frame-*.jpg'))) == 11
+    assert (frames_dir / 'frame-4.jpg').read_bytes() == \
+        (shared_datadir / 'cache_dir/frame-4.jpg').read_bytes()
+    blur.setter.load.assert_called_once_with(blur.frames, frames_dir, 10)
+
+
+def test_load_frames_extracts_persisted_levels(mocker, shared_datadir,
+                                               cached_frames):
+    blur = Blur(make_args(steps=10, blur=0))
+    blur.setter = mocker.Mock(spec=setter.RootPixmapSetter)
+    blur.setter.get_file_levels.return_value = [0, 10]
+
+    blur.load_frames()
+
+    frames_dir = shared_datadir / 'frames'
+    assert sorted(path.name for path in frames_dir.glob('frame-*.jpg')) == \
+        ['frame-0.jpg', 'frame-10.jpg']
+
+
+def test_load_frames_closes_previous_pack(mocker, cached_frames):
+    blur = Blur(make_args(steps=10, blur=0))
+    mocker.patch.object(blur.setter, 'load')
+    blur.frames = previous = mocker.Mock()
+
+    blur.load_frames()
+
+    previous.close.assert_called_once()
+    assert 'frame-4.jpg' in blur.frames
+
+
+def test_load_frames_interpolates_keyframes(mocker, shared_datadir,
+                                            cached_frames):
+    blur = Blur(make_args(steps=10, blur=0, keyframes=3))
+    assert blur.get_frame_names() == \
+        ['frame-0.jpg', 'frame-5.jpg', 'frame-10.jpg']
+    write_pack(blur, blur.get_frame_entries())
+    mocker.patch.object(blur.setter, 'load')
+
+    blur.load_frames()
+
+    frames_dir = shared_datadir / 'frames'
+    assert len(list(frames_dir.glob('frame-*.jpg'))) == 11
+    assert 'frame-7.jpg' in blur.setter.load.call_args[0][0]
+
+
+def test_get_packs_dir_in_frame_dir(tmp_path):
+    blur = Blur(make_args(frame_dir=tmp_path))
+    assert blur.get_packs_dir() == tmp_path / 'packs'
+
+
+def test_get_frame_entries():
+    blur = Blur(make_args(steps=2, blur=8))
+    blur.outputs = [Output(0, 0, 800, 600)]
+    blur.raw_mode = 'BGRX'
+
+    entries = blur.get_frame_entries()
+    assert entries[1] == {'name': 'frame-1-800x600.bgrx', 'level': 1,
+                          'size': [800, 600], 'sigma': 4, 'encoding': 'bgrx'}
+    assert entries[-1] == {'name': 'frame-2-800x600.jpg', 'level': 2,
+                           'size': [800, 600], 'sigma': 8, 'encoding': 'jpeg'}
 
 
-def test_generate_transition_frames(mocker):
+@pytest.fixture
+def staging_dir(mocker, tmp_path):
+    """
+    Generate frames into a fixed partial frame set without packing.
+    """
+    staging_dir = tmp_path / 'partial-new'
+    staging_dir.mkdir()
+    mocker.patch('blurwal.store.create_partial', return_value=staging_dir)
+    mocker.patch('blurwal.store.discard_stale')
+    mocker.patch('blurwal.pack.write')
+    mocker.patch('blurwal.cache.evict')
+    mocker.patch.object(Blur, 'get_pack_path',
+                        return_value=tmp_path / 'packs/frames.pack')
+    return staging_dir
+
+
+def test_generate_transition_frames(mocker, staging_dir):
     mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original', return_value='/original')
     mock_starmap = mocker.patch.object(Pool, 'starmap')
 
-    args = Namespace(steps=10, blur=8.5, min=0, ignore=[])
+    args = make_args(steps=10, blur=8.5, min=0, ignore=[])
     blur = Blur(args)
 
-    expected_jobs = [(paths.CACHE_DIR, l, 10, 8.5) for l in range(11)]
+    expected_jobs = [(staging_dir, l, 10, 8.5) for l in range(11)]
+
+    blur.generate_transition_frames()
+    function, jobs = mock_starmap.call_args[0]
+    assert (function.func, function.keywords) == \
+        (frame.generate, {'source': '/original'})
+    assert jobs == expected_jobs
+
+
+def test_generate_transition_frames_uses_backend(mocker, staging_dir):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original')
+    mock_generate = mocker.patch.object(frame.PillowBackend, 'generate')
+
+    args = make_args(steps=4, blur=8, min=0, ignore=[], backend='pillow')
+    blur = Blur(args)
 
     blur.generate_transition_frames()
-    mock_starmap.assert_called_once_with(frame.generate, expected_jobs)
+    mock_generate.assert_called_once_with(
+        staging_dir, range(5), 4, 8, None, None, None, range(5),
+        source=wallpaper.get_original(), cancelled=None, workers=None)
+
+
+def test_generate_transition_frames_in_cascade(mocker, staging_dir):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original')
+    mock_generate = mocker.patch.object(frame.ConvertBackend, 'generate')
+
+    args = make_args(steps=4, blur=8, cascade=2)
+    blur = Blur(args)
+
+    blur.generate_transition_frames()
+    mock_generate.assert_called_once_with(staging_dir, range(5), 4, 8, 2, None,
+                                          None, range(5),
+                                          source=wallpaper.get_original(),
+                                          cancelled=None, workers=None)
+
+
+def test_generate_transition_frames_only_keyframes(mocker, staging_dir):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original')
+    mock_generate = mocker.patch.object(frame.PillowBackend, 'generate')
+
+    blur = Blur(make_args(steps=60, blur=8, backend='pillow', keyframes=4))
+    blur.outputs = [Output(0, 0, 800, 600)]
+    blur.raw_mode = 'BGRX'
+
+    blur.generate_transition_frames()
+    source = wallpaper.get_original()
+    mock_generate.assert_called_once_with(
+        staging_dir, [0, 20, 40, 60], 60, 8, None, (800, 600), 'BGRX',
+        [0, 60], source=source, cancelled=None, workers=None)
+    assert len(blur.get_frame_entries(interpolated=True)) == 63
+    assert blur.get_generation_parameters()['keyframes'] == 4
+
+
+def test_generate_transition_frames_per_output_size(mocker, staging_dir):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original')
+    mock_generate = mocker.patch.object(frame.ConvertBackend, 'generate')
+
+    blur = Blur(make_args(steps=1, blur=8))
+    blur.outputs = [Output(0, 0, 1920, 1080), Output(1920, 0, 1280, 1024),
+                    Output(3200, 0, 1920, 1080)]
+
+    blur.generate_transition_frames()
+    assert mock_generate.call_count == 2
+    source = wallpaper.get_original()
+    mock_generate.assert_any_call(staging_dir, range(2), 1, 8, None,
+                                  (1920, 1080), None, range(2),
+                                  source=source, cancelled=None,
+                                  workers=None)
+    mock_generate.assert_any_call(staging_dir, range(2), 1, 8, None,
+                                  (1280, 1024), None, range(2),
+                                  source=source, cancelled=None,
+                                  workers=None)
+
+    assert blur.get_generation_parameters()['sizes'] == \
+        [[1280, 1024], [1920, 1080]]
+    assert [e['name'] for _, e in pack.write.call_args[0][3]] == [
+        'frame-0-1280x1024.jpg', 'frame-1-1280x1024.jpg',
+        'frame-0-1920x1080.jpg', 'frame-1-1920x1080.jpg']
+
+
+def test_generate_transition_frames_raw(mocker, staging_dir):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original')
+    mock_generate = mocker.patch.object(frame.PillowBackend, 'generate')
+
+    blur = Blur(make_args(steps=2, blur=8, backend='pillow', format='raw'))
+    blur.outputs = [Output(0, 0, 800, 600)]
+    blur.raw_mode = 'BGRX'
+
+    blur.generate_transition_frames()
+    source = wallpaper.get_original()
+    # JPEG frames are saved from the same blurred images as raw frames
+    mock_generate.assert_called_once_with(
+        staging_dir, range(3), 2, 8, None, (800, 600), 'BGRX', [0, 2],
+        source=source, cancelled=None, workers=None)
+    assert [e['name'] for _, e in pack.write.call_args[0][3]] == [
+        'frame-0-800x600.bgrx', 'frame-1-800x600.bgrx',
+        'frame-2-800x600.bgrx', 'frame-0-800x600.jpg',
+        'frame-2-800x600.jpg']
+    assert blur.get_generation_parameters()['format'] == 'BGRX'
+
+
+def test_get_raw_mode_falls_back_to_jpeg(mocker):
+    blur = Blur(make_args(backend='pillow', format='raw'))
+    assert blur.get_raw_mode(mocker.Mock()) is None  # feh setter
+
+
+def test_get_raw_mode_uses_server_layout(mocker):
+    blur = Blur(make_args(backend='pillow', format='raw'))
+    blur.setter = mocker.Mock(spec=setter.RootPixmapSetter)
+    mocker.patch.object(setter.RootPixmapSetter, 'get_raw_mode',
+                        return_value='XRGB')
+    assert blur.get_raw_mode(mocker.Mock()) == 'XRGB'
+
+
+def test_generate_transition_frames_writes_pack(mocker, staging_dir):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original', return_value='/original')
+    mocker.patch.object(frame.ConvertBackend, 'generate')
+    mock_discard = mocker.patch('blurwal.store.discard')
+
+    blur = Blur(make_args(steps=1))
+    blur.generate_transition_frames()
+
+    path, source, parameters, frames = pack.write.call_args[0]
+    assert (path, source) == (blur.get_pack_path(), '/original')
+    assert parameters == blur.get_generation_parameters()
+    assert frames[1] == (staging_dir / 'frame-1.jpg',
+                         blur.get_frame_entries()[1])
+    mock_discard.assert_called_once_with(staging_dir)
+
+
+def test_generate_transition_frames_keeps_failed_set(mocker, staging_dir):
+    mocker.patch('blurwal.utils.show_notification')
+    mocker.patch('blurwal.wallpaper.get_original')
+    mocker.patch.object(frame.ConvertBackend, 'generate',
+                        side_effect=frame.GenerationCancelled)
+    mock_discard = mocker.patch('blurwal.store.discard')
+
+    with pytest.raises(frame.GenerationCancelled):
+        Blur(make_args()).generate_transition_frames()
+
+    # Kept for resuming the generation (see frame.generate_pack)
+    mock_discard.assert_not_called()
+    pack.write.assert_not_called()
+
+
+def test_get_timing_spreads_duration_over_steps():
+    timing = get_timing(make_args(steps=10, duration=0.5))
+    assert timing.level_duration == pytest.approx(0.05)
+
+
+def test_get_timing_from_fps_without_duration():
+    timing = get_timing(make_args(steps=10, duration=0, fps=40))
+    assert timing.level_duration == pytest.approx(0.025)
+    assert timing.fps == 40
+
+
+def make_display(mocker, event_types):
+    """
+    Mock a display with events of the given types pending.
+    """
+    display = mocker.Mock()
+    display.next_event.side_effect = [mocker.Mock(type=t) for t in event_types]
+    display.pending_events.side_effect = \
+        list(range(len(event_types), 0, -1)) + [0] * 10
+    return display
+
+
+def test_drain_window_events_drains_burst(mocker):
+    event_types = [X.PropertyNotify, X.MapNotify, X.UnmapNotify,
+                   X.ConfigureNotify, X.MapNotify]
+    display = make_display(mocker, event_types)
+
+    blur = Blur(make_args())
+    assert blur.drain_window_events(display) == 3
+    assert display.next_event.call_count == 5
+
+
+def test_drain_window_events_without_window_events(mocker):
+    display = make_display(mocker, [X.PropertyNotify, X.ConfigureNotify])
+
+    blur = Blur(make_args())
+    assert blur.drain_window_events(display) == 0
+
+
+def test_handle_x_events_evaluates_burst_once(mocker):
+    display = make_display(mocker, [X.MapNotify, X.UnmapNotify])
+
+    blur = Blur(make_args())
+    mock_evaluate = mocker.patch.object(blur, 'evaluate')
+    blur.handle_x_events(display)
+    mock_evaluate.assert_called_once()
+
+
+def test_handle_x_events_waits_coalescing_window(mocker):
+    blur = Blur(make_args(coalesce=20))
+    mock_evaluate = mocker.patch.object(blur, 'evaluate')
+
+    async def receive_bursts():
+        blur.handle_x_events(make_display(mocker, [X.MapNotify]))
+        await asyncio.sleep(0.01)
+        blur.handle_x_events(make_display(mocker, [X.UnmapNotify]))
+        mock_evaluate.assert_not_called()
+        await asyncio.sleep(0.03)
+
+    run(receive_bursts())
+    mock_evaluate.assert_called_once()
+
+
+def test_schedule_x_events_handles_queued_events(mocker):
+    # Read off the connection while showing a frame, so the connection
+    # won't become readable for it
+    blur = Blur(make_args())
+    blur.display = make_display(mocker, [X.MapNotify])
+    mock_evaluate = mocker.patch.object(blur, 'evaluate')
+
+    async def show_frame():
+        blur.schedule_x_events()
+        await asyncio.sleep(0)
+
+    run(show_frame())
+    mock_evaluate.assert_called_once()
+
+
+@pytest.fixture
+def evaluated_blur(mocker):
+    """
+    A Blur with a mocked window index, file watcher and wallpaper state.
+    """
+    blur = Blur(make_args(min=1, steps=10))
+    blur.window_index = mocker.Mock()
+    blur.file_watcher = mocker.Mock()
+    blur.wallpaper_state = mocker.Mock(original='original.png')
+    mocker.patch.object(blur, 'init_transition')
+    return blur
+
+
+def test_evaluate_transitions_when_frames_current(evaluated_blur):
+    evaluated_blur.frames_current = True
+    evaluated_blur.window_index.count_on_current_ws.return_value = 2
+
+    evaluated_blur.evaluate()
+    evaluated_blur.init_transition.assert_called_once_with(2)
+
+
+def test_evaluate_stops_on_lost_connection(mocker, evaluated_blur):
+    error = Xlib.error.ConnectionClosedError('Display')
+    evaluated_blur.window_index.count_on_current_ws.side_effect = error
+    mock_stop = mocker.patch.object(evaluated_blur, 'stop')
+
+    evaluated_blur.evaluate()
+
+    mock_stop.assert_called_once_with(error)
+    evaluated_blur.init_transition.assert_not_called()
+
+
+def test_evaluate_records_event_latency(mocker, evaluated_blur):
+    metrics.reset()
+    mocker.patch('time.perf_counter', side_effect=[1.0, 1.1, 1.1, 1.5])
+    evaluated_blur.window_index.count_on_current_ws.return_value = 2
+
+    evaluated_blur.handle_x_events(make_display(mocker, [X.MapNotify]))
+
+    histograms = metrics.get_summary()['histograms']
+    assert histograms['window_count']['max'] == 0
+    assert histograms['event_to_decision']['max'] == 0.5
+    assert evaluated_blur.event_received is None
+
+
+def test_evaluate_postpones_blur_while_generating(mocker, evaluated_blur):
+    mock_submit = mocker.patch.object(SETTER_EXECUTOR, 'submit')
+    evaluated_blur.window_index.count_on_current_ws.return_value = 2
+
+    evaluated_blur.evaluate()
+    evaluated_blur.init_transition.assert_not_called()
+    mock_submit.assert_not_called()
+
+
+def test_evaluate_unblurs_instantly_while_generating(mocker, evaluated_blur):
+    mock_submit = mocker.patch.object(SETTER_EXECUTOR, 'submit')
+    evaluated_blur.window_index.count_on_current_ws.return_value = 0
+    evaluated_blur.transition.reset(6)
+
+    evaluated_blur.evaluate()
+    evaluated_blur.init_transition.assert_not_called()
+    mock_submit.assert_called_once_with(wallpaper.change_to, 'original.png')
+    assert evaluated_blur.transition.current_level == 0
+
+
+def test_forced_unblur_unblurs_instantly_while_generating(mocker,
+                                                          evaluated_blur):
+    mock_submit = mocker.patch.object(SETTER_EXECUTOR, 'submit')
+    evaluated_blur.window_index.count_on_current_ws.return_value = 5
+    evaluated_blur.transition.reset(10)
+
+    evaluated_blur.handle_request({'command': 'unblur'})
+    mock_submit.assert_called_once_with(wallpaper.change_to, 'original.png')
+
+
+def test_forced_blur_ignores_windows(evaluated_blur):
+    evaluated_blur.frames_current = True
+    evaluated_blur.window_index.count_on_current_ws.return_value = 0
+
+    assert not evaluated_blur.wants_blur(0)
+    status = evaluated_blur.handle_request({'command': 'blur'})
+    assert status['forced'] is True
+    assert evaluated_blur.wants_blur(0)
+    evaluated_blur.init_transition.assert_called_once_with(0)
+
+    evaluated_blur.handle_request({'command': 'auto'})
+    assert not evaluated_blur.wants_blur(0)
+
+
+def test_status(mocker, evaluated_blur, tmp_path):
+    evaluated_blur.set_dir = tmp_path
+    evaluated_blur.window_index.count_on_current_ws.return_value = 3
+
+    status = evaluated_blur.handle_request({'command': 'status'})
+    assert status['window_count'] == 3
+    assert status['parameters'] == \
+        {'steps': 10, 'blur': 10, 'min': 1, 'ignore': []}
+    assert status['cache']['wallpapers'] == 0
+    json.dumps(status)
+
+
+def test_reload_min_only_reevaluates(mocker, evaluated_blur):
+    mock_regenerate = mocker.patch.object(evaluated_blur, 'regenerate')
+    evaluated_blur.frames_current = True
+    evaluated_blur.window_index.count_on_current_ws.return_value = 2
+
+    result = evaluated_blur.handle_request(
+        {'command': 'reload', 'parameters': {'min': 3, 'steps': 10}})
+
+    assert result == {'changed': ['min'], 'regenerating': False}
+    assert evaluated_blur.window_threshold == 3
+    evaluated_blur.init_transition.assert_called_once_with(2)
+    mock_regenerate.assert_not_called()
+
+
+def test_reload_ignore_rebuilds_window_index(evaluated_blur):
+    evaluated_blur.window_index.count_on_current_ws.return_value = 0
+    evaluated_blur.handle_request(
+        {'command': 'reload', 'parameters': {'ignore': ['Conky']}})
+    evaluated_blur.window_index.set_ignored_classes.assert_called_once_with(
+        ['Conky'])
+
+
+def test_reload_steps_regenerates_frames(mocker, evaluated_blur):
+    mock_regenerate = mocker.patch.object(evaluated_blur, 'regenerate',
+                                          mocker.Mock())
+    mocker.patch('asyncio.ensure_future')
+    evaluated_blur.frames_current = True
+    evaluated_blur.args.duration = 0.5
+
+    result = evaluated_blur.handle_request(
+        {'command': 'reload', 'parameters': {'steps': 20, 'blur': 5}})
+
+    assert result == {'changed': ['blur', 'steps'], 'regenerating': True}
+    assert (evaluated_blur.transition_steps, evaluated_blur.max_sigma) == \
+        (20, 5)
+    assert evaluated_blur.timing.level_duration == pytest.approx(0.025)
+    assert not evaluated_blur.frames_current
+    mock_regenerate.assert_called_once_with(True, verify=True)
+
+
+def test_reload_steps_stops_transition(mocker, evaluated_blur):
+    mocker.patch.object(evaluated_blur, 'regenerate', mocker.Mock())
+    mocker.patch('asyncio.ensure_future')
+    evaluated_blur.transition.reset(4)
+    evaluated_blur.transition.retarget(10)
+
+    evaluated_blur.handle_request(
+        {'command': 'reload', 'parameters': {'steps': 5}})
+
+    assert evaluated_blur.transition.current_level == 4
+    assert evaluated_blur.transition.target_level == 4
+
+
+@pytest.mark.parametrize('request_', [
+    {'command': 'reload', 'parameters': {'steps': 1}},
+    {'command': 'reload', 'parameters': {'min': True}},
+    {'command': 'reload', 'parameters': {'ignore': 'Conky'}},
+    {'command': 'reload', 'parameters': {'duration': 1}},
+    {'command': 'reload'},
+    {'command': 'restart'},
+])
+def test_handle_request_rejects_invalid_request(evaluated_blur, request_):
+    with pytest.raises(control.ControlError):
+        evaluated_blur.handle_request(request_)
+    assert evaluated_blur.transition_steps == 10
+
+
+def test_regenerate_maps_level_to_new_steps(mocker, evaluated_blur):
+    mocker.patch.object(evaluated_blur, 'frames_are_outdated',
+                        return_value=False)
+    mocker.patch.object(evaluated_blur, 'load_frames')
+    mocker.patch.object(evaluated_blur, 'report_footprint')
+    evaluated_blur.frame_steps = 10
+    evaluated_blur.transition.reset(10)
+    evaluated_blur.transition_steps = 20
+
+    run(evaluated_blur.regenerate(True))
+
+    assert evaluated_blur.transition.current_level == 20
+    assert evaluated_blur.frame_steps == 20
+
+
+def test_regenerate_verifies_cached_frames_after_loading(
+        mocker, evaluated_blur):
+    mock_outdated = mocker.patch.object(evaluated_blur, 'frames_are_outdated',
+                                        side_effect=[False, True])
+    mock_generate = mocker.patch.object(evaluated_blur,
+                                        'generate_transition_frames')
+    mock_load = mocker.patch.object(evaluated_blur, 'load_frames')
+    mocker.patch.object(evaluated_blur, 'report_footprint')
+    loaded = []
+    mocker.patch.object(evaluated_blur, 'evaluate',
+                        side_effect=lambda: loaded.append(
+                            evaluated_blur.frames_current))
+
+    async def regenerate():
+        await evaluated_blur.regenerate(True, verify=False)
+        await asyncio.sleep(0)
+
+    run(regenerate())
+
+    assert [call[0] for call in mock_outdated.call_args_list] == \
+        [(False,), (True,)]
+    mock_generate.assert_called_once()
+    assert mock_load.call_count == 2
+    assert loaded == [True, True]
+
+
+def test_regenerate_stops_when_generation_cancelled(mocker, evaluated_blur):
+    mocker.patch.object(evaluated_blur, 'frames_are_outdated',
+                        return_value=True)
+    mock_load = mocker.patch.object(evaluated_blur, 'load_frames')
+
+    def generate(cancelled):
+        # The wallpaper changes while generating
+        evaluated_blur.cancel_generation()
+        frame.check_cancelled(cancelled)
+
+    mocker.patch.object(evaluated_blur, 'generate_transition_frames',
+                        side_effect=generate)
+
+    run(evaluated_blur.regenerate(True))
+
+    mock_load.assert_not_called()
+    assert not evaluated_blur.frames_current
+    assert not evaluated_blur.generation_cancelled.is_set()
+
+
+def test_regenerate_keeps_frames_outdated_on_change_while_loading(
+        mocker, evaluated_blur):
+    mocker.patch.object(evaluated_blur, 'frames_are_outdated',
+                        return_value=False)
+    mocker.patch.object(evaluated_blur, 'report_footprint')
+    mock_evaluate = mocker.patch.object(evaluated_blur, 'evaluate')
+    # The wallpaper changes while loading
+    mocker.patch.object(evaluated_blur, 'load_frames',
+                        side_effect=evaluated_blur.cancel_generation)
+
+    async def regenerate():
+        await evaluated_blur.regenerate(True)
+        await asyncio.sleep(0)
+
+    run(regenerate())
+
+    assert not evaluated_blur.frames_current
+    mock_evaluate.assert_not_called()
+
+
+def test_start_regeneration_logs_failure(mocker, caplog, evaluated_blur):
+    mocker.patch.object(evaluated_blur, 'frames_are_outdated',
+                        return_value=False)
+    mocker.patch.object(evaluated_blur, 'load_frames',
+                        side_effect=OSError('Corrupt pack'))
+
+    async def regenerate():
+        evaluated_blur.start_regeneration()
+        await asyncio.wait([evaluated_blur.regeneration])
+        await asyncio.sleep(0)
+
+    run(regenerate())
+
+    assert not evaluated_blur.frames_current
+    assert 'Could not regenerate the frames.' in caplog.text
+    assert 'Corrupt pack' in caplog.text
+
+
+@pytest.fixture
+def watched_blur(mocker, tmp_path):
+    """
+    A Blur with a file watcher on a mocked wallpaper state.
+    """
+    blur = Blur(make_args())
+    blur.file_watcher = mocker.Mock()
+    blur.file_watcher.read_changes.return_value = set()
+    blur.wallpaper_state = mocker.Mock(
+        original=str(tmp_path / 'original.png'), current='')
+    blur.wallpaper_state.changed_externally.return_value = False
+
+    mocker.patch.object(blur, 'frames_are_outdated', return_value=True)
+    mocker.patch.object(blur, 'generate_transition_frames')
+    mocker.patch.object(blur, 'evaluate')
+    mocker.patch.object(blur, 'report_footprint')
+    mocker.patch.object(blur, 'load_frames')
+    return blur
+
+
+def handle_wallpaper_changes(blur):
+    """
+    Handle wallpaper changes and wait for any resulting regeneration.
+    """
+    async def handle():
+        blur.handle_wallpaper_changes()
+        if blur.regeneration is not None:
+            await blur.regeneration
+        await asyncio.sleep(0)
+
+    run(handle())
+
+
+@pytest.fixture
+def x_server(mocker, tmp_path):
+    """
+    Fake the X server, the window index and the wallpaper for serving,
+    and return the file watcher.
+    """
+    display_fd, watcher_fd = os.pipe()
+    display = mocker.patch('Xlib.display.Display').return_value
+    display.fileno.return_value = display_fd
+    display.pending_events.return_value = 0
+    mocker.patch('ewmh.EWMH')
+    mocker.patch('blurwal.screen.get_outputs', return_value=[])
+    mocker.patch('blurwal.window.WindowIndex')
+    mocker.patch('blurwal.setter.create')
+    mocker.patch('blurwal.wallpaper.State')
+    mocker.patch('blurwal.watch.FileWatcher.is_available', return_value=True)
+    file_watcher = mocker.patch('blurwal.watch.FileWatcher').return_value
+    file_watcher.fileno.return_value = watcher_fd
+    mocker.patch('blurwal.paths.CONTROL_SOCKET', tmp_path / 'control.sock')
+
+    yield file_watcher
+
+    os.close(display_fd)
+    os.close(watcher_fd)
+
+
+def test_serve_closes_file_watcher(mocker, x_server):
+    blur = Blur(make_args())
+    mocker.patch.object(blur, 'start_regeneration')
+
+    async def serve():
+        serving = asyncio.ensure_future(blur.serve())
+        while blur.control_server is None:
+            await asyncio.sleep(0)
+        serving.cancel()
+        await asyncio.wait([serving])
+
+    run(serve())
+
+    x_server.close.assert_called_once()
+    assert blur.file_watcher is None
+
+
+def test_serve_stops_on_lost_connection(mocker, x_server, tmp_path):
+    error = Xlib.error.ConnectionClosedError('Display')
+    display = Xlib.display.Display()
+    display.pending_events.side_effect = error
+    # python-xlib raises the error for any use of a closed connection
+    display.fileno.side_effect = [display.fileno(), error]
+
+    blur = Blur(make_args())
+    mocker.patch.object(blur, 'start_regeneration')
+    mock_cancel = mocker.patch.object(blur, 'cancel_generation')
+
+    with pytest.raises(Xlib.error.ConnectionClosedError):
+        run(blur.serve())
+
+    mock_cancel.assert_called_once()
+    assert not (tmp_path / 'control.sock').exists()
+
+
+@pytest.mark.parametrize('signum', [signal.SIGINT, signal.SIGTERM])
+def test_listen_for_events_cleans_up_on_signal(mocker, x_server, tmp_path,
+                                               signum):
+    blur = Blur(make_args())
+    mocker.patch.object(blur, 'start_regeneration')
+    mock_cancel = mocker.patch.object(blur, 'cancel_generation')
+    # Send the signal once ready
+    mocker.patch.object(blur, 'handle_x_events',
+                        side_effect=lambda _: os.kill(os.getpid(), signum))
+
+    blur.listen_for_events()
+
+    mock_cancel.assert_called_once()
+    assert blur.transition.is_stopped()
+    assert not (tmp_path / 'control.sock').exists()
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
+
+
+def test_handle_wallpaper_changes_ignores_unrelated_changes(watched_blur):
+    handle_wallpaper_changes(watched_blur)
+    watched_blur.generate_transition_frames.assert_not_called()
+
+
+def test_handle_wallpaper_changes_on_external_change(watched_blur, tmp_path):
+    watched_blur.wallpaper_state.changed_externally.return_value = True
+    watched_blur.wallpaper_state.current = str(tmp_path / 'new.png')
+
+    handle_wallpaper_changes(watched_blur)
+
+    watched_blur.wallpaper_state.set_original.assert_called_once_with(
+        str(tmp_path / 'new.png'))
+    watched_blur.file_watcher.watch.assert_called_once()
+    watched_blur.generate_transition_frames.assert_called_once()
+    watched_blur.load_frames.assert_called_once()
+    watched_blur.evaluate.assert_called_once()
+    assert watched_blur.frames_current
+
+
+def test_handle_wallpaper_changes_resets_transition(watched_blur, tmp_path):
+    watched_blur.transition.reset(10)
+    watched_blur.wallpaper_state.changed_externally.return_value = True
+    watched_blur.wallpaper_state.current = str(tmp_path / 'new.png')
+
+    async def handle():
+        watched_blur.handle_wallpaper_changes()
+        assert not watched_blur.frames_current
+        assert watched_blur.transition.current_level == 0
+        await watched_blur.regeneration
+
+    run(handle())
+
+
+def test_handle_wallpaper_changes_on_modified_original(watched_blur,
+                                                       tmp_path):
+    watched_blur.file_watcher.read_changes.return_value = \
+        {tmp_path / 'original.png'}
+
+    handle_wallpaper_changes(watched_blur)
+    watched_blur.generate_transition_frames.assert_called_once()
@@ -0,0 +1,84 @@
+"""
+Test cases for the cache of frame packs.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import os
+
+from blurwal import cache
+
+
+def test_get_key_is_stable():
+    assert cache.get_key('abc', {'blur': 1, 'steps': 10}) == \
+        cache.get_key('abc', {'steps': 10, 'blur': 1})
+
+
+def test_get_key_differs_by_wallpaper_and_parameters():
+    keys = {cache.get_key('abc', {'blur': 1}),
+            cache.get_key('abd', {'blur': 1}),
+            cache.get_key('abc', {'blur': 2})}
+    assert len(keys) == 3
+
+
+def make_pack(packs_dir, name, size, last_used):
+    path = packs_dir / (name + cache.PACK_SUFFIX)
+    path.write_bytes(b'\0' * size)
+    os.utime(str(path), (last_used, last_used))
+    return path
+
+
+def test_get_packs_least_recently_used_first(tmp_path):
+    newer = make_pack(tmp_path, 'newer', 1, 200)
+    older = make_pack(tmp_path, 'older', 1, 100)
+    assert cache.get_packs(tmp_path) == [older, newer]
+
+
+def test_get_packs_without_cache(tmp_path):
+    assert cache.get_packs(tmp_path / 'packs') == []
+
+
+def test_evict_least_recently_used(tmp_path):
+    oldest = make_pack(tmp_path, 'oldest', 100, 100)
+    older = make_pack(tmp_path, 'older', 100, 200)
+    newest = make_pack(tmp_path, 'newest', 100, 300)
+
+    cache.evict(tmp_path, 250, keep=newest)
+
+    assert not oldest.exists()
+    assert older.exists() and newest.exists()
+    assert cache.get_footprint(tmp_path) == 200
+
+
+def test_evict_keeps_pack_in_use(tmp_path):
+    in_use = make_pack(tmp_path, 'in-use', 100, 100)
+    other = make_pack(tmp_path, 'other', 100, 200)
+
+    cache.evict(tmp_path, 50, keep=in_use)
+
+    assert in_use.exists()
+    assert not other.exists()
+
+
+def test_evict_skips_packs_deleted_concurrently(mocker, tmp_path):
+    evicted = make_pack(tmp_path, 'evicted', 100, 100)
+    other = make_pack(tmp_path, 'other', 100, 200)
+    mocker.patch.object(cache, 'get_packs', return_value=[evicted, other])
+    evicted.unlink()
+
+    cache.evict(tmp_path, 150, keep=None)
+
+    assert other.exists()
+
+
+def test_discard_temp_packs_of_finished_processes(tmp_path):
+    own = tmp_path / f'own.pack.{os.getpid()}.tmp'
+    stale = tmp_path / 'stale.pack.999999999.tmp'
+    for path in (own, stale):
+        path.write_bytes(b'partial')
+
+    cache.discard_temp_packs(tmp_path)
+
+    assert own.exists()
+    assert not stale.exists()
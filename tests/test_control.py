@@ -0,0 +1,109 @@
+"""
+Test cases for the control socket.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import asyncio
+import json
+import socket
+
+import pytest
+
+from blurwal import control
+
+
+def handle(request):
+    if request['command'] == 'fail':
+        raise control.ControlError('Failed.')
+    if request['command'] == 'crash':
+        raise KeyError('level')
+    return {'echo': request}
+
+
+def respond(line):
+    return json.loads(control.respond(handle, line))
+
+
+def test_respond_with_result():
+    assert respond(b'{"command": "status"}\n') == \
+        {'ok': True, 'result': {'echo': {'command': 'status'}}}
+
+
+@pytest.mark.parametrize('line', [b'status\n', b'[]\n', b'{"level": 1}\n'])
+def test_respond_to_invalid_request(line):
+    assert not respond(line)['ok']
+
+
+def test_respond_with_error():
+    assert respond(b'{"command": "fail"}\n') == \
+        {'ok': False, 'error': 'Failed.'}
+    assert respond(b'{"command": "crash"}\n')['error'].startswith(
+        'Internal error')
+
+
+def run_with_server(path, client):
+    """
+    Serve requests on the given socket while running the given blocking
+    client in a thread, and return the client's result.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def run():
+        server = await control.start_server(path, handle)
+        try:
+            return await loop.run_in_executor(None, client)
+        finally:
+            control.stop_server(server, path)
+
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def test_request_round_trip(tmp_path):
+    path = tmp_path / 'control.sock'
+
+    result = run_with_server(
+        path, lambda: control.request('reload', path, parameters={'min': 3}))
+
+    assert result == {'echo': {'command': 'reload', 'parameters': {'min': 3}}}
+    assert not path.exists()
+
+
+def test_request_raises_error(tmp_path):
+    path = tmp_path / 'control.sock'
+
+    def client():
+        with pytest.raises(control.ControlError, match='Failed.'):
+            control.request('fail', path)
+
+    run_with_server(path, client)
+
+
+def test_request_without_daemon(tmp_path):
+    with pytest.raises(control.ControlError):
+        control.request('status', tmp_path / 'control.sock')
+
+
+def test_start_server_replaces_stale_socket(tmp_path):
+    path = tmp_path / 'control.sock'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(str(path))
+
+    result = run_with_server(path, lambda: control.request('status', path))
+    assert result == {'echo': {'command': 'status'}}
+
+
+def test_start_server_refuses_socket_in_use(tmp_path):
+    path = tmp_path / 'control.sock'
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as running:
+        running.bind(str(path))
+        running.listen()
+
+        with pytest.raises(control.ControlError):
+            run_with_server(path, lambda: None)
@@ -0,0 +1,109 @@
+"""
+Test cases for crossfading between keyframes.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from blurwal import crossfade, pack
+
+
+def test_get_keyframe_levels():
+    assert crossfade.get_keyframe_levels(60, 4) == [0, 20, 40, 60]
+    assert crossfade.get_keyframe_levels(10, 2) == [0, 10]
+
+
+def test_get_keyframe_levels_limited_to_all_levels():
+    assert crossfade.get_keyframe_levels(3, 10) == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize('level, expected', [
+    (0, (0, 20, 0)),
+    (5, (0, 20, 0.25)),
+    (20, (20, 40, 0)),
+    (30, (20, 40, 0.5)),
+    (40, (20, 40, 1)),
+])
+def test_get_neighbors(level, expected):
+    assert crossfade.get_neighbors(level, [0, 20, 40]) == expected
+
+
+def make_entry(level, size, encoding):
+    extension = 'jpg' if encoding == 'jpeg' else encoding
+    name = f'frame-{level}-{size[0]}x{size[1]}.{extension}'
+    return {'name': name, 'level': level, 'size': list(size),
+            'encoding': encoding}
+
+
+@pytest.fixture
+def keyframes(tmp_path):
+    """
+    Pack a black and a white raw and JPEG keyframe at levels 0 and 4.
+    """
+    size = (8, 4)
+    frames = []
+
+    for level, value in ((0, 0), (4, 255)):
+        image = Image.new('RGB', size, (value,) * 3)
+
+        raw_path = tmp_path / f'frame-{level}.bgrx'
+        raw_path.write_bytes(image.tobytes('raw', 'BGRX'))
+        frames.append((raw_path, make_entry(level, size, 'bgrx')))
+
+        jpeg_path = tmp_path / f'frame-{level}.jpg'
+        image.save(jpeg_path, quality=100)
+        frames.append((jpeg_path, make_entry(level, size, 'jpeg')))
+
+    pack_path = tmp_path / 'frames.pack'
+    pack.write(pack_path, str(jpeg_path), {}, frames)
+    return pack_path
+
+
+def make_interpolation(pack_path, levels):
+    entries = [make_entry(level, (8, 4), encoding)
+               for level in levels for encoding in ('bgrx', 'jpeg')]
+    return crossfade.Interpolation(pack.Pack(pack_path), entries)
+
+
+def test_interpolation_passes_keyframes_through(keyframes):
+    with make_interpolation(keyframes, range(5)) as frames:
+        with frames.get('frame-4-8x4.bgrx') as data:
+            assert bytes(data) == b'\xff\xff\xff\0' * 32
+
+
+def test_interpolation_blends_raw_frames(keyframes):
+    with make_interpolation(keyframes, range(5)) as frames:
+        with frames.get('frame-1-8x4.bgrx') as data:
+            assert bytes(data)[:4] == bytes([63, 63, 63, 0])
+            assert len(data) == 8 * 4 * 4
+
+
+def test_interpolation_blends_jpeg_frames(keyframes):
+    with make_interpolation(keyframes, range(5)) as frames:
+        with frames.get('frame-2-8x4.jpg') as data:
+            image = Image.open(io.BytesIO(bytes(data)))
+            assert image.size == (8, 4)
+            assert image.getpixel((0, 0)) == pytest.approx((128,) * 3,
+                                                           abs=2)
+
+
+def test_interpolation_provides_all_entries(keyframes):
+    with make_interpolation(keyframes, range(5)) as frames:
+        assert 'frame-3-8x4.jpg' in frames
+        assert 'frame-5-8x4.jpg' not in frames
+        assert len(frames.entries) == 10
+
+
+def test_interpolation_memoizes_blended_images(mocker, keyframes):
+    blend = mocker.spy(Image, 'blend')
+    with make_interpolation(keyframes, range(5)) as frames:
+        image = frames.get_image('frame-2-8x4.jpg')
+        assert image.mode == 'RGB'
+        assert frames.get_image('frame-2-8x4.jpg') is image
+        assert frames.get_image('frame-2-8x4.bgrx').mode == 'RGBX'
+    assert blend.call_count == 2
@@ -5,32 +5,354 @@ Author: Benedikt Vollmerhaus
 License: MIT
 """
 
+import math
+import threading
+import time
 from pathlib import Path
 
-from blurwal import frame
+import pytest
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+from pytest import approx
 
+from blurwal import frame, pack
 
-def test_generate_runs_convert(mocker):
+
+@pytest.fixture
+def mock_popen(mocker):
+    """
+    Start no convert processes, each exiting as if it failed.
+    """
+    mock_popen = mocker.patch('subprocess.Popen')
+    mock_popen.return_value.__enter__.return_value.wait.return_value = 1
+    return mock_popen
+
+
+def test_generate_runs_convert(mocker, mock_popen):
     mocker.patch('blurwal.wallpaper.get_original', return_value='image.png')
-    mock_run = mocker.patch('subprocess.run')
 
     output_dir = Path('~/.cache/blurwal')
-    expected_output_file = str(output_dir / 'frame-4.jpg')
+    expected_output_file = str(output_dir / 'frame-4.tmp.jpg')
 
     frame.generate(output_dir, 4, 10, 12)
-    mock_run.assert_called_once_with(
+    mock_popen.assert_called_once_with(
         ['convert', 'image.png', '-blur', '0x4.8', expected_output_file])
 
 
-def test_is_outdated_false_when_equal(mocker, shared_datadir):
-    mocker.patch('blurwal.frame.generate')
-    mocker.patch('blurwal.paths.CACHE_DIR', shared_datadir / 'cache_dir')
-    mocker.patch('blurwal.paths.TEMP_DIR', shared_datadir / 'temp_dir')
-    assert not frame.is_outdated(5, 0, 0)
+def test_generate_runs_convert_on_source(mock_popen):
+    frame.generate(Path('out'), 0, 10, 12, source='other.png')
+    assert mock_popen.call_args[0][0][:2] == ['convert', 'other.png']
+
+
+def test_generate_renames_finished_frame(mock_popen, tmp_path):
+    def convert(command):
+        Path(command[-1]).write_bytes(b'frame')
+        return mock_popen.return_value
+
+    mock_popen.side_effect = convert
+    mock_popen.return_value.__enter__.return_value.wait.return_value = 0
+
+    frame.generate(tmp_path, 1, 10, 12, source='image.png')
+    assert [path.name for path in tmp_path.iterdir()] == ['frame-1.jpg']
+
+
+def test_run_convert_stops_when_cancelled():
+    cancelled = threading.Event()
+    threading.Timer(0.2, cancelled.set).start()
+
+    start = time.perf_counter()
+    with pytest.raises(frame.GenerationCancelled):
+        frame.run_convert(['sleep', '10'], cancelled)
+
+    assert time.perf_counter() - start < 5
 
 
-def test_is_outdated_true_when_different(mocker, shared_datadir):
+def test_convert_backend_passes_source(mocker):
+    mock_generate = mocker.patch('blurwal.frame.generate')
+    frame.ConvertBackend().generate(Path('out'), range(2), 1, 4,
+                                    source='other.png')
+    mock_generate.assert_any_call(Path('out'), 1, 1, 4, source='other.png')
+
+
+def test_convert_backend_limits_workers(mocker):
     mocker.patch('blurwal.frame.generate')
-    mocker.patch('blurwal.paths.CACHE_DIR', shared_datadir / 'cache_dir')
-    mocker.patch('blurwal.paths.TEMP_DIR', shared_datadir / 'temp_dir_differs')
-    assert frame.is_outdated(5, 0, 0)
+    mock_pool = mocker.patch('multiprocessing.pool.ThreadPool')
+    frame.ConvertBackend().generate(Path('out'), range(3), 2, 4, workers=1)
+    mock_pool.assert_called_once_with(processes=1)
+
+
+def test_pillow_backend_limits_workers(mocker, shared_datadir, tmp_path):
+    source = shared_datadir / 'cache_dir/frame-0.jpg'
+    mock_executor = mocker.spy(frame, 'ThreadPoolExecutor')
+    frame.PillowBackend().generate(tmp_path, range(3), 2, 8,
+                                   source=str(source), workers=1)
+    mock_executor.assert_called_once_with(max_workers=1)
+    assert len(list(tmp_path.glob('frame-*.jpg'))) == 3
+
+
+def test_get_backend_by_name():
+    assert isinstance(frame.get_backend('convert'), frame.ConvertBackend)
+    assert isinstance(frame.get_backend('pillow'), frame.PillowBackend)
+
+
+def test_get_backend_auto_prefers_pillow():
+    assert isinstance(frame.get_backend('auto'), frame.PillowBackend)
+
+
+def test_get_backend_auto_falls_back_to_convert(mocker):
+    mocker.patch('blurwal.frame.Image', None)
+    assert isinstance(frame.get_backend(), frame.ConvertBackend)
+
+
+def test_convert_backend_runs_convert_per_level(mocker):
+    mock_generate = mocker.patch('blurwal.frame.generate')
+    frame.ConvertBackend().generate(Path('out'), range(3), 2, 4)
+    assert mock_generate.call_count == 3
+    mock_generate.assert_any_call(Path('out'), 2, 2, 4)
+
+
+def test_pillow_backend_generates_increasingly_blurred_frames(
+        mocker, shared_datadir, tmp_path):
+    source = shared_datadir / 'cache_dir/frame-0.jpg'
+    mocker.patch('blurwal.wallpaper.get_original', return_value=str(source))
+
+    frame.PillowBackend().generate(tmp_path, range(3), 2, 8)
+
+    sharpness = []
+    for level in range(3):
+        with Image.open(tmp_path / f'frame-{level}.jpg') as image:
+            edges = image.convert('L').filter(ImageFilter.FIND_EDGES)
+            sharpness.append(ImageStat.Stat(edges).mean[0])
+
+    assert sharpness[0] > sharpness[1] > sharpness[2]
+
+
+def test_get_cascade_sigmas_compose_to_level_sigma():
+    deltas = frame.get_cascade_sigmas([2, 3, 4, 5], 10, 12)
+    assert deltas[0] == approx(2.4)
+
+    for count, level in enumerate([3, 4, 5], start=2):
+        composed = math.sqrt(sum(d ** 2 for d in deltas[:count]))
+        assert composed == approx(frame.get_sigma(level, 10, 12))
+
+
+def test_split_chains():
+    assert frame.split_chains(range(4), 1) == [[0, 1, 2, 3]]
+    assert frame.split_chains(range(5), 2) == [[0, 1, 2], [3, 4]]
+    assert frame.split_chains([2, 0, 1], 5) == [[0], [1], [2]]
+    assert frame.split_chains(range(3)) == [[0], [1], [2]]
+
+
+def test_generate_cascade_runs_single_convert(mocker, mock_popen):
+    mocker.patch('blurwal.wallpaper.get_original', return_value='image.png')
+
+    frame.generate_cascade(Path('out'), [0, 1, 2], 2, 4)
+    mock_popen.assert_called_once_with(
+        ['convert', 'image.png',
+         '-write', str(Path('out/frame-0.tmp.jpg')),
+         '-blur', '0x2.0', '-write', str(Path('out/frame-1.tmp.jpg')),
+         '-blur', f'0x{math.sqrt(12)}',
+         '-write', str(Path('out/frame-2.tmp.jpg')),
+         'null:'])
+
+
+def test_convert_backend_runs_convert_per_chain(mocker):
+    mock_generate_cascade = mocker.patch('blurwal.frame.generate_cascade')
+    frame.ConvertBackend().generate(Path('out'), range(4), 3, 6, chains=2)
+    mock_generate_cascade.assert_any_call(Path('out'), [0, 1], 3, 6)
+    mock_generate_cascade.assert_any_call(Path('out'), [2, 3], 3, 6)
+
+
+def test_pillow_backend_cascade_matches_independent_blur(
+        mocker, shared_datadir, tmp_path):
+    source = shared_datadir / 'cache_dir/frame-0.jpg'
+    mocker.patch('blurwal.wallpaper.get_original', return_value=str(source))
+
+    (tmp_path / 'independent').mkdir()
+    (tmp_path / 'cascade').mkdir()
+
+    backend = frame.PillowBackend()
+    backend.generate(tmp_path / 'independent', [4], 4, 6)
+    backend.generate(tmp_path / 'cascade', range(5), 4, 6, chains=1)
+
+    with Image.open(tmp_path / 'independent/frame-4.jpg') as independent, \
+            Image.open(tmp_path / 'cascade/frame-4.jpg') as cascade:
+        difference = ImageChops.difference(independent, cascade)
+        assert max(ImageStat.Stat(difference).mean) < 2
+
+
+def test_get_pyramid_factor():
+    assert frame.get_pyramid_factor(0) == 1
+    assert frame.get_pyramid_factor(7.9) == 1
+    assert frame.get_pyramid_factor(8) == 2
+    assert frame.get_pyramid_factor(16) == 4
+    assert frame.get_pyramid_factor(1000) == frame.PYRAMID_MAX_FACTOR
+
+
+def test_generate_prescales_and_blurs_on_pyramid(mocker, mock_popen):
+    mocker.patch('blurwal.wallpaper.get_original', return_value='image.png')
+
+    frame.generate(Path('out'), 10, 10, 16, size=(1920, 1080))
+    mock_popen.assert_called_once_with(
+        ['convert', 'image.png',
+         '-resize', '1920x1080^', '-gravity', 'center',
+         '-extent', '1920x1080',
+         '-scale', '480x270!', '-blur', '0x4.0', '-resize', '1920x1080!',
+         str(Path('out/frame-10-1920x1080.tmp.jpg'))])
+
+
+def test_convert_backend_passes_output_size(mocker):
+    mock_generate = mocker.patch('blurwal.frame.generate')
+    frame.ConvertBackend().generate(Path('out'), range(2), 1, 4,
+                                    size=(800, 600))
+    mock_generate.assert_any_call(Path('out'), 1, 1, 4, (800, 600))
+
+
+def test_blur_image_on_pyramid_matches_full_blur(shared_datadir):
+    with Image.open(shared_datadir / 'cache_dir/frame-0.jpg') as source:
+        image = source.convert('RGB')
+
+    full = image.filter(ImageFilter.GaussianBlur(12))
+    pyramid = frame.blur_image(image, 12)
+
+    assert pyramid.size == image.size
+    difference = ImageChops.difference(full, pyramid)
+    assert max(ImageStat.Stat(difference).mean) < 2
+
+
+def test_pillow_backend_scales_frames_to_output(
+        mocker, shared_datadir, tmp_path):
+    source = shared_datadir / 'cache_dir/frame-0.jpg'
+    mocker.patch('blurwal.wallpaper.get_original', return_value=str(source))
+
+    frame.PillowBackend().generate(tmp_path, range(3), 2, 16, size=(64, 48))
+
+    for level in range(3):
+        with Image.open(tmp_path / f'frame-{level}-64x48.jpg') as image:
+            assert image.size == (64, 48)
+
+
+def test_pillow_backend_saves_raw_frames(mocker, shared_datadir, tmp_path):
+    source = shared_datadir / 'cache_dir/frame-0.jpg'
+    mocker.patch('blurwal.wallpaper.get_original', return_value=str(source))
+
+    frame.PillowBackend().generate(tmp_path, range(2), 1, 4, size=(16, 9),
+                                   raw_mode='BGRX')
+
+    assert sorted(p.name for p in tmp_path.glob('frame-*')) == \
+        ['frame-0-16x9.bgrx', 'frame-1-16x9.bgrx']
+    assert (tmp_path / 'frame-1-16x9.bgrx').stat().st_size == 16 * 9 * 4
+
+
+def test_pillow_backend_saves_images_with_raw_frames(mocker, shared_datadir,
+                                                     tmp_path):
+    source = str(shared_datadir / 'cache_dir/frame-0.jpg')
+    mock_open = mocker.spy(frame.Image, 'open')
+    mock_blur = mocker.spy(frame, 'blur_image')
+
+    frame.PillowBackend().generate(tmp_path, range(3), 2, 4, size=(16, 9),
+                                   raw_mode='BGRX', image_levels=[0, 2],
+                                   source=source)
+
+    assert sorted(p.name for p in tmp_path.glob('frame-*')) == \
+        ['frame-0-16x9.bgrx', 'frame-0-16x9.jpg', 'frame-1-16x9.bgrx',
+         'frame-2-16x9.bgrx', 'frame-2-16x9.jpg']
+    assert mock_open.call_count == 1
+    assert mock_blur.call_count == 3
+
+
+def test_pillow_backend_resumes_missing_images(mocker, shared_datadir,
+                                               tmp_path):
+    source = str(shared_datadir / 'cache_dir/frame-0.jpg')
+    for level in range(3):
+        (tmp_path / f'frame-{level}-16x9.bgrx').write_bytes(b'finished')
+    (tmp_path / 'frame-0-16x9.jpg').write_bytes(b'finished')
+    mock_blur = mocker.spy(frame, 'blur_image')
+
+    frame.PillowBackend().generate(tmp_path, range(3), 2, 4, size=(16, 9),
+                                   raw_mode='BGRX', image_levels=[0, 2],
+                                   source=source)
+
+    assert (tmp_path / 'frame-2-16x9.jpg').exists()
+    assert (tmp_path / 'frame-0-16x9.jpg').read_bytes() == b'finished'
+    assert mock_blur.call_count == 1
+
+
+def test_convert_backend_rejects_raw_frames():
+    with pytest.raises(ValueError):
+        frame.ConvertBackend().generate(Path('out'), range(2), 1, 4,
+                                        size=(16, 9), raw_mode='BGRX')
+
+
+def test_generate_pack_from_source(mocker, shared_datadir, tmp_path):
+    source = str(shared_datadir / 'cache_dir/frame-0.jpg')
+    mock_generate = mocker.patch.object(frame.PillowBackend, 'generate',
+                                        autospec=True)
+    mock_write = mocker.patch('blurwal.pack.write')
+
+    entries = [{'name': 'frame-0.jpg'}, {'name': 'frame-1.jpg'}]
+    generation = frame.Generation(frame.PillowBackend(), range(2), range(2),
+                                  1, 4, None, [None], None, {}, entries)
+    frame.generate_pack(generation, source, tmp_path / 'a.pack', tmp_path,
+                        'pregen-')
+
+    staging_dir = mock_generate.call_args[0][1]
+    assert staging_dir.name.startswith('pregen-')
+    assert not staging_dir.exists()
+    assert mock_generate.call_args[1] == {'source': source,
+                                          'cancelled': None,
+                                          'workers': None}
+
+    path, written_source, _, frames = mock_write.call_args[0]
+    assert (path, written_source) == (tmp_path / 'a.pack', source)
+    assert frames[1] == (staging_dir / 'frame-1.jpg', entries[1])
+
+
+def make_generation(levels):
+    """
+    Generate unscaled JPEG frames of the given blur levels with Pillow.
+    """
+    entries = [{'name': frame.get_frame_name(level), 'level': level,
+                'size': None, 'encoding': 'jpeg'} for level in levels]
+    return frame.Generation(frame.PillowBackend(), levels, levels,
+                            max(levels), 4, None, [None], None, {}, entries)
+
+
+def test_convert_backend_skips_finished_frames(mocker, tmp_path):
+    mock_generate = mocker.patch('blurwal.frame.generate')
+    (tmp_path / 'frame-0.jpg').write_bytes(b'finished')
+    (tmp_path / 'frame-1.tmp.jpg').write_bytes(b'torn')
+
+    frame.ConvertBackend().generate(tmp_path, range(3), 2, 4)
+    assert [call[0][1] for call in mock_generate.call_args_list] == [1, 2]
+
+
+def test_generate_pack_resumes_unfinished_generation(shared_datadir,
+                                                     tmp_path):
+    source = str(shared_datadir / 'cache_dir/frame-0.jpg')
+    pack_path = tmp_path / 'frames.pack'
+
+    partial_dir = tmp_path / 'partial-frames'
+    partial_dir.mkdir()
+    (partial_dir / 'frame-0.jpg').write_bytes(b'finished')
+
+    frame.generate_pack(make_generation(range(3)), source, pack_path,
+                        tmp_path)
+
+    with pack.Pack(pack_path) as frames:
+        assert bytes(frames.get('frame-0.jpg')) == b'finished'
+        assert frames.entries['frame-2.jpg']['length'] > 0
+    assert not partial_dir.exists()
+
+
+def test_generate_pack_keeps_frames_when_cancelled(shared_datadir, tmp_path):
+    source = str(shared_datadir / 'cache_dir/frame-0.jpg')
+    cancelled = threading.Event()
+    cancelled.set()
+
+    with pytest.raises(frame.GenerationCancelled):
+        frame.generate_pack(make_generation(range(3)), source,
+                            tmp_path / 'frames.pack', tmp_path,
+                            cancelled=cancelled)
+
+    assert (tmp_path / 'partial-frames').is_dir()
+    assert not (tmp_path / 'frames.pack').exists()
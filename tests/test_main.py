@@ -6,11 +6,13 @@ License: MIT
 """
 
 import logging
+import subprocess
+import sys
 
 import pytest
 
 import blurwal.__main__
-from blurwal import paths
+from blurwal import control, paths
 
 
 def test_parse_args_exits_when_steps_below_2():
@@ -18,6 +20,40 @@ def test_parse_args_exits_when_steps_below_2():
         blurwal.__main__.parse_args(['-s', '1'])
 
 
+def test_parse_args_exits_when_keyframes_below_2():
+    with pytest.raises(SystemExit):
+        blurwal.__main__.parse_args(['--keyframes', '1'])
+
+
+def test_parse_args_exits_when_pregenerate_jobs_below_1():
+    with pytest.raises(SystemExit):
+        blurwal.__main__.parse_args(['--pregenerate-jobs', '0'])
+
+
+def test_ctl_sends_reload_parameters(mocker, capsys):
+    mock_request = mocker.patch('blurwal.control.request',
+                                return_value={'changed': ['steps']})
+
+    assert blurwal.__main__.ctl(['reload', '-s', '20', '-i', 'Conky']) == 0
+    mock_request.assert_called_once_with(
+        'reload', paths.CONTROL_SOCKET,
+        parameters={'steps': 20, 'ignore': ['Conky']})
+    assert '"steps"' in capsys.readouterr().out
+
+
+def test_ctl_fails_without_daemon(mocker, capsys):
+    mocker.patch('blurwal.control.request',
+                 side_effect=control.ControlError('Not running.'))
+
+    assert blurwal.__main__.ctl(['status']) == 1
+    assert 'Not running.' in capsys.readouterr().err
+
+
+def test_ctl_exits_when_reload_without_parameters():
+    with pytest.raises(SystemExit):
+        blurwal.__main__.ctl(['reload'])
+
+
 def test_parse_args_verbose_sets_log_level():
     blurwal.__main__.parse_args(['--verbose'])
     assert logging.getLogger().getEffectiveLevel() == logging.INFO
@@ -33,17 +69,14 @@ def test_prepare_environment_creates_directories(mocker, tmp_path):
 
     # Should create blurwal/ subdirectory in ~/.cache
     mocker.patch('blurwal.paths.CACHE_DIR', tmp_path / '.cache/blurwal')
-    # Should create blurwal/ subdirectory in temp directory
-    mocker.patch('blurwal.paths.TEMP_DIR', tmp_path / 'blurwal')
 
     blurwal.__main__.prepare_environment()
 
     assert paths.CACHE_DIR.is_dir()
-    assert paths.TEMP_DIR.is_dir()
 
 
 def test_main_restores_original_when_transition(mocker):
-    mocker.patch('blurwal.__main__.Blur')
+    mocker.patch('blurwal.blur.Blur')
     mocker.patch('blurwal.__main__.parse_args')
     mocker.patch('blurwal.__main__.prepare_environment')
 
@@ -54,7 +87,7 @@ def test_main_restores_original_when_transition(mocker):
 
 
 def test_main_sets_original_when_not_transition(mocker):
-    mocker.patch('blurwal.__main__.Blur')
+    mocker.patch('blurwal.blur.Blur')
     mocker.patch('blurwal.__main__.parse_args')
     mocker.patch('blurwal.__main__.prepare_environment')
 
@@ -63,3 +96,15 @@ def test_main_sets_original_when_not_transition(mocker):
     mock_set_original = mocker.patch('blurwal.wallpaper.set_original')
     blurwal.__main__.main()
     mock_set_original.assert_called_once_with('image.png')
+
+
+def test_main_module_imports_no_daemon_modules():
+    # Imported by every invocation including ctl (see benchmarks/test_startup)
+    script = ('import sys, blurwal.__main__; '
+              'print(*sorted(sys.modules))')
+    modules = subprocess.run([sys.executable, '-c', script], check=True,
+                             stdout=subprocess.PIPE).stdout.decode().split()
+
+    for module in ('Xlib', 'ewmh', 'asyncio', 'multiprocessing', 'PIL',
+                   'blurwal.blur'):
+        assert module not in modules
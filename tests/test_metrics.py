@@ -0,0 +1,101 @@
+"""
+Test cases for the latency metrics.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import json
+
+import pytest
+from pytest import approx
+
+from blurwal import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.close_log()
+    metrics.reset()
+
+
+def test_histogram_summary():
+    histogram = metrics.Histogram()
+    for value in range(1, 101):
+        histogram.add(value / 1000)
+
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['mean'] == approx(0.0505)
+    assert (summary['p50'], summary['p90'], summary['p99']) == \
+        (0.05, 0.09, 0.099)
+    assert summary['max'] == 0.1
+
+
+def test_histogram_keeps_recent_samples():
+    histogram = metrics.Histogram(size=2)
+    for value in (5, 1, 2):
+        histogram.add(value)
+
+    assert histogram.summary()['count'] == 3
+    assert histogram.summary()['max'] == 2
+
+
+def test_histogram_without_samples():
+    assert metrics.Histogram().summary() == \
+        {'count': 0, 'mean': 0, 'p50': 0, 'p90': 0, 'p99': 0, 'max': 0}
+
+
+def test_record_and_count():
+    metrics.record('setter_step', 0.01)
+    metrics.record('setter_step', 0.03)
+    metrics.count('dropped_frames', 2)
+    metrics.count('dropped_frames', 0)
+
+    summary = metrics.get_summary()
+    assert summary['histograms']['setter_step']['mean'] == approx(0.02)
+    assert summary['counters'] == {'dropped_frames': 2}
+
+
+def test_timer_records_block(mocker):
+    mocker.patch('time.perf_counter', side_effect=[1.0, 1.25])
+
+    with metrics.timer('window_count'):
+        pass
+
+    assert metrics.get_summary()['histograms']['window_count']['max'] == 0.25
+
+
+def test_timer_ignores_failed_block():
+    with pytest.raises(ValueError):
+        with metrics.timer('generation'):
+            raise ValueError
+
+    assert metrics.get_summary()['histograms'] == {}
+
+
+def test_log_writes_json_lines(tmp_path):
+    log = tmp_path / 'metrics.jsonl'
+    metrics.open_log(log)
+
+    metrics.record('generation_level', 0.5, level=3)
+    metrics.count('dropped_frames')
+    metrics.close_log()
+    metrics.record('generation_level', 0.5, level=4)
+
+    entries = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [(e['metric'], e['value']) for e in entries] == \
+        [('generation_level', 0.5), ('dropped_frames', 1)]
+    assert entries[0]['level'] == 3
+
+
+def test_dump(capsys):
+    metrics.record('setter_step', 0.002)
+    metrics.count('dropped_frames', 3)
+
+    metrics.dump()
+    output = capsys.readouterr().out
+    assert 'setter_step: n=1 mean=2.00' in output
+    assert 'dropped_frames: 3' in output
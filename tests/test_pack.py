@@ -0,0 +1,103 @@
+"""
+Test cases for frame packs.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import hashlib
+
+import pytest
+
+from blurwal import pack
+
+PARAMETERS = {'steps': 2, 'sigma': 4, 'backend': 'pillow',
+              'cascade': None, 'version': '1.0.3'}
+
+
+FRAME_NAMES = [f'frame-{level}.jpg' for level in range(3)]
+
+
+@pytest.fixture
+def pack_path(tmp_path):
+    """
+    Write a pack of three small frames and return its path.
+    """
+    frames = []
+    for level, name in enumerate(FRAME_NAMES):
+        path = tmp_path / name
+        path.write_bytes(bytes([level]) * (level + 1))
+        frames.append((path, {'name': name, 'level': level,
+                              'encoding': 'jpeg'}))
+
+    path = tmp_path / 'frames.pack'
+    pack.write(path, str(tmp_path / 'frame-0.jpg'), PARAMETERS, frames)
+    return path
+
+
+def test_get_checksum(tmp_path):
+    file = tmp_path / 'file'
+    file.write_bytes(b'wallpaper')
+    assert pack.get_checksum(file) == \
+        hashlib.sha256(b'wallpaper').hexdigest()
+
+
+def test_pack_records_source_parameters_and_frames(pack_path):
+    with pack.Pack(pack_path) as frames:
+        assert frames.source == \
+            pack.get_checksum(pack_path.parent / 'frame-0.jpg')
+        assert frames.parameters == PARAMETERS
+        assert sorted(frames.entries) == FRAME_NAMES
+        assert frames.entries['frame-1.jpg']['level'] == 1
+
+
+def test_pack_roundtrips_frames(pack_path):
+    with pack.Pack(pack_path) as frames:
+        for level, name in enumerate(FRAME_NAMES):
+            with frames.get(name) as data:
+                assert bytes(data) == bytes([level]) * (level + 1)
+
+
+def test_pack_aligns_frames(pack_path):
+    with pack.Pack(pack_path) as frames:
+        assert all(entry['offset'] % pack.ALIGNMENT == 0
+                   for entry in frames.entries.values())
+
+
+def test_write_replaces_pack_atomically(pack_path):
+    pack.write(pack_path, str(pack_path.parent / 'frame-0.jpg'), {}, [])
+
+    assert not pack_path.with_name('frames.pack.tmp').exists()
+    with pack.Pack(pack_path) as frames:
+        assert frames.entries == {}
+
+
+def test_verify_detects_damaged_frame(pack_path):
+    with pack.Pack(pack_path) as frames:
+        assert frames.verify()
+        offset = frames.entries['frame-2.jpg']['offset']
+
+    with open(pack_path, 'r+b') as file:
+        file.seek(offset)
+        file.write(b'\xff')
+
+    with pack.Pack(pack_path) as frames:
+        assert not frames.verify()
+
+
+def test_load_missing_pack(tmp_path):
+    assert pack.load(tmp_path / 'frames.pack') is None
+
+
+@pytest.mark.parametrize('content', [b'', b'BLURPACK', b'garbage' * 10])
+def test_load_invalid_pack(tmp_path, content):
+    (tmp_path / 'frames.pack').write_bytes(content)
+    assert pack.load(tmp_path / 'frames.pack') is None
+
+
+def test_load_truncated_pack(pack_path):
+    data = pack_path.read_bytes()
+    pack_path.write_bytes(data[:-10])
+
+    with pytest.raises(pack.PackError):
+        pack.Pack(pack_path)
@@ -0,0 +1,60 @@
+"""
+Test cases for querying the outputs' geometry.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from blurwal import screen
+from blurwal.screen import Output
+
+
+@pytest.fixture
+def display():
+    """
+    Mock a display with a 3200x1080 screen and no extensions.
+    """
+    display = mock.MagicMock()
+    display.screen().width_in_pixels = 3200
+    display.screen().height_in_pixels = 1080
+    display.has_extension.return_value = False
+    return display
+
+
+def test_get_outputs_from_xinerama(display):
+    display.has_extension.side_effect = lambda name: name == 'XINERAMA'
+    display.xinerama_is_active.return_value = 1
+    display.xinerama_query_screens.return_value = SimpleNamespace(screens=[
+        SimpleNamespace(x=1920, y=0, width=1280, height=1024),
+        SimpleNamespace(x=0, y=0, width=1920, height=1080)])
+
+    assert screen.get_outputs(display) == [Output(1920, 0, 1280, 1024),
+                                           Output(0, 0, 1920, 1080)]
+
+
+def test_get_outputs_from_enabled_crtcs(display):
+    display.has_extension.side_effect = lambda name: name == 'RANDR'
+    display.screen().root.xrandr_get_screen_resources.return_value = \
+        SimpleNamespace(crtcs=[63, 64, 65], config_timestamp=1)
+    display.xrandr_get_crtc_info.side_effect = [
+        SimpleNamespace(x=0, y=0, width=1920, height=1080, mode=70),
+        SimpleNamespace(x=0, y=0, width=0, height=0, mode=0),
+        SimpleNamespace(x=1920, y=0, width=1280, height=1024, mode=71)]
+
+    assert screen.get_outputs(display) == [Output(0, 0, 1920, 1080),
+                                           Output(1920, 0, 1280, 1024)]
+
+
+def test_get_outputs_falls_back_to_screen(display):
+    assert screen.get_outputs(display) == [Output(0, 0, 3200, 1080)]
+
+
+def test_get_sizes_deduplicates():
+    outputs = [Output(0, 0, 1920, 1080), Output(1920, 0, 1280, 1024),
+               Output(3200, 0, 1920, 1080)]
+    assert screen.get_sizes(outputs) == [(1280, 1024), (1920, 1080)]
@@ -0,0 +1,251 @@
+"""
+Test cases for the wallpaper setters.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from PIL import Image
+from Xlib import X, Xatom
+
+from blurwal import pack, setter
+from blurwal.crossfade import Interpolation
+from blurwal.screen import Output
+from blurwal.transition import SETTER_EXECUTOR
+
+
+def make_display():
+    """
+    Mock a display with a 32x18 24-bit TrueColor root window.
+    """
+    visual = SimpleNamespace(visual_id=33, red_mask=0xff0000,
+                             green_mask=0xff00, blue_mask=0xff)
+    screen = mock.MagicMock(width_in_pixels=32, height_in_pixels=18,
+                            root_depth=24, root_visual=33,
+                            allowed_depths=[SimpleNamespace(visuals=[visual])])
+
+    display = mock.MagicMock()
+    display.screen.return_value = screen
+    display.info = SimpleNamespace(
+        pixmap_formats=[SimpleNamespace(depth=24, bits_per_pixel=32)],
+        image_byte_order=X.LSBFirst, max_request_length=100)
+    display.intern_atom.side_effect = ['_XROOTPMAP_ID']
+    return display
+
+
+@pytest.fixture
+def display():
+    return make_display()
+
+
+@pytest.fixture
+def upload_display(mocker):
+    """
+    Mock the connection opened for uploading frames.
+    """
+    upload_display = make_display()
+    mocker.patch('Xlib.display.Display', return_value=upload_display)
+    return upload_display
+
+
+def pack_frames(frame_dir, pack_path):
+    """
+    Pack all frames in the given directory and open the pack.
+    """
+    frames = [(path, {'name': path.name})
+              for path in sorted(frame_dir.glob('frame-*'))]
+    pack.write(pack_path, str(frames[0][0]), {}, frames)
+    return pack.Pack(pack_path)
+
+
+def test_feh_setter_runs_feh(mocker, tmp_path):
+    mock_change_to = mocker.patch('blurwal.wallpaper.change_to')
+    setter.FehSetter(tmp_path).show(3)
+    mock_change_to.assert_called_once_with(str(tmp_path / 'frame-3.jpg'))
+
+
+def test_feh_setter_passes_frame_per_output(mocker, tmp_path):
+    mock_change_to = mocker.patch('blurwal.wallpaper.change_to')
+    outputs = [Output(0, 0, 800, 600), Output(800, 0, 640, 480)]
+
+    setter.FehSetter(tmp_path, outputs).show(3)
+    mock_change_to.assert_called_once_with(
+        str(tmp_path / 'frame-3-800x600.jpg'),
+        str(tmp_path / 'frame-3-640x480.jpg'))
+
+
+def test_get_raw_mode(display):
+    assert setter.RootPixmapSetter.get_raw_mode(display) == 'BGRX'
+
+    display.info.image_byte_order = X.MSBFirst
+    assert setter.RootPixmapSetter.get_raw_mode(display) == 'XRGB'
+
+
+def test_get_raw_mode_unsupported_depth(display):
+    display.screen().root_depth = 16
+    assert setter.RootPixmapSetter.get_raw_mode(display) is None
+
+
+def test_create_auto_prefers_root_pixmap(display, upload_display):
+    assert isinstance(setter.create('auto', display),
+                      setter.RootPixmapSetter)
+
+
+def test_create_auto_falls_back_to_feh(display):
+    display.screen().root_depth = 16
+    assert isinstance(setter.create('auto', display), setter.FehSetter)
+
+
+@pytest.mark.parametrize('name', ['auto', 'xroot'])
+def test_create_without_pillow_falls_back_to_feh(mocker, display, name):
+    mocker.patch('blurwal.setter.Image', None)
+    assert isinstance(setter.create(name, display), setter.FehSetter)
+
+
+def test_create_xroot_falls_back_to_feh(display):
+    display.screen().root_depth = 16
+    assert isinstance(setter.create('xroot', display), setter.FehSetter)
+
+
+def test_root_pixmap_setter_uploads_in_chunks(display, shared_datadir):
+    frame_dir = shared_datadir / 'cache_dir'
+    frames = pack_frames(frame_dir, shared_datadir / 'frames.pack')
+
+    root_setter = setter.RootPixmapSetter(display)
+    root_setter.load(frames, frame_dir, 2)
+
+    pixmap = display.screen().root.create_pixmap.return_value
+    assert display.screen().root.create_pixmap.call_count == 3
+
+    # 100 * 4 - 28 bytes per request fit 2 rows of 32 pixels
+    assert pixmap.put_image.call_count == 3 * 9
+    assert all(len(call[0][8]) == 2 * 32 * 4
+               for call in pixmap.put_image.call_args_list)
+
+
+def test_root_pixmap_setter_show(display, shared_datadir):
+    frame_dir = shared_datadir / 'cache_dir'
+    frames = pack_frames(frame_dir, shared_datadir / 'frames.pack')
+
+    root_setter = setter.RootPixmapSetter(display)
+    root_setter.load(frames, frame_dir, 1)
+    root = display.screen().root
+    pixmap = root.create_pixmap.return_value
+
+    root_setter.show(1)
+
+    # ESETROOT_PMAP_ID is left to feh, which would otherwise kill the
+    # client owning the pixmap, i.e. blurwal's connection
+    root.change_property.assert_called_once_with(
+        '_XROOTPMAP_ID', Xatom.PIXMAP, 32, [pixmap.id])
+    root.change_attributes.assert_called_once_with(background_pixmap=pixmap)
+    root.clear_area.assert_called_once()
+
+
+def test_root_pixmap_setter_clamps_levels_beyond_frames(display,
+                                                        shared_datadir):
+    frame_dir = shared_datadir / 'cache_dir'
+    frames = pack_frames(frame_dir, shared_datadir / 'frames.pack')
+    root = display.screen().root
+    root.create_pixmap.side_effect = [mock.Mock(id=0), mock.Mock(id=1)]
+
+    root_setter = setter.RootPixmapSetter(display)
+    root_setter.show(1)
+    root.change_property.assert_not_called()
+
+    root_setter.load(frames, frame_dir, 1)
+    root_setter.show(10)
+    root.change_property.assert_called_once_with(
+        '_XROOTPMAP_ID', Xatom.PIXMAP, 32, [1])
+
+
+def test_root_pixmap_setter_uploads_off_the_display(display, upload_display,
+                                                    shared_datadir):
+    frame_dir = shared_datadir / 'cache_dir'
+    frames = pack_frames(frame_dir, shared_datadir / 'frames.pack')
+    root_setter = setter.create('xroot', display)
+
+    # Frames are loaded on the setter's thread (see Blur.regenerate)
+    display.reset_mock()
+    SETTER_EXECUTOR.submit(root_setter.load, frames, frame_dir, 1).result()
+
+    assert display.mock_calls == []
+    assert upload_display.screen().root.create_pixmap.call_count == 2
+    upload_display.sync.assert_called_once()
+
+
+def test_root_pixmap_setter_persists_with_feh(mocker, display, tmp_path):
+    mock_change_to = mocker.patch('blurwal.wallpaper.change_to')
+    root_setter = setter.RootPixmapSetter(display)
+    root_setter.load(mock.Mock(), tmp_path, -1)
+
+    root_setter.persist(4)
+    mock_change_to.assert_called_once_with(str(tmp_path / 'frame-4.jpg'))
+
+
+def test_root_pixmap_setter_composes_outputs(display, shared_datadir,
+                                             tmp_path):
+    for name in ('frame-0-16x18.jpg', 'frame-0-8x8.jpg'):
+        (tmp_path / name).write_bytes(
+            (shared_datadir / 'cache_dir/frame-0.jpg').read_bytes())
+
+    outputs = [Output(0, 0, 16, 18), Output(16, 4, 8, 8)]
+    root_setter = setter.RootPixmapSetter(display, outputs)
+    root_setter.load(pack_frames(tmp_path, tmp_path / 'frames.pack'),
+                     tmp_path, 0)
+
+    pixmap = display.screen().root.create_pixmap.return_value
+    display.screen().root.create_pixmap.assert_called_once_with(32, 18, 24)
+    pixmap.fill_rectangle.assert_called_once()
+
+    positions = {call[0][1:5] for call in pixmap.put_image.call_args_list}
+    # 100 * 4 - 28 bytes per request fit 5 rows of 16 pixels
+    assert positions == {(0, 0, 16, 5), (0, 5, 16, 5), (0, 10, 16, 5),
+                         (0, 15, 16, 3), (16, 4, 8, 8)}
+
+
+def test_root_pixmap_setter_sends_raw_frames(display, tmp_path):
+    data = bytes(range(256)) * (32 * 18 * 4 // 256)
+    (tmp_path / 'frame-0-32x18.bgrx').write_bytes(data)
+
+    root_setter = setter.RootPixmapSetter(display, [Output(0, 0, 32, 18)])
+    root_setter.load(pack_frames(tmp_path, tmp_path / 'frames.pack'),
+                     tmp_path, 0)
+
+    pixmap = display.screen().root.create_pixmap.return_value
+    uploaded = b''.join(call[0][8] for call in
+                        pixmap.put_image.call_args_list)
+    assert uploaded == data
+    assert root_setter.get_footprint() == 32 * 18 * 4
+
+
+def test_root_pixmap_setter_rejects_truncated_raw_frame(display, tmp_path):
+    (tmp_path / 'frame-0-32x18.bgrx').write_bytes(b'\0' * 100)
+
+    root_setter = setter.RootPixmapSetter(display, [Output(0, 0, 32, 18)])
+    with pytest.raises(ValueError):
+        root_setter.load(pack_frames(tmp_path, tmp_path / 'frames.pack'),
+                         tmp_path, 0)
+
+
+def test_root_pixmap_setter_loads_blended_frames_unencoded(mocker, display,
+                                                           tmp_path):
+    interpolation = mocker.Mock(spec=Interpolation)
+    interpolation.__contains__ = mocker.Mock(return_value=False)
+    interpolation.get_image.return_value = Image.new('RGB', (32, 18))
+
+    root_setter = setter.RootPixmapSetter(display, [Output(0, 0, 32, 18)])
+    root_setter.load(interpolation, tmp_path, 1)
+
+    assert interpolation.get_image.call_count == 2
+    interpolation.get.assert_not_called()
+
+
+def test_root_pixmap_setter_needs_endpoint_files(display):
+    root_setter = setter.RootPixmapSetter(display, [Output(0, 0, 32, 18)])
+    assert root_setter.get_file_levels(10) == [0, 10]
+    assert list(setter.FehSetter().get_file_levels(2)) == [0, 1, 2]
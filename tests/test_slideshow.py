@@ -0,0 +1,181 @@
+"""
+Test cases for pre-generating the frames of a slideshow directory.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from blurwal import cache, frame, pack, slideshow
+
+
+@pytest.fixture
+def generation():
+    """
+    Generate unscaled JPEG frames of 3 blur levels with Pillow.
+    """
+    entries = [{'name': frame.get_frame_name(level), 'level': level,
+                'size': None, 'encoding': 'jpeg'} for level in range(3)]
+    return frame.Generation(frame.PillowBackend(), range(3), range(3), 2, 4,
+                            None, [None], None, {'steps': 2}, entries)
+
+
+@pytest.fixture
+def wallpapers(shared_datadir, tmp_path):
+    """
+    A slideshow directory with two images and another file.
+    """
+    directory = tmp_path / 'wallpapers'
+    directory.mkdir()
+
+    for index in range(2):
+        shutil.copy(str(shared_datadir / f'cache_dir/frame-{index}.jpg'),
+                    str(directory / f'wallpaper-{index}.JPG'))
+
+    (directory / 'notes.txt').write_text('not an image')
+    return directory
+
+
+def test_get_images(wallpapers):
+    assert slideshow.get_images(wallpapers) == \
+        [wallpapers / 'wallpaper-0.JPG', wallpapers / 'wallpaper-1.JPG']
+
+
+def test_get_images_without_directory(tmp_path):
+    assert slideshow.get_images(tmp_path / 'missing') == []
+
+
+def test_lower_priority(mocker):
+    mock_setpriority = mocker.patch('os.setpriority')
+    mock_run = mocker.patch('subprocess.run',
+                            side_effect=subprocess.CalledProcessError(1, ''))
+
+    slideshow.lower_priority()
+
+    mock_setpriority.assert_called_once_with(os.PRIO_PROCESS, 0,
+                                             slideshow.NICENESS)
+    assert mock_run.call_args[0][0][:3] == ['ionice', '-c', '3']
+
+
+def test_pregenerate_adds_pack_to_cache(generation, wallpapers, tmp_path):
+    packs_dir = tmp_path / 'cache/packs'
+    source = wallpapers / 'wallpaper-0.JPG'
+
+    assert slideshow.pregenerate(generation, str(source), packs_dir)
+
+    pack_path = cache.get_pack_path(packs_dir, pack.get_checksum(source),
+                                    generation.parameters)
+    with pack.Pack(pack_path) as frames:
+        assert set(frames.entries) == \
+            {'frame-0.jpg', 'frame-1.jpg', 'frame-2.jpg'}
+        assert frames.verify()
+
+    assert not list(packs_dir.parent.glob(slideshow.STAGING_PREFIX + '*'))
+
+
+def test_pregenerate_generates_one_level_at_a_time(mocker, generation,
+                                                   wallpapers, tmp_path):
+    mock_generate = mocker.spy(generation.backend, 'generate')
+    source = wallpapers / 'wallpaper-0.JPG'
+
+    slideshow.pregenerate(generation, str(source), tmp_path / 'cache/packs')
+
+    assert mock_generate.call_count > 0
+    assert all(call[1]['workers'] == 1
+               for call in mock_generate.call_args_list)
+
+
+def test_pregenerate_skips_cached_wallpaper(mocker, generation, wallpapers,
+                                            tmp_path):
+    source = wallpapers / 'wallpaper-0.JPG'
+    pack_path = cache.get_pack_path(tmp_path, pack.get_checksum(source),
+                                    generation.parameters)
+    pack_path.write_bytes(b'cached')
+    mock_generate_pack = mocker.patch('blurwal.frame.generate_pack')
+
+    assert not slideshow.pregenerate(generation, str(source), tmp_path)
+    mock_generate_pack.assert_not_called()
+
+
+def test_pregenerator_queues_each_image_once(mocker, generation, wallpapers,
+                                             tmp_path):
+    mocker.patch('blurwal.watch.FileWatcher.is_available', return_value=False)
+    mock_pool = mocker.patch('multiprocessing.get_context').return_value.Pool
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    try:
+        pregenerator = slideshow.Pregenerator(wallpapers)
+        pregenerator.start(generation, tmp_path / 'packs', 0)
+        pregenerator.schedule([wallpapers / 'wallpaper-1.JPG'])
+
+        apply_async = mock_pool.return_value.apply_async
+        assert [call[0][1][1] for call in apply_async.call_args_list] == \
+            [str(wallpapers / 'wallpaper-0.JPG'),
+             str(wallpapers / 'wallpaper-1.JPG')]
+
+        pregenerator.finish(wallpapers / 'wallpaper-1.JPG', True)
+        pregenerator.schedule([wallpapers / 'wallpaper-1.JPG'])
+        assert apply_async.call_count == 3
+
+        pregenerator.stop()
+        mock_pool.return_value.terminate.assert_called_once()
+    finally:
+        loop.close()
+
+
+def test_pregenerator_evicts_keeping_pack_in_use(mocker, generation,
+                                                 wallpapers, tmp_path):
+    mocker.patch('blurwal.watch.FileWatcher.is_available', return_value=False)
+    mocker.patch('multiprocessing.get_context')
+    mock_evict = mocker.patch('blurwal.cache.evict')
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    try:
+        in_use = tmp_path / 'packs/in-use.pack'
+        pregenerator = slideshow.Pregenerator(wallpapers,
+                                              get_pack_in_use=lambda: in_use)
+        pregenerator.start(generation, tmp_path / 'packs', 100)
+
+        pregenerator.finish(wallpapers / 'wallpaper-0.JPG', False)
+        mock_evict.assert_not_called()
+
+        pregenerator.finish(wallpapers / 'wallpaper-1.JPG', True)
+        mock_evict.assert_called_once_with(tmp_path / 'packs', 100,
+                                           keep=in_use)
+        pregenerator.stop()
+    finally:
+        loop.close()
+
+
+def test_pregenerator_stop_deletes_incomplete_packs(mocker, generation,
+                                                    wallpapers, tmp_path):
+    mocker.patch('blurwal.watch.FileWatcher.is_available', return_value=False)
+    mocker.patch('multiprocessing.get_context')
+    mocker.patch('blurwal.cache.is_running', return_value=False)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    try:
+        packs_dir = tmp_path / 'packs'
+        pregenerator = slideshow.Pregenerator(wallpapers)
+        pregenerator.start(generation, packs_dir, 0)
+
+        # A worker is terminated while writing its pack
+        packs_dir.mkdir()
+        (packs_dir / 'key.pack.12345.tmp').write_bytes(b'partial')
+        pregenerator.stop()
+
+        assert not list(packs_dir.iterdir())
+    finally:
+        loop.close()
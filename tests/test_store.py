@@ -0,0 +1,118 @@
+"""
+Test cases for the frame set storage.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import os
+import time
+
+from blurwal import store
+
+
+def make_set(cache_dir, content):
+    staging_dir = store.create_staging(cache_dir)
+    (staging_dir / 'frame-0.jpg').write_text(content)
+    return staging_dir
+
+
+def test_create_staging_in_cache_dir(tmp_path):
+    staging_dir = store.create_staging(tmp_path)
+    assert staging_dir.is_dir()
+    assert staging_dir.parent == tmp_path
+    assert staging_dir.name.startswith(store.SET_PREFIX)
+
+
+def test_activate_links_frames_dir(tmp_path):
+    frames_dir = tmp_path / 'frames'
+    staging_dir = make_set(tmp_path, 'first')
+
+    store.activate(staging_dir, frames_dir)
+
+    assert frames_dir.is_symlink()
+    assert store.get_active(frames_dir) == staging_dir
+    assert (frames_dir / 'frame-0.jpg').read_text() == 'first'
+
+
+def test_activate_replaces_and_discards_previous_set(tmp_path):
+    frames_dir = tmp_path / 'frames'
+    first = make_set(tmp_path, 'first')
+    store.activate(first, frames_dir)
+
+    second = make_set(tmp_path, 'second')
+    store.activate(second, frames_dir)
+
+    assert (frames_dir / 'frame-0.jpg').read_text() == 'second'
+    assert not first.exists()
+    assert not (tmp_path / 'frames.tmp').exists()
+
+
+def test_activate_discards_abandoned_sets(tmp_path):
+    abandoned = make_set(tmp_path, 'abandoned')
+    staging_dir = make_set(tmp_path, 'new')
+
+    store.activate(staging_dir, tmp_path / 'frames')
+    assert not abandoned.exists()
+
+
+def test_activate_keeps_sets_with_other_prefix(tmp_path):
+    other = store.create_staging(tmp_path, 'pregen-')
+    staging_dir = make_set(tmp_path, 'new')
+
+    store.activate(staging_dir, tmp_path / 'frames')
+    assert other.exists()
+
+
+def test_activate_replaces_plain_directory(tmp_path):
+    frames_dir = tmp_path / 'frames'
+    frames_dir.mkdir()
+    (frames_dir / 'frame-0.jpg').write_text('old')
+
+    store.activate(make_set(tmp_path, 'new'), frames_dir)
+    assert (frames_dir / 'frame-0.jpg').read_text() == 'new'
+
+
+def test_get_active_without_set(tmp_path):
+    assert store.get_active(tmp_path / 'frames') is None
+
+
+def test_activate_links_set_outside_cache(tmp_path):
+    (tmp_path / 'cache').mkdir()
+    frames_dir = tmp_path / 'cache/frames'
+    first = make_set(tmp_path / 'cache', 'first')
+    store.activate(first, frames_dir)
+
+    second = make_set(tmp_path / 'shm', 'second')
+    store.activate(second, frames_dir)
+
+    assert store.get_active(frames_dir) == second
+    assert (frames_dir / 'frame-0.jpg').read_text() == 'second'
+    assert not first.exists()
+
+
+def test_get_footprint(tmp_path):
+    staging_dir = make_set(tmp_path, '12345')
+    (staging_dir / 'manifest.json').write_text('{}')
+    assert store.get_footprint(staging_dir) == 7
+
+
+def test_create_partial_keeps_finished_frames(tmp_path):
+    partial_dir = store.create_partial('key', tmp_path)
+    (partial_dir / 'frame-0.jpg').write_text('finished')
+
+    assert store.create_partial('key', tmp_path) == partial_dir
+    assert (partial_dir / 'frame-0.jpg').read_text() == 'finished'
+    assert partial_dir.name == store.PARTIAL_PREFIX + 'key'
+
+
+def test_discard_stale_keeps_recent_partial_sets(tmp_path):
+    stale = store.create_partial('stale', tmp_path)
+    recent = store.create_partial('recent', tmp_path)
+
+    past = time.time() - store.PARTIAL_MAX_AGE - 1
+    os.utime(str(stale), (past, past))
+
+    store.discard_stale(tmp_path)
+    assert not stale.exists()
+    assert recent.exists()
@@ -1,43 +1,222 @@
 """
-Test cases for the transition thread.
+Test cases for transitions and their scheduling.
 
 Author: Benedikt Vollmerhaus
 License: MIT
 """
 
+import asyncio
 import time
 from unittest import mock
 
-from blurwal.transition import Transition
+import pytest
+from pytest import approx
 
+from blurwal import metrics
+from blurwal.transition import EASINGS, Schedule, Timing, Transition
 
-def change_to_with_delay(_path: str):
+
+def run(coroutine):
     """
-    Mock wallpaper.change_to with sleep to simulate feh doing work.
+    Run the given coroutine to completion on a new event loop.
     """
-    time.sleep(1)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def move(transition, level):
+    """
+    Retarget the given transition and run it until it reaches the level.
+    """
+    transition.retarget(level)
+    run(transition.move())
 
 
 @mock.patch('blurwal.wallpaper.change_to')
-def test_run_blur(mock_change_to):
-    thread = Transition(1, 9)
-    thread.start()
-    thread.join()  # Wait for thread completion
+def test_move_blur(mock_change_to):
+    move(Transition(level=1), 9)
     assert mock_change_to.call_count == 8
 
 
 @mock.patch('blurwal.wallpaper.change_to')
-def test_run_unblur(mock_change_to):
-    thread = Transition(8, 2)
-    thread.start()
-    thread.join()  # Wait for thread completion
+def test_move_unblur(mock_change_to):
+    move(Transition(level=8), 2)
     assert mock_change_to.call_count == 6
 
 
-@mock.patch('blurwal.wallpaper.change_to', side_effect=change_to_with_delay)
-def test_stop_cancels_transition(mock_change_to):
-    thread = Transition(0, 10)
-    thread.start()
-    thread.stop()
-    assert thread.is_stopped()
-    assert mock_change_to.call_count == 1
+def test_move_persists_target_level():
+    mock_setter = mock.Mock(is_blocking=False)
+    move(Transition(mock_setter), 3)
+    assert mock_setter.show.call_count == 3
+    mock_setter.persist.assert_called_once_with(3)
+
+
+def test_move_calls_on_show_after_each_frame():
+    mock_setter = mock.Mock(is_blocking=False)
+    mock_on_show = mock.Mock()
+    move(Transition(mock_setter, on_show=mock_on_show), 3)
+    assert mock_on_show.call_count == 3
+
+
+def test_move_to_current_level_does_nothing():
+    mock_setter = mock.Mock(is_blocking=False)
+    move(Transition(mock_setter, level=4), 4)
+    mock_setter.show.assert_not_called()
+    mock_setter.persist.assert_not_called()
+
+
+def test_retarget_reverses_mid_transition():
+    mock_setter = mock.Mock(is_blocking=False)
+    transition = Transition(mock_setter)
+
+    def show(level):
+        if level == 4:
+            transition.retarget(0)
+
+    mock_setter.show.side_effect = show
+    move(transition, 10)
+
+    shown = [c[0][0] for c in mock_setter.show.call_args_list]
+    assert shown == [1, 2, 3, 4, 3, 2, 1, 0]
+    mock_setter.persist.assert_called_once_with(0)
+
+
+def test_retarget_reverses_scheduled_transition():
+    mock_setter = mock.Mock(is_blocking=False)
+    transition = Transition(mock_setter, Timing(level_duration=0.002))
+
+    def show(level):
+        # Levels may be skipped on slow machines, so reverse on the first
+        # level past the middle instead of a fixed one
+        if level >= 5 and transition.target_level == 10:
+            transition.retarget(0)
+
+    mock_setter.show.side_effect = show
+    move(transition, 10)
+
+    shown = [c[0][0] for c in mock_setter.show.call_args_list]
+    assert max(shown) < 10
+    assert shown[-1] == 0
+    mock_setter.persist.assert_called_once_with(0)
+
+
+def test_move_records_step_latencies():
+    metrics.reset()
+    move(Transition(mock.Mock(is_blocking=False)), 3)
+
+    summary = metrics.get_summary()['histograms']
+    assert summary['setter_step']['count'] == 3
+    assert summary['decision_to_first_frame']['count'] == 1
+
+
+def test_reset_interrupts_without_persisting():
+    mock_setter = mock.Mock(is_blocking=False)
+    transition = Transition(mock_setter)
+
+    def show(level):
+        if level == 3:
+            transition.reset(0)
+
+    mock_setter.show.side_effect = show
+    move(transition, 10)
+
+    assert mock_setter.show.call_count == 3
+    assert transition.current_level == transition.target_level == 0
+    mock_setter.persist.assert_not_called()
+
+
+def test_stop_cancels_transition():
+    mock_setter = mock.Mock(is_blocking=False)
+    transition = Transition(mock_setter)
+    mock_setter.show.side_effect = lambda _level: transition.stop()
+
+    async def start_and_wait():
+        transition.start()
+        await asyncio.sleep(0)
+        transition.retarget(10)
+        with pytest.raises(asyncio.CancelledError):
+            await transition._task
+
+    run(start_and_wait())
+    assert transition.is_stopped()
+    assert mock_setter.show.call_count == 1
+    mock_setter.persist.assert_not_called()
+
+
+def test_toggling_never_overlaps_setter_calls():
+    active = []
+
+    def show(_level):
+        active.append(1)
+        assert len(active) == 1
+        time.sleep(0.001)
+        active.pop()
+
+    mock_setter = mock.Mock(is_blocking=True)
+    mock_setter.show.side_effect = show
+    transition = Transition(mock_setter)
+
+    async def toggle():
+        transition.start()
+        for _ in range(5):
+            transition.retarget(10)
+            await asyncio.sleep(0.002)
+            transition.retarget(0)
+            await asyncio.sleep(0.002)
+
+        while transition.current_level != 0:
+            await asyncio.sleep(0.001)
+        transition.stop()
+
+    run(toggle())
+    assert mock_setter.show.call_count > 2
+    assert transition.current_level == 0
+
+
+def test_schedule_maps_elapsed_time_to_level():
+    schedule = Schedule(0, 10, Timing(level_duration=0.1))
+    assert schedule.duration == approx(1)
+    assert schedule.level_at(0) == 0
+    assert schedule.level_at(0.5) == 5
+    assert schedule.level_at(1) == 10
+    assert schedule.level_at(3) == 10
+
+
+def test_schedule_unblur_with_easing():
+    schedule = Schedule(8, 2, Timing(0.1, EASINGS['ease-in']))
+    assert schedule.duration == approx(0.6)
+    assert schedule.level_at(0.45) == 8 - 3  # 6 * 0.75²
+    assert schedule.level_at(0.6) == 2
+
+
+def test_schedule_ticks_at_fps():
+    schedule = Schedule(0, 10, Timing(0.1, fps=20))
+    assert schedule.interval == approx(0.05)
+    assert schedule.next_tick(0.12) == approx(0.15)
+
+
+def test_easings_span_unit_interval():
+    for easing in EASINGS.values():
+        assert easing(0) == 0
+        assert easing(1) == 1
+
+
+def test_run_scheduled_keeps_duration_and_drops_frames():
+    def slow_show(_level):
+        time.sleep(0.03)
+
+    mock_setter = mock.Mock(is_blocking=True)
+    mock_setter.show.side_effect = slow_show
+
+    transition = Transition(mock_setter, Timing(level_duration=0.005))
+    start = time.monotonic()
+    move(transition, 20)
+
+    assert time.monotonic() - start < 0.3
+    assert transition.current_level == 20
+    assert transition.dropped_frames > 0
+    assert mock_setter.show.call_count + transition.dropped_frames == 20
+    mock_setter.persist.assert_called_once_with(20)
@@ -42,3 +42,10 @@ def test_show_notification(mocker):
 def test_show_notification_libnotify_is_optional(mocker):
     mocker.patch('subprocess.run', side_effect=FileNotFoundError())
     utils.show_notification('A Title', 'Hello World')
+
+
+def test_format_size():
+    assert utils.format_size(1000) == '1000 B'
+    assert utils.format_size(1536) == '1.5 KiB'
+    assert utils.format_size(80 * 1024 ** 2) == '80.0 MiB'
+    assert utils.format_size(3 * 1024 ** 4) == '3072.0 GiB'
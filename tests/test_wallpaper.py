@@ -19,12 +19,25 @@ def test_change_to_runs_feh(mocker):
         ['feh', '--bg-fill', '~/images/wallpaper.png'])
 
 
+def test_change_to_runs_feh_per_output(mocker):
+    mock_run = mocker.patch('subprocess.run')
+    wallpaper.change_to('left.jpg', 'right.jpg')
+    mock_run.assert_called_once_with(
+        ['feh', '--bg-fill', 'left.jpg', 'right.jpg'])
+
+
 def test_is_transition(mocker):
     mocker.patch('blurwal.wallpaper.get_current',
                  return_value=str(paths.CACHE_DIR / 'frame-4.png'))
     assert wallpaper.is_transition()
 
 
+def test_is_transition_in_frame_set(mocker):
+    mocker.patch('blurwal.wallpaper.get_current',
+                 return_value=str(paths.FRAMES_DIR / 'frame-4.jpg'))
+    assert wallpaper.is_transition()
+
+
 def test_is_transition_false_when_name_not_frame(mocker):
     mocker.patch('blurwal.wallpaper.get_current',
                  return_value=str(paths.CACHE_DIR / 'wallpaper.png'))
@@ -85,3 +98,58 @@ def test_restore_original_exits_when_missing(mocker):
                  side_effect=FileNotFoundError())
     with pytest.raises(SystemExit):
         wallpaper.restore_original()
+
+
+@pytest.fixture
+def state_files(mocker, tmp_path):
+    """
+    Use a temporary ~/.fehbg and original path storage file.
+    """
+    fehbg_file = tmp_path / '.fehbg'
+    fehbg_file.write_text("feh --bg-fill '/images/original.png'")
+    original_path = tmp_path / 'original-path'
+    original_path.write_text('/images/original.png')
+
+    mocker.patch('blurwal.paths.FEHBG_FILE', fehbg_file)
+    mocker.patch('blurwal.paths.ORIGINAL_PATH', original_path)
+    return fehbg_file
+
+
+def test_state_reads_files_once(mocker, state_files):
+    state = wallpaper.State()
+    assert state.current == '/images/original.png'
+    assert state.original == '/images/original.png'
+
+    mock_get_current = mocker.patch('blurwal.wallpaper.get_current')
+    mock_get_original = mocker.patch('blurwal.wallpaper.get_original')
+
+    assert not state.refresh()
+    assert not state.changed_externally()
+    mock_get_current.assert_not_called()
+    mock_get_original.assert_not_called()
+
+
+def test_state_refresh_rereads_changed_fehbg(state_files):
+    state = wallpaper.State()
+
+    state_files.write_text("feh --bg-fill '/images/other-wallpaper.png'")
+    assert state.refresh()
+    assert state.current == '/images/other-wallpaper.png'
+    assert state.changed_externally()
+
+
+def test_state_transition_frame_is_not_external_change(state_files):
+    state = wallpaper.State()
+
+    frame = paths.CACHE_DIR / 'frame-3.jpg'
+    state_files.write_text(f"feh --bg-fill '{frame}' # changed")
+    assert state.refresh()
+    assert state.is_transition
+    assert not state.changed_externally()
+
+
+def test_state_set_original(state_files):
+    state = wallpaper.State()
+    state.set_original('/images/new.png')
+    assert state.original == '/images/new.png'
+    assert paths.ORIGINAL_PATH.read_text() == '/images/new.png'
@@ -0,0 +1,78 @@
+"""
+Test cases for the inotify file watcher.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+import os
+import select
+
+import pytest
+
+from blurwal import watch
+
+pytestmark = pytest.mark.skipif(not watch.FileWatcher.is_available(),
+                                reason='inotify not available')
+
+
+@pytest.fixture
+def watcher():
+    file_watcher = watch.FileWatcher()
+    yield file_watcher
+    file_watcher.close()
+
+
+def is_readable(watcher):
+    return bool(select.select([watcher], [], [], 1)[0])
+
+
+def test_reports_written_file(watcher, tmp_path):
+    fehbg = tmp_path / '.fehbg'
+    fehbg.write_text('old')
+    watcher.watch([fehbg])
+
+    fehbg.write_text('new')
+    assert is_readable(watcher)
+    assert watcher.read_changes() == {fehbg}
+
+
+def test_reports_file_replaced_by_rename(watcher, tmp_path):
+    original = tmp_path / 'wallpaper.png'
+    original.write_bytes(b'old')
+    watcher.watch([original])
+
+    replacement = tmp_path / 'wallpaper.png.tmp'
+    replacement.write_bytes(b'new')
+    os.replace(str(replacement), str(original))
+
+    assert is_readable(watcher)
+    assert watcher.read_changes() == {original}
+
+
+def test_ignores_unwatched_files(watcher, tmp_path):
+    watcher.watch([tmp_path / '.fehbg'])
+    (tmp_path / 'other').write_text('changed')
+
+    assert watcher.read_changes() == set()
+
+
+def test_watch_replaces_previous_files(watcher, tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    watcher.watch([tmp_path / 'a/original.png'])
+    watcher.watch([tmp_path / 'b/original.png'])
+
+    (tmp_path / 'a/original.png').write_bytes(b'old wallpaper')
+    (tmp_path / 'b/original.png').write_bytes(b'new wallpaper')
+
+    assert is_readable(watcher)
+    assert watcher.read_changes() == {tmp_path / 'b/original.png'}
+
+
+def test_reports_any_file_in_watched_directory(watcher, tmp_path):
+    watcher.watch([], [tmp_path])
+
+    (tmp_path / 'new.png').write_bytes(b'new wallpaper')
+    assert is_readable(watcher)
+    assert watcher.read_changes() == {tmp_path / 'new.png'}
@@ -0,0 +1,202 @@
+"""
+Test cases for the window module.
+
+Author: Benedikt Vollmerhaus
+License: MIT
+"""
+
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+import Xlib.error
+from Xlib import X, Xatom
+
+from blurwal import window
+
+ATOMS = {'_NET_CLIENT_LIST': 1, '_NET_CURRENT_DESKTOP': 2,
+         '_NET_WM_DESKTOP': 3}
+
+
+class FakeEWMH:
+    """
+    An EWMH with clients given as {window id: (workspace, class)}.
+    """
+
+    def __init__(self, clients, current_desktop=0):
+        self.clients = clients
+        self.current_desktop = current_desktop
+
+        self.display = mock.Mock()
+        self.display.intern_atom.side_effect = ATOMS.get
+        self.display.get_atom.side_effect = ATOMS.get
+        self.root = mock.Mock()
+        self.requests = 0
+
+    def make_window(self, window_id):
+        fake = mock.Mock(id=window_id)
+        fake.get_wm_class.side_effect = \
+            lambda: (None, self.clients[window_id][1])
+        return fake
+
+    def getClientList(self):
+        self.requests += 1
+        return [self.make_window(i) for i in self.clients]
+
+    def getCurrentDesktop(self):
+        self.requests += 1
+        return self.current_desktop
+
+    def getWmDesktop(self, win):
+        self.requests += 1
+        return self.clients[win.id][0]
+
+    def get_property(self, **keys):
+        """
+        Fake a deferred GetProperty request on one of the clients.
+        """
+        self.requests += 1
+        return FakePropertyRequest(self, keys['window'], keys['property'])
+
+
+class FakePropertyRequest:
+    """
+    A GetProperty request whose reply is only looked up on reply().
+    """
+
+    def __init__(self, ewmh, window_id, atom):
+        self.ewmh = ewmh
+        self.window_id = window_id
+        self.atom = atom
+        self.property_type = 0
+        self.value = None
+
+    def reply(self):
+        self.ewmh.replies += 1
+        if self.window_id not in self.ewmh.clients:
+            raise Xlib.error.BadWindow.__new__(Xlib.error.BadWindow)
+
+        workspace, wm_class = self.ewmh.clients[self.window_id]
+        if self.atom == Xatom.WM_CLASS:
+            self.value = (8, f'{wm_class}\0{wm_class}\0'.encode())
+        elif workspace is not None:
+            self.value = (32, [workspace])
+
+        self.property_type = 1 if self.value else 0
+
+
+def property_event(atom, window_id=0):
+    return SimpleNamespace(type=X.PropertyNotify, atom=ATOMS[atom],
+                           window=SimpleNamespace(id=window_id))
+
+
+@pytest.fixture
+def ewmh(mocker):
+    fake_ewmh = FakeEWMH({1: (0, 'term'), 2: (0, 'browser'),
+                          3: (1, 'term'), 4: (0, 'bar')})
+    fake_ewmh.replies = 0
+    mocker.patch('Xlib.protocol.request.GetProperty',
+                 side_effect=fake_ewmh.get_property)
+    return fake_ewmh
+
+
+def test_count_on_current_ws(ewmh):
+    assert window.count_on_current_ws(['bar'], ewmh) == 2
+
+
+def test_window_index_counts_on_current_ws(ewmh):
+    index = window.WindowIndex(['bar'], ewmh)
+    index.rebuild()
+    assert index.count_on_current_ws() == 2
+
+
+def test_window_index_counts_without_requests(ewmh):
+    index = window.WindowIndex([], ewmh)
+    index.rebuild()
+
+    requests = ewmh.requests
+    index.count_on_current_ws()
+    assert ewmh.requests == requests
+
+
+def test_window_index_follows_current_desktop(ewmh):
+    index = window.WindowIndex([], ewmh)
+    index.rebuild()
+
+    ewmh.current_desktop = 1
+    assert index.handle_event(property_event('_NET_CURRENT_DESKTOP'))
+    assert index.count_on_current_ws() == 1
+
+
+def test_window_index_follows_client_list(ewmh):
+    index = window.WindowIndex([], ewmh)
+    index.rebuild()
+
+    del ewmh.clients[1]
+    ewmh.clients[5] = (0, 'editor')
+    ewmh.clients[6] = (0, 'editor')
+
+    requests = ewmh.requests
+    assert index.handle_event(property_event('_NET_CLIENT_LIST'))
+    assert index.count_on_current_ws() == 4
+
+    # Only the client list and the two added windows are queried
+    assert ewmh.requests - requests == 1 + 2 * 2
+
+
+def test_window_index_follows_wm_desktop(ewmh):
+    index = window.WindowIndex(['bar'], ewmh)
+    index.rebuild()
+
+    ewmh.clients[2] = (1, 'browser')
+    assert index.handle_event(property_event('_NET_WM_DESKTOP', 2))
+    assert index.count_on_current_ws() == 1
+
+    # Moving an ignored window doesn't change the count
+    ewmh.clients[4] = (1, 'bar')
+    assert index.handle_event(property_event('_NET_WM_DESKTOP', 4))
+    assert index.count_on_current_ws() == 1
+
+
+def test_window_index_ignores_unrelated_events(ewmh):
+    index = window.WindowIndex([], ewmh)
+    index.rebuild()
+
+    assert not index.handle_event(SimpleNamespace(type=X.MapNotify))
+    assert not index.handle_event(property_event('_NET_WM_DESKTOP', 42))
+
+
+def test_query_windows_sends_all_requests_before_replies(ewmh):
+    windows = ewmh.getClientList()
+
+    with mock.patch.object(FakePropertyRequest, 'reply',
+                           autospec=True) as mock_reply:
+        mock_reply.side_effect = \
+            lambda r: pytest.fail('Reply awaited before sending all') \
+            if ewmh.requests < 1 + 2 * len(windows) else None
+        window.query_windows(windows, ewmh)
+
+    assert mock_reply.call_count == 2 * len(windows)
+
+
+def test_query_windows_reads_workspace_and_class(ewmh):
+    infos = window.query_windows(ewmh.getClientList(), ewmh)
+    assert infos[0] == window.WindowInfo(0, ('term', 'term'))
+    assert infos[2] == window.WindowInfo(1, ('term', 'term'))
+
+
+def test_query_windows_marks_missing_workspace(ewmh):
+    ewmh.clients[1] = (None, 'term')
+    infos = window.query_windows(ewmh.getClientList(), ewmh)
+    assert infos[0].workspace == -1
+    assert infos[0].valid
+
+
+def test_query_windows_handles_bad_window(ewmh):
+    windows = ewmh.getClientList()
+    del ewmh.clients[2]  # Destroyed in the middle of the batch
+
+    infos = window.query_windows(windows, ewmh)
+    assert infos[1] == window.WindowInfo(-1, None, valid=False)
+    assert all(info.valid for info in infos[:1] + infos[2:])
+    assert window.count_on_current_ws([], ewmh) == 2